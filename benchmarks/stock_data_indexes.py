@@ -0,0 +1,137 @@
+"""
+Benchmarks the stock_data lookups used by EODCollector.set_data, EODCollector.delete_data and
+SequentialLoader.get_rows before and after EOD_Date_Model.migrate.
+
+Creates a scratch database next to the one in database_url, fills stock_data with synthetic daily rows
+through BulkWriter, and prints the query plan and mean latency of each lookup for the unindexed table,
+the indexed table and, if requested, a partitioned table. The scratch database is dropped afterwards.
+
+Usage
+-----
+
+python benchmarks/stock_data_indexes.py --tickers 500 --days 2000 --partition-by ticker
+"""
+from stock_pretraining.environment import get_env_variable
+from stock_pretraining.schemas.eod_model import EOD_Date_Model, stock_data_index
+from stock_pretraining.data_processing.eod_collectors.bulk_writer import BulkWriter
+
+from sqlalchemy import create_engine, text
+from sqlalchemy_utils import database_exists, drop_database
+
+import argparse
+import random
+import time
+import uuid
+
+import numpy as np
+import pandas as pd
+
+QUERIES = {
+    "set_data / delete_data range": (
+        "SELECT id FROM stock_data WHERE ticker = :ticker AND resample_freq = 'days' AND :start_date <= stock_datetime AND stock_datetime <= :end_date",
+        lambda tickers, dates: {"ticker": random.choice(tickers), **random_range(dates, 30)}
+    ),
+    "get_rows multi-ticker range": (
+        "SELECT stock_datetime FROM stock_data WHERE ticker IN :tickers AND resample_freq = 'days' AND :start_date <= stock_datetime AND stock_datetime <= :end_date",
+        lambda tickers, dates: {"tickers": tuple(random.sample(tickers, 10)), **random_range(dates, 250)}
+    ),
+}
+
+
+def random_range(dates, length):
+    start = random.randrange(len(dates) - length)
+    return {"start_date": dates[start], "end_date": dates[start + length]}
+
+
+def fill(engine, tickers, dates):
+    writer = BulkWriter(engine, flush_rows=1_000_000)
+
+    for ticker in tickers:
+        prices = np.cumsum(np.random.normal(size=len(dates))) + 100
+        writer.write(pd.DataFrame({
+            'id': [uuid.uuid4() for _ in range(len(dates))],
+            'ticker': ticker,
+            'resample_freq': "days",
+            'stock_datetime': dates,
+            'stock_adj_volume': np.random.randint(1e5, 1e7, size=len(dates)).astype(float),
+            'stock_adj_open': prices,
+            'stock_adj_close': prices,
+            'stock_adj_high': prices + 1,
+            'stock_adj_low': prices - 1,
+        }))
+
+    writer.flush()
+
+    with engine.begin() as connection:
+        connection.execute(text("ANALYZE stock_data"))
+
+
+def measure(engine, label, tickers, dates, repeats):
+    print(f"\n=== {label}")
+
+    with engine.connect() as connection:
+        for name, (query, make_params) in QUERIES.items():
+            params = make_params(tickers, dates)
+            plan = connection.execute(text(f"EXPLAIN (ANALYZE, COSTS OFF, TIMING OFF, SUMMARY OFF) {query}"), params).scalars().all()
+
+            latencies = []
+            for _ in range(repeats):
+                params = make_params(tickers, dates)
+                start = time.perf_counter()
+                connection.execute(text(query), params).all()
+                latencies.append(time.perf_counter() - start)
+
+            print(f"\n{name}: {1000 * np.mean(latencies):.2f} ms mean, {1000 * np.percentile(latencies, 95):.2f} ms p95")
+            print("\n".join(f"    {line}" for line in plan))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--database-url", default=get_env_variable("database_url"))
+    parser.add_argument("--tickers", type=int, default=500)
+    parser.add_argument("--days", type=int, default=2000)
+    parser.add_argument("--repeats", type=int, default=50)
+    parser.add_argument("--partition-by", choices=["ticker", "year"], default=None)
+    args = parser.parse_args()
+
+    url = create_engine(args.database_url).url.set(database="stock_pretraining_index_benchmark")
+    tickers = [f"T{i:05d}" for i in range(args.tickers)]
+    dates = pd.bdate_range("2000-01-03", periods=args.days).date.tolist()
+
+    if database_exists(url):
+        drop_database(url)
+
+    try:
+        model = EOD_Date_Model(url.render_as_string(hide_password=False))
+        model.create()
+
+        engine = create_engine(url)
+        with engine.begin() as connection:
+            connection.execute(text(f"DROP INDEX {stock_data_index.name}"))
+
+        print(f"Loading {len(tickers) * len(dates)} rows...")
+        fill(engine, tickers, dates)
+
+        measure(engine, "before: primary key only", tickers, dates, args.repeats)
+
+        model.migrate()
+        with engine.begin() as connection:
+            connection.execute(text("ANALYZE stock_data"))
+
+        measure(engine, f"after: {stock_data_index.name}", tickers, dates, args.repeats)
+
+        if args.partition_by is not None:
+            EOD_Date_Model(model.database_url, partition_by=args.partition_by).migrate()
+            with engine.begin() as connection:
+                connection.execute(text("ANALYZE stock_data"))
+
+            measure(engine, f"after: partitioned by resample_freq and {args.partition_by}", tickers, dates, args.repeats)
+
+        engine.dispose()
+
+    finally:
+        drop_database(url)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,309 @@
+"""
+Offline benchmark suite for domain math, ingest and loading.
+
+Runs without network access and stores the results as JSON, so runs on the same machine can be compared:
+
+    sparsity_mapping    SparsityMappingString parsing, add and subtract on domains of 10 to 10k intervals
+    planning            the DomainTable planning collect_data runs, over universes of 100 to 10k tickers
+    ingest              TiingoCollector.collect_data, which runs set_data for every gap, against an
+                        httpx.MockTransport stand-in for Tiingo and a scratch database, with pandas and
+                        streamed Arrow parsing
+    loading             SequentialLoader rows per second through load_rows and stream_rows, and windows per
+                        second through a PanelStore and WindowIndex
+
+The scratch database is a SQLite file unless --database-url is given, in which case a scratch database is
+created next to it and dropped afterwards. SQLite can not bind the uuid ids and date strings of
+TiingoCollector.parse_csv, so on SQLite only the streamed Arrow ingest runs.
+
+Every metric is a median over --repeats runs. Results are written to --output-dir as <timestamp>.json.
+With --compare, the run is printed next to a previous result file, or the latest one in --output-dir if
+--compare is given without a path.
+
+Usage
+-----
+
+python benchmarks/suite.py --compare
+python benchmarks/suite.py --only sparsity_mapping planning --intervals 10 100 1000 10000
+"""
+from stock_pretraining.data_processing import TiingoCollector, SequentialLoader, PanelStore, WindowIndex
+from stock_pretraining.data_processing.sparsity_mapping import SparsityMappingString
+from stock_pretraining.data_processing.domain_table import DomainTable
+from stock_pretraining.schemas.eod_model import EOD_Date_Model, Base, StockData
+
+from sqlalchemy import create_engine, text
+from sqlalchemy_utils import database_exists, drop_database
+
+from datetime import date, datetime, timedelta, timezone
+from pathlib import Path
+from urllib.parse import parse_qs
+
+import argparse
+import json
+import platform
+import subprocess
+import tempfile
+import time
+
+import httpx
+import numpy as np
+import pandas as pd
+
+RESULTS_DIR = Path(__file__).parent / "results"
+START_DATE, END_DATE = "2000-01-01", "2024-12-31"
+
+
+def median_seconds(function, repeats):
+    latencies = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        function()
+        latencies.append(time.perf_counter() - start)
+
+    return float(np.median(latencies))
+
+
+"""
+Random sorted, disjoint day ordinal intervals
+"""
+def random_intervals(rng, n, origin=date(2000, 1, 1).toordinal()):
+    bounds = origin + np.cumsum(rng.integers(1, 20, size=2 * n))
+    return bounds[0::2].tolist(), bounds[1::2].tolist()
+
+
+def bench_sparsity_mapping(args, rng):
+    results = {}
+    empty = SparsityMappingString("days")
+
+    for n in args.intervals:
+        a = empty.from_ordinals(*random_intervals(rng, n))
+        b = empty.from_ordinals(*random_intervals(rng, n))
+        string = a.string
+
+        results[f"parse_{n}_ms"] = 1000 * median_seconds(lambda: SparsityMappingString("days", string=string), args.repeats)
+        results[f"add_{n}_ms"] = 1000 * median_seconds(lambda: a + b, args.repeats)
+        results[f"sub_{n}_ms"] = 1000 * median_seconds(lambda: a - b, args.repeats)
+
+    return results
+
+
+def bench_planning(args, rng):
+    results = {}
+
+    for n in args.universe:
+        domains = {(f"T{i:05d}", "days"): SparsityMappingString("days").from_ordinals(*random_intervals(rng, args.domain_intervals)) for i in range(n)}
+
+        #the steps collect_data takes after loading the domains
+        plan = lambda: list(DomainTable.from_domains(domains).plan(START_DATE, END_DATE))
+
+        results[f"plan_{n}_tickers_ms"] = 1000 * median_seconds(plan, args.repeats)
+        results[f"plan_{n}_gaps"] = len(plan())
+
+    return results
+
+
+"""
+A Tiingo stand-in that answers every daily price request with synthetic business day rows
+"""
+def tiingo_handler(request):
+    query = {key: values[0] for key, values in parse_qs(request.url.query.decode()).items()}
+    dates = pd.bdate_range(query["startDate"], query["endDate"])
+    prices = 100 + np.arange(len(dates)) % 17
+
+    body = pd.DataFrame({
+        "date": dates.strftime("%Y-%m-%d"), "close": prices, "high": prices + 1, "low": prices - 1, "open": prices, "volume": 1e6,
+        "adjClose": prices, "adjHigh": prices + 1, "adjLow": prices - 1, "adjOpen": prices, "adjVolume": 1e6, "divCash": 0.0, "splitFactor": 1.0,
+    }).to_csv(index=False)
+
+    return httpx.Response(200, text=body, headers={"content-type": "text/csv"})
+
+
+def make_collector(database_url, **config):
+    collector = TiingoCollector({"api_key": "benchmark", "database_url": database_url, **config})
+    collector.client = httpx.Client(base_url="https://api.tiingo.com", transport=httpx.MockTransport(tiingo_handler))
+
+    return collector
+
+
+def bench_ingest(args, database_url, reset):
+    results = {}
+    tickers = [f"T{i:05d}" for i in range(args.ingest_tickers)]
+    start, end = datetime(2020, 1, 1), datetime(2020, 1, 1) + timedelta(days=args.days)
+    variants = {"pandas": {}, "arrow": {"stream_responses": True}}
+    if database_url.startswith("sqlite"):
+        del variants["pandas"]
+
+    for name, config in variants.items():
+        seconds = []
+        for _ in range(args.repeats):
+            reset()
+            collector = make_collector(database_url, flush_rows=args.flush_rows, **config)
+
+            started = time.perf_counter()
+            collector.collect_data(tickers, start, end, "days")
+            seconds.append(time.perf_counter() - started)
+
+            rows = collector.session.query(StockData).count()
+            collector.session.close()
+            collector.engine.dispose()
+
+        results[f"{name}_rows_per_second"] = rows / float(np.median(seconds))
+        results[f"{name}_tickers_per_second"] = len(tickers) / float(np.median(seconds))
+
+    return results
+
+
+def bench_loading(args, database_url, rng):
+    results = {}
+    tickers = [f"T{i:05d}" for i in range(args.ingest_tickers)]
+    start, end = "2020-01-01", (date(2020, 1, 1) + timedelta(days=args.days)).isoformat()
+    loader = SequentialLoader({"database_url": database_url})
+
+    rows = len(loader.load_rows(tickers, start, end))
+    results["load_rows_per_second"] = rows / median_seconds(lambda: loader.load_rows(tickers, start, end), args.repeats)
+    results["stream_rows_per_second"] = rows / median_seconds(lambda: sum(len(chunk) for chunk in loader.stream_rows(tickers, start, end)), args.repeats)
+
+    with tempfile.TemporaryDirectory() as directory:
+        store = PanelStore.build(Path(directory) / "panel", loader, tickers, start, end)
+        index = WindowIndex.from_store(store, length=args.window_length)
+        sample = rng.integers(0, len(index), size=args.windows)
+
+        def read_windows():
+            for i in sample:
+                ticker_id, offset = index[i]
+                np.array(store.values[ticker_id, offset:offset + index.span])
+
+        results["windows"] = len(index)
+        results["windows_per_second"] = len(sample) / median_seconds(read_windows, args.repeats)
+        del store
+
+    loader.session.close()
+    loader.engine.dispose()
+
+    return results
+
+
+"""
+Drops a scratch PostgreSQL database, closing the connections that engines created by EOD_Date_Model keep
+"""
+def drop_scratch_database(database_url):
+    if not database_exists(database_url):
+        return
+
+    engine = create_engine(database_url)
+    with engine.begin() as connection:
+        connection.execute(text("SELECT pg_terminate_backend(pid) FROM pg_stat_activity WHERE datname = current_database() AND pid <> pg_backend_pid()"))
+    engine.dispose()
+
+    drop_database(database_url)
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+"""
+Prints every metric of a run next to the same metric of a previous run
+"""
+def compare(results, previous_path):
+    with open(previous_path) as file:
+        previous = json.load(file)
+
+    print(f"\nCompared to {previous_path} (commit {previous['meta'].get('commit')})")
+    for benchmark, metrics in results.items():
+        for metric, value in metrics.items():
+            before = previous["results"].get(benchmark, {}).get(metric)
+            change = "" if not before else f"{100 * (value / before - 1):+.1f}%"
+            print(f"    {benchmark}.{metric}: {'-' if before is None else f'{before:.4g}'} -> {value:.4g} {change}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--only", nargs="+", choices=["sparsity_mapping", "planning", "ingest", "loading"], default=["sparsity_mapping", "planning", "ingest", "loading"])
+    parser.add_argument("--database-url", default=None, help="server to create a scratch database on. Defaults to a SQLite file.")
+    parser.add_argument("--intervals", nargs="+", type=int, default=[10, 100, 1000, 10000])
+    parser.add_argument("--universe", nargs="+", type=int, default=[100, 1000, 10000])
+    parser.add_argument("--domain-intervals", type=int, default=5)
+    parser.add_argument("--ingest-tickers", type=int, default=50)
+    parser.add_argument("--days", type=int, default=730)
+    parser.add_argument("--flush-rows", type=int, default=100_000)
+    parser.add_argument("--window-length", type=int, default=64)
+    parser.add_argument("--windows", type=int, default=10_000)
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output-dir", type=Path, default=RESULTS_DIR)
+    parser.add_argument("--compare", nargs="?", const="latest", default=None)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    previous = sorted(args.output_dir.glob("*.json"))
+    results = {}
+
+    with tempfile.TemporaryDirectory() as directory:
+        if args.database_url is None:
+            path = Path(directory) / "benchmark.db"
+            database_url = f"sqlite:///{path}"
+
+            def reset():
+                path.unlink(missing_ok=True)
+                engine = create_engine(database_url)
+                Base.metadata.create_all(engine)
+                engine.dispose()
+
+        else:
+            database_url = create_engine(args.database_url).url.set(database="stock_pretraining_suite_benchmark").render_as_string(hide_password=False)
+
+            def reset():
+                drop_scratch_database(database_url)
+                EOD_Date_Model(database_url).create()
+
+        try:
+            if "sparsity_mapping" in args.only:
+                results["sparsity_mapping"] = bench_sparsity_mapping(args, rng)
+            if "planning" in args.only:
+                results["planning"] = bench_planning(args, rng)
+            if "ingest" in args.only or "loading" in args.only:
+                ingest = bench_ingest(args, database_url, reset)
+                if "ingest" in args.only:
+                    results["ingest"] = ingest
+            if "loading" in args.only:
+                results["loading"] = bench_loading(args, database_url, rng)
+
+        finally:
+            if args.database_url is not None:
+                drop_scratch_database(database_url)
+
+    run = {
+        "meta": {
+            "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "commit": git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "database": "sqlite" if args.database_url is None else create_engine(args.database_url).dialect.name,
+            "args": {key: str(value) if isinstance(value, Path) else value for key, value in vars(args).items()},
+        },
+        "results": results,
+    }
+
+    args.output_dir.mkdir(parents=True, exist_ok=True)
+    output = args.output_dir / f"{run['meta']['timestamp'].replace(':', '-')}.json"
+    with open(output, "w") as file:
+        json.dump(run, file, indent=2)
+
+    for benchmark, metrics in results.items():
+        print(f"\n=== {benchmark}")
+        for metric, value in metrics.items():
+            print(f"    {metric}: {value:.4g}")
+
+    print(f"\nSaved to {output}")
+
+    if args.compare == "latest" and not previous:
+        print("\nNo earlier results to compare to")
+    elif args.compare is not None:
+        compare(results, previous[-1] if args.compare == "latest" else Path(args.compare))
+
+
+if __name__ == "__main__":
+    main()
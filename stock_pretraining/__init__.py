@@ -0,0 +1 @@
+from .data_processing.sparsity_mapping import SparsityMappingString
\ No newline at end of file
@@ -1,4 +1,6 @@
 from .eod_collectors import *
 from .sequential_loaders import *
 
-from .sparsity_mapping import SparsityMappingString
\ No newline at end of file
+from .sparsity_mapping import SparsityMappingString
+from .domain_table import DomainTable
+from .trading_calendar import TradingCalendar
@@ -0,0 +1,340 @@
+from stock_pretraining.data_processing.sparsity_mapping import SparsityMappingString
+from stock_pretraining.data_processing.utils import step_ordinals
+
+from datetime import date, datetime
+
+import numpy as np
+
+#keyed ordinals are row * ROW_STRIDE + ordinal, so every row occupies its own disjoint range
+ROW_STRIDE = 1 << 23
+
+class DomainTable():
+    """
+    The domains of many (ticker, resample_freq) keys held in flat NumPy arrays.
+
+    Interval i belongs to keys[rows[i]] and covers the closed day ordinal interval [starts[i], ends[i]].
+    Intervals are sorted by row, then start, and the intervals of a row are disjoint, matching the
+    layout of SparsityMappingString.starts and SparsityMappingString.ends.
+
+    Union, difference and gaps are computed for every key in a single vectorized pass.
+
+    If a TradingCalendar is given, daily keys step by trading days, as in SparsityMappingString, and
+    request windows are narrowed to the trading days they contain.
+    """
+    def __init__(self, keys=None, rows=None, starts=None, ends=None, calendar=None):
+        self.calendar = calendar
+        self.keys = list(keys) if keys is not None else []
+        self.index = {key: row for row, key in enumerate(self.keys)}
+
+        self.rows = np.asarray(rows if rows is not None else [], dtype=np.int64)
+        self.starts = np.asarray(starts if starts is not None else [], dtype=np.int64)
+        self.ends = np.asarray(ends if ends is not None else [], dtype=np.int64)
+
+    """
+    Builds a DomainTable from sparsity mapping strings
+
+    Parameters
+    ----------
+
+    domains: dict((ticker, resample_freq) -> SparsityMappingString | string)
+        The domain of each key. Strings are parsed as sparsity mapping strings.
+
+    calendar: TradingCalendar | None
+        Trading calendar of daily keys
+
+    Returns
+    -------
+
+    table: DomainTable
+    """
+    @classmethod
+    def from_domains(cls, domains, calendar=None):
+        keys, rows, starts, ends = [], [], [], []
+
+        for row, (key, domain) in enumerate(domains.items()):
+            if not isinstance(domain, SparsityMappingString):
+                domain = SparsityMappingString(resample_freq=key[1], string=domain)
+
+            keys.append(key)
+            rows.append(np.full(len(domain.starts), row, dtype=np.int64))
+            starts.append(domain.starts)
+            ends.append(domain.ends)
+
+        if not keys:
+            return cls(calendar=calendar)
+
+        return cls(keys, np.concatenate(rows), np.concatenate(starts), np.concatenate(ends), calendar=calendar)
+
+    """
+    Builds a DomainTable that holds the same closed interval for every key
+
+    Parameters
+    ----------
+
+    keys: [](ticker, resample_freq)
+        The keys of the table
+
+    start_date: datetime.date | string
+        The start of the interval. Strings are read in YYYY-MM-DD format.
+
+    end_date: datetime.date | string
+        The end of the interval. Strings are read in YYYY-MM-DD format.
+
+    calendar: TradingCalendar | None
+        Trading calendar of daily keys. Their interval is narrowed to the trading days it contains.
+
+    Returns
+    -------
+
+    table: DomainTable
+    """
+    @classmethod
+    def window(cls, keys, start_date, end_date, calendar=None):
+        keys = list(keys)
+        starts, ends = np.full(len(keys), to_ordinal(start_date), dtype=np.int64), np.full(len(keys), to_ordinal(end_date), dtype=np.int64)
+
+        if calendar is not None:
+            daily = np.array([key[1] == "days" for key in keys], dtype=bool)
+            starts[daily], ends[daily] = calendar.ceil(starts[daily]), calendar.floor(ends[daily])
+
+        keep = starts <= ends
+        return cls(keys, np.flatnonzero(keep), starts[keep], ends[keep], calendar=calendar)
+
+    def __len__(self):
+        return len(self.keys)
+
+    def __contains__(self, key):
+        return key in self.index
+
+    def __add__(self, other):
+        return self.union(other)
+
+    def __sub__(self, other):
+        return self.difference(other)
+
+    """
+    Returns the domain of a key as a SparsityMappingString. Missing keys have an empty domain.
+    """
+    def get(self, key, **kwargs):
+        domain = SparsityMappingString(resample_freq=key[1], calendar=self.calendar, **kwargs)
+
+        if key not in self.index:
+            return domain
+
+        lo, hi = np.searchsorted(self.rows, [self.index[key], self.index[key] + 1])
+        return domain.from_ordinals(self.starts[lo:hi].tolist(), self.ends[lo:hi].tolist())
+
+    def domains(self):
+        return {key: self.get(key) for key in self.keys}
+
+    """
+    Returns a copy of the table with the domains of the given keys replaced.
+
+    Parameters
+    ----------
+
+    domains: dict((ticker, resample_freq) -> SparsityMappingString | string)
+        The new domain of each key. Keys not in the table are appended.
+    """
+    def update(self, domains):
+        replaced = DomainTable.from_domains(domains, calendar=self.calendar)
+        keep = ~np.isin(self.rows, [self.index[key] for key in replaced.keys if key in self.index])
+
+        kept = DomainTable(self.keys, self.rows[keep], self.starts[keep], self.ends[keep], calendar=self.calendar)
+        return kept.union(replaced)
+
+    """
+    Restricts the table to the given keys, in the given order. Missing keys have an empty domain.
+    """
+    def select(self, keys):
+        keys = list(keys)
+        index = {key: row for row, key in enumerate(keys)}
+        remap = np.array([index.get(key, -1) for key in self.keys], dtype=np.int64)
+
+        rows = remap[self.rows] if len(self.rows) else self.rows
+        keep = rows >= 0
+        order = np.lexsort((self.starts[keep], rows[keep]))
+
+        return DomainTable(keys, rows[keep][order], self.starts[keep][order], self.ends[keep][order], calendar=self.calendar)
+
+    """
+    Calculates the union of two tables, key by key
+
+    Parameters
+    ----------
+
+    other: DomainTable
+        The table to be added
+
+    Returns
+    -------
+
+    union: DomainTable
+        The union of the two tables over the keys of both. Intervals less than one resample_freq
+        apart are merged, as in SparsityMappingString.__add__.
+    """
+    def union(self, other):
+        keys, rows_1, rows_2 = self._align(other)
+
+        rows = np.concatenate([rows_1, rows_2])
+        starts = np.concatenate([self.starts, other.starts])
+        ends = np.concatenate([self.ends, other.ends])
+
+        if len(rows) == 0:
+            return DomainTable(keys, calendar=self.calendar)
+
+        order = np.lexsort((starts, rows))
+        rows, starts, ends = rows[order], starts[order], ends[order]
+
+        #running maximum of ends within each row, shifted so rows can not leak into each other
+        reach = np.maximum.accumulate(rows * ROW_STRIDE + ends) - rows * ROW_STRIDE
+
+        new_run = np.ones(len(rows), dtype=bool)
+        new_run[1:] = (rows[1:] != rows[:-1]) | (reach[:-1] < self._step(starts[1:], rows[1:], keys, -1))
+
+        run_starts = np.flatnonzero(new_run)
+        return DomainTable(keys, rows[run_starts], starts[run_starts], np.maximum.reduceat(ends, run_starts), calendar=self.calendar)
+
+    """
+    Calculates the relative complement of two tables, key by key
+
+    Parameters
+    ----------
+
+    other: DomainTable
+        The table to be subtracted
+
+    Returns
+    -------
+
+    difference: DomainTable
+        The difference between the two tables over the keys of both, closed by stepping one
+        resample_freq away from the subtracted bounds, as in SparsityMappingString.__sub__.
+    """
+    def difference(self, other):
+        keys, rows_1, rows_2 = self._align(other)
+        gap_rows, gap_prev_ends, gap_next_starts = self._open_gaps(len(keys), rows_2, other.starts, other.ends)
+
+        #every interval of self meets the open gaps of other in [lo, hi)
+        lo = np.searchsorted(gap_rows * ROW_STRIDE + gap_next_starts, rows_1 * ROW_STRIDE + self.starts, side="right")
+        hi = np.searchsorted(gap_rows * ROW_STRIDE + gap_prev_ends, rows_1 * ROW_STRIDE + self.ends, side="left")
+        counts = np.maximum(hi - lo, 0)
+
+        source = np.repeat(np.arange(len(rows_1)), counts)
+        target = np.repeat(lo - np.cumsum(counts) + counts, counts) + np.arange(counts.sum())
+
+        rows, starts, ends = rows_1[source], self.starts[source], self.ends[source]
+        prev_ends, next_starts = gap_prev_ends[target], gap_next_starts[target]
+
+        #bounds of other that fall inside an interval are closed by stepping one resample_freq away
+        starts = np.where(prev_ends < starts, starts, self._step(np.maximum(prev_ends, 1), rows, keys, 1))
+        ends = np.where(next_starts > ends, ends, self._step(np.minimum(next_starts, ROW_STRIDE - 2), rows, keys, -1))
+
+        keep = starts <= ends
+        return DomainTable(keys, rows[keep], starts[keep], ends[keep], calendar=self.calendar)
+
+    """
+    Finds the intervals of a request window that are not covered by the table
+
+    Parameters
+    ----------
+
+    start_date: datetime.date | string
+        The start of the request window
+
+    end_date: datetime.date | string
+        The end of the request window
+
+    keys: [](ticker, resample_freq)
+        The keys to check. Defaults to every key in the table. Missing keys are not covered at all.
+
+    Returns
+    -------
+
+    gaps: DomainTable
+        The uncovered intervals of each key
+    """
+    def gaps(self, start_date, end_date, keys=None):
+        return DomainTable.window(self.keys if keys is None else keys, start_date, end_date, calendar=self.calendar) - self
+
+    """
+    Plans the fetches needed to cover a request window
+
+    Parameters
+    ----------
+
+    start_date: datetime.date | string
+        The start of the request window
+
+    end_date: datetime.date | string
+        The end of the request window
+
+    keys: [](ticker, resample_freq)
+        The keys to plan for. Defaults to every key in the table.
+
+    Returns
+    -------
+
+    plan: [](ticker, datetime.datetime, datetime.datetime)
+        One (ticker, start, end) fetch per uncovered interval, ordered by key and start
+    """
+    def plan(self, start_date, end_date, keys=None):
+        return self.gaps(start_date, end_date, keys).intervals()
+
+    """
+    Lists every interval of the table as (ticker, start, end) with datetime bounds
+    """
+    def intervals(self):
+        tickers = [key[0] for key in self.keys]
+        return [(tickers[row], datetime.fromordinal(start), datetime.fromordinal(end)) for row, start, end in zip(self.rows.tolist(), self.starts.tolist(), self.ends.tolist())]
+
+    def _align(self, other):
+        if self.keys == other.keys:
+            return self.keys, self.rows, other.rows
+
+        keys = self.keys + [key for key in other.keys if key not in self.index]
+        index = {key: row for row, key in enumerate(keys)}
+        remap = np.array([index[key] for key in other.keys], dtype=np.int64)
+
+        return keys, self.rows, remap[other.rows] if len(other.rows) else other.rows
+
+    def _step(self, ordinals, rows, keys, steps):
+        units = np.array([key[1] for key in keys], dtype=object)[rows] if len(keys) else np.array([], dtype=object)
+        stepped = np.empty_like(ordinals)
+
+        for unit in set(units.tolist()):
+            mask = units == unit
+            stepped[mask] = step_ordinals(ordinals[mask], self.calendar if unit == "days" and self.calendar is not None else unit, steps)
+
+        return stepped
+
+    """
+    The open gaps (prev_end, next_start) around the intervals of each row, sorted by row then position.
+    A row with k intervals has k + 1 gaps, and a row without intervals has a single unbounded gap.
+    Unbounded sides are marked with 0 and ROW_STRIDE - 1, which lie outside every valid day ordinal.
+    """
+    def _open_gaps(self, n_keys, rows, starts, ends):
+        counts = np.bincount(rows, minlength=n_keys) if len(rows) else np.zeros(n_keys, dtype=np.int64)
+
+        first = np.ones(len(rows), dtype=bool)
+        first[1:] = rows[1:] != rows[:-1]
+        last = np.ones(len(rows), dtype=bool)
+        last[:-1] = rows[:-1] != rows[1:]
+
+        previous_ends = np.where(first, 0, np.roll(ends, 1)) if len(rows) else ends
+        empty_rows = np.flatnonzero(counts == 0)
+        after_rows = rows[last]
+
+        gap_rows = np.concatenate([rows, after_rows, empty_rows])
+        gap_prev_ends = np.concatenate([previous_ends, ends[last], np.zeros(len(empty_rows), dtype=np.int64)])
+        gap_next_starts = np.concatenate([starts, np.full(len(after_rows) + len(empty_rows), ROW_STRIDE - 1, dtype=np.int64)])
+
+        order = np.lexsort((gap_prev_ends, gap_rows))
+        return gap_rows[order], gap_prev_ends[order], gap_next_starts[order]
+
+
+def to_ordinal(value):
+    if isinstance(value, str):
+        return date.fromisoformat(value).toordinal()
+
+    return value.toordinal()
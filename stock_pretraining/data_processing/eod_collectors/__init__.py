@@ -1,2 +1,5 @@
 from .abstract_eod_collector import EODCollector
-from .eod_collectors import TiingoCollector
\ No newline at end of file
+from .eod_collectors import TiingoCollector
+from .response_cache import ResponseCache
+from .refresher import Refresher
+from .instrumentation import Metrics, MetricsExporter
@@ -2,14 +2,22 @@ from stock_pretraining.environment import get_env_variable
 
 import pandas as pd
 
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, any_, bindparam, delete, text, String
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.dialects.postgresql import ARRAY
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy.exc import IntegrityError
 
-from stock_pretraining.schemas.eod_model import EOD_Date_Model
+from stock_pretraining.schemas.eod_model import EOD_Date_Model, DOMAIN_RANGES_COLUMN, sparsity_mapping_sql, to_multirange, partition_dates
 from stock_pretraining.data_processing.sparsity_mapping import SparsityMappingString
-
-import uuid
+from stock_pretraining.data_processing.domain_table import DomainTable
+from stock_pretraining.data_processing.trading_calendar import get_calendar
+from stock_pretraining.data_processing.eod_collectors.bulk_writer import BulkWriter, FRAME_TYPES
+from stock_pretraining.data_processing.eod_collectors.resampler import DERIVED_FREQS, covering_periods, resample_bars, within_periods
+from stock_pretraining.data_processing.eod_collectors.instrumentation import instrumented, metrics_from_config, timed
+
+from datetime import date
+from contextlib import contextmanager
 import uuid
 from abc import abstractmethod, ABC
 
@@ -19,9 +27,34 @@ class EODCollector(ABC):
         self.resample_options = EOD_Date_Model.resample_options
 
         self.engine = create_engine(self.database_url)
-        Session = sessionmaker(bind=self.engine)
+        Session = sessionmaker(bind=self.engine, expire_on_commit=False)
         self.session = Session()
 
+        #set trading_calendar in set_config, for example to "NYSE", to count non-trading days as covered in daily domains
+        self.calendar = get_calendar(getattr(self, "trading_calendar", None))
+
+        #(ticker, resample_freq) -> SparsityMappingString, kept in sync with every domain write
+        self.domains = {}
+        #(ticker, resample_freq) -> StockDomains row, or None if no row is stored
+        self.domain_records = {}
+
+        #set metrics or metrics_path in set_config to time the stages of collection. See Metrics.
+        self.metrics = metrics_from_config(getattr(self, "metrics", None), getattr(self, "metrics_path", None), getattr(self, "metrics_format", "prometheus"), getattr(self, "metrics_interval", None))
+
+        #set flush_rows in set_config to accumulate rows from many gaps into one write, and write_mode to
+        #"upsert" to replace overlapping rows on the natural key instead of deleting them first
+        self.data_writer = BulkWriter(self.engine, table="stock_data", flush_rows=getattr(self, "flush_rows", None), mode=getattr(self, "write_mode", "append"), metrics=self.metrics)
+
+        #set domain_ranges in set_config to update the date_ranges column of stock_domains with atomic UPDATE statements
+        self.domain_ranges = getattr(self, "domain_ranges", False)
+        assert not self.domain_ranges or self.engine.dialect.name == "postgresql", "domain_ranges requires PostgreSQL 14 or later"
+
+        #(ticker, resample_freq) -> SparsityMappingString of the domains whose rows are buffered in a batch, None outside of batch
+        self.pending_domains = None
+
+        #resample_freq -> leaf partitions of stock_data, loaded on the first delete. See get_partition_leaves.
+        self.partition_leaves = None
+
     @abstractmethod
     def str_to_date(*args):
         pass
@@ -102,7 +135,8 @@ class EODCollector(ABC):
 
     overwrite_existing: bool
         Weather to overwrite existing data. Must be set to True if writing to an existing domain.
-        Otherwise, use collect_data.
+        Otherwise, use collect_data. If data_writer upserts, overlapping rows are replaced in the same
+        statement that writes the new rows and nothing is deleted.
 
     resample_freq: resample_options.member
         The interval between data collection instances
@@ -119,64 +153,189 @@ class EODCollector(ABC):
     None
 
     """
+    @instrumented("set_data")
     def set_data(self, ticker, start_date, end_date, resample_freq, overwrite_existing=False, debug=True, **kwargs):
         start_date = self.date_to_str(start_date)
         end_date = self.date_to_str(end_date)
-        interval_domain = SparsityMappingString(resample_freq=resample_freq, string=f"/{start_date}|{end_date}")
+        interval_domain = SparsityMappingString(resample_freq=resample_freq, string=f"/{start_date}|{end_date}", calendar=self.calendar)
 
-        #get existing data
-        existing_rows = self.session.query(EOD_Date_Model.StockData).filter(EOD_Date_Model.StockData.ticker == ticker, EOD_Date_Model.StockData.resample_freq == resample_freq, start_date <= EOD_Date_Model.StockData.stock_datetime, EOD_Date_Model.StockData.stock_datetime <= end_date)
-        existing_domain = self.session.query(EOD_Date_Model.StockDomains).filter(EOD_Date_Model.StockDomains.ticker == ticker, EOD_Date_Model.StockDomains.resample_freq == resample_freq).first()
-        new_domain = SparsityMappingString(resample_freq=resample_freq, string=existing_domain.sparsity_mapping if existing_domain else None)
+        upsert = self.data_writer.mode == "upsert"
+
+        #buffered rows of this ticker only join its domain once they are written, unless they are buffered in a batch
+        if not upsert and self.pending_domains is None and self.data_writer.has_pending((ticker, resample_freq)):
+            self.data_writer.flush()
+
+        #rows are only stored under a domain, so the cached domain tells us whether any exist
+        with timed(self.metrics, "domain"):
+            existing_domain = self.get_domain(ticker, resample_freq)
+            overlaps_existing = existing_domain.intersects(interval_domain)
 
         #check that either there is not an existing domain or overwrite is confirmed
-        assert len(existing_rows.all()) == 0 or overwrite_existing, f"{len(existing_rows)} existing datapoints found between start_date {start_date} and end_date {end_date}. If you wish to overwrite these rows, set overwrite_existing=True. Otherwise, use EODCollector.collect_data()"
+        assert not overlaps_existing or overwrite_existing, f"Existing datapoints found between start_date {start_date} and end_date {end_date}. If you wish to overwrite these rows, set overwrite_existing=True. Otherwise, use EODCollector.collect_data()"
 
-        #if overwriting, delete the data
-        if overwrite_existing:
+        #if overwriting, delete the data unless the write replaces it
+        if overlaps_existing and not upsert:
             self.delete_data([ticker], start_date, end_date, resample_freq)
-            new_domain -= interval_domain
+        elif overlaps_existing and resample_freq == "days":
+            self.invalidate_derived([ticker], start_date, end_date)
 
         #retrieve values, abstract function
         try:
             conditional_df = self.retrieve_data(ticker, start_date=start_date, end_date=end_date, resample_freq=resample_freq, **kwargs)
 
-            if isinstance(conditional_df, pd.DataFrame):
-                try:
-                    conditional_df.to_sql("stock_data", self.engine, if_exists='append', index=False)
-                except IntegrityError:
-                        raise IntegrityError("Error: Improperly formatted dataframe recieved from retrieved_data. See details:")
+            if isinstance(conditional_df, FRAME_TYPES):
+                self.write_data(ticker, start_date, end_date, resample_freq, conditional_df)
 
-                if existing_domain is not None:
-                    existing_domain += interval_domain
-                    existing_domain.sparsity_mapping = new_domain.string
-                    self.session.commit()
-                
-                else:
-                    new_domain = interval_domain
-                    domain = pd.DataFrame({
-                        'ticker': ticker,
-                        'resample_freq': resample_freq,
-                        'sparsity_mapping': new_domain.string
-                    }, index=[0])
-
-                    domain['id'] = [uuid.uuid4() for _ in range(len(domain))]
-                    domain.to_sql("stock_domains", self.engine, if_exists='append', index=False)
-                
-            
             else:
                 raise Exception(conditional_df)
 
 
         except Exception as e:
-            if existing_domain is not None:
-                existing_domain.sparsity_mapping = existing_domain.string
-                self.session.commit()
-
             raise Exception(f"Exception in retrieve_data: {e}")    
 
 
 
+    """
+    Writes retrieved rows to the database and adds their interval to the ticker's domain.
+
+    Parameters
+    ----------
+
+    ticker: string
+        Ticker to set
+
+    start_date: string
+        The start of the retrieved interval in the format YYYY-MM-DD
+
+    end_date: string
+        The end of the retrieved interval in the format YYYY-MM-DD
+
+    resample_freq: resample_options.member
+        The interval between data collection instances
+
+    conditional_df: pd.DataFrame | pyarrow.Table
+        Rows returned by retrieve_data
+
+    Notes
+    -----
+    Unless data_writer upserts, the interval must not overlap the existing domain. Use set_data with
+    overwrite_existing=True to replace data.
+
+    Rows go through data_writer, which uses COPY on PostgreSQL. If data_writer accumulates rows, the domain is
+    only updated once they are flushed. Call flush_data to force that. Inside of batch, the domain cache is
+    updated at once and the stored domain is written in the transaction of the flush.
+
+    """
+    def write_data(self, ticker, start_date, end_date, resample_freq, conditional_df):
+        if self.pending_domains is not None:
+            with timed(self.metrics, "domain"):
+                interval_domain = SparsityMappingString(resample_freq=resample_freq, string=f"/{start_date}|{end_date}", calendar=self.calendar)
+                domain = self.get_domain(ticker, resample_freq) + interval_domain
+
+            self.domains[(ticker, resample_freq)] = domain
+            self.pending_domains[(ticker, resample_freq)] = domain
+            add_interval = None
+
+        elif self.domain_ranges:
+            add_interval = lambda: self.add_domain_range(ticker, resample_freq, start_date, end_date)
+        else:
+            interval_domain = SparsityMappingString(resample_freq=resample_freq, string=f"/{start_date}|{end_date}", calendar=self.calendar)
+            add_interval = lambda: self.write_domain(ticker, resample_freq, self.get_domain(ticker, resample_freq) + interval_domain)
+
+        try:
+            self.data_writer.write(conditional_df, key=(ticker, resample_freq), on_flush=add_interval)
+        except IntegrityError as e:
+                raise Exception(f"Error: Improperly formatted dataframe recieved from retrieved_data. See details: {e}")
+
+    """
+    Writes any rows buffered by data_writer and adds their intervals to the domains.
+    """
+    def flush_data(self):
+        self.data_writer.flush()
+
+    """
+    Buffers the rows and domain changes of every write_data call in the block, across tickers, and writes them in
+    one transaction whenever flush_rows rows are buffered or the oldest buffered rows are flush_seconds old, and
+    when the block exits. StockData and StockDomains are committed together, so a failed flush leaves neither
+    changed and its domains are dropped from the cache.
+
+    Parameters
+    ----------
+
+    flush_rows: int | None
+        Buffered rows that trigger a flush
+
+    flush_seconds: float | None
+        Age of the oldest buffered rows that triggers a flush
+
+    Yields
+    ------
+
+    collector: EODCollector
+
+    Examples
+    --------
+
+    >>> with collector.batch(flush_rows=500_000, flush_seconds=30):
+    ...     collector.collect_data(tickers, "2000-01-01", "2024-01-01", "days")
+    """
+    @contextmanager
+    def batch(self, flush_rows=100_000, flush_seconds=None):
+        assert self.pending_domains is None, "batch can not be nested"
+
+        writer = self.data_writer
+        writer.flush()
+
+        previous = writer.flush_rows, writer.flush_seconds
+        writer.flush_rows, writer.flush_seconds = flush_rows, flush_seconds
+        writer.before_commit, writer.after_commit, writer.on_rollback = self.write_pending_domains, self.commit_pending_domains, self.discard_pending_domains
+        self.pending_domains = {}
+
+        try:
+            yield self
+        finally:
+            try:
+                writer.flush()
+            finally:
+                writer.flush_rows, writer.flush_seconds = previous
+                writer.before_commit = writer.after_commit = writer.on_rollback = None
+                self.pending_domains = None
+
+    """
+    Upserts the pending domains of a batch on the connection of a data_writer flush
+    """
+    def write_pending_domains(self, connection):
+        if self.pending_domains:
+            self.upsert_domains(self.pending_domains, connection)
+
+    """
+    Upserts non-empty domains on a connection, in its transaction. The domain cache is not updated, see sync_domains.
+    """
+    @instrumented("domain")
+    def upsert_domains(self, domains, connection):
+        table = EOD_Date_Model.StockDomains.__table__
+        insert = {"postgresql": postgresql.insert, "sqlite": sqlite.insert}[self.engine.dialect.name](table)
+        statement = insert.on_conflict_do_update(index_elements=["ticker", "resample_freq"], set_={"sparsity_mapping": insert.excluded.sparsity_mapping})
+
+        rows = [{"id": uuid.uuid4(), "ticker": ticker, "resample_freq": resample_freq, "sparsity_mapping": domain.string} for (ticker, resample_freq), domain in domains.items()]
+        connection.execute(statement, rows)
+
+        if self.domain_ranges:
+            ranges = [{"ticker": row["ticker"], "resample_freq": row["resample_freq"], "ranges": to_multirange(row["sparsity_mapping"], row["resample_freq"])} for row in rows]
+            connection.execute(text(f"UPDATE stock_domains SET {DOMAIN_RANGES_COLUMN} = CAST(:ranges AS datemultirange) WHERE ticker = :ticker AND resample_freq = :resample_freq"), ranges)
+
+    def commit_pending_domains(self):
+        self.sync_domains({key: domain.string for key, domain in self.pending_domains.items()})
+        self.pending_domains.clear()
+
+    def discard_pending_domains(self):
+        for key in self.pending_domains:
+            self.domains.pop(key, None)
+            self.domain_records.pop(key, None)
+
+        self.pending_domains.clear()
+
+
     """
     Collects indicators for tickers between a specified timerange, avoiding redundency created by previous calls. 
     Writes data to database. Will not affect data under existing domain.
@@ -205,30 +364,160 @@ class EODCollector(ABC):
     
     None
 
+    Notes
+    -----
+    If derive_resampled is set in set_config, months and years rows are built from daily rows with
+    derive_data instead of being retrieved.
+
     """
+    @instrumented("collect_data")
     def collect_data(self, tickers, start_date, end_date, resample_freq, debug=True, **kwargs):
-        collection_interval = SparsityMappingString(resample_freq=resample_freq, string=f"/{start_date}|{end_date}")
-
-        for ticker in tickers:
-            #get existing domain
-            existing_domain = self.session.query(EOD_Date_Model.StockDomains).filter(EOD_Date_Model.StockDomains.ticker == ticker, EOD_Date_Model.StockDomains.resample_freq == resample_freq).first()         
-            existing_domain = SparsityMappingString(resample_freq=resample_freq, string=existing_domain.sparsity_mapping if existing_domain else None)
-            
-            #find the domain that needs to be updated
-            total_domain = existing_domain + collection_interval                 
-            dates_to_update = total_domain - existing_domain
-
-            # print("total_domain", total_domain, existing_domain)
-            # print("dates_to_update", dates_to_update)
-
-            #call set_data2, setting the data and presumably updating the domains appropriately
-            for start, end in dates_to_update.get_intervals():
+        if self.derives(resample_freq):
+            return self.derive_data(tickers, start_date, end_date, resample_freq, debug=debug, **kwargs)
+
+        #find the domains that need to be updated for every ticker at once
+        with timed(self.metrics, "domain"):
+            existing_domains = self.load_domains(tickers, resample_freq)
+            domain_table = DomainTable.from_domains({(ticker, resample_freq): domain for ticker, domain in existing_domains.items()}, calendar=self.calendar)
+            plan = domain_table.plan(start_date, end_date)
+
+        #call set_data, setting the data and updating the domains appropriately
+        try:
+            for ticker, start, end in plan:
                 self.set_data(ticker, start_date=start, end_date=end, resample_freq=resample_freq, overwrite_existing=True, debug=debug, **kwargs)
 
-    
+        finally:
+            #inside of batch, the rows stay buffered until a threshold is crossed or the batch exits
+            if self.pending_domains is None:
+                self.flush_data()
+
+
+    def derives(self, resample_freq):
+        return getattr(self, "derive_resampled", False) and resample_freq in DERIVED_FREQS
+
+    """
+    Builds months or years rows from stored daily rows instead of retrieving them. Only the periods that
+    touch a gap in the domain of resample_freq are built, and missing daily rows of those periods are
+    collected first.
+
+    Parameters
+    ----------
+
+    tickers: []String
+        A list of tickers to collect
+
+    start_date: string
+        The date to begin data collection in the format YYYY-MM-DD
+
+    end_date: string
+        The date to end data collection in the format YYYY-MM-DD
+
+    resample_freq: Enum("months", "years")
+        The resample frequency to build
+
+    debug: Boolean
+        Log response errors while collecting daily rows
+
+    Returns
+    -------
+
+    None
+
+    Notes
+    -----
+    The period containing the current day is only covered up to the current day, so it is rebuilt once
+    later days are collected.
+
+    """
+    def derive_data(self, tickers, start_date, end_date, resample_freq, debug=True, **kwargs):
+        periods = self.plan_derived(tickers, start_date, end_date, resample_freq)
+
+        #tickers missing the same periods share one daily collection
+        for (start, end), group in periods.groupby(["start_date", "end_date"], sort=False):
+            self.collect_data(group["ticker"].tolist(), start, end, "days", debug=debug, **kwargs)
+
+        self.write_derived(periods, resample_freq)
+
+    """
+    Lists the periods of resample_freq that touch a gap between start_date and end_date
+
+    Returns
+    -------
+
+    periods: pd.DataFrame
+        ticker, start_date, end_date columns. See covering_periods.
+    """
+    def plan_derived(self, tickers, start_date, end_date, resample_freq):
+        existing_domains = self.load_domains(tickers, resample_freq)
+        domain_table = DomainTable.from_domains({(ticker, resample_freq): domain for ticker, domain in existing_domains.items()}, calendar=self.calendar)
+
+        return covering_periods(domain_table.plan(start_date, end_date), resample_freq, last_date=date.today())
+
+    """
+    Replaces the rows of periods with bars aggregated from the stored daily rows and adds the periods to
+    the domains of resample_freq, in one transaction
+
+    Parameters
+    ----------
+
+    periods: pd.DataFrame
+        ticker, start_date, end_date columns, as returned by plan_derived
+
+    resample_freq: Enum("months", "years")
+    """
+    def write_derived(self, periods, resample_freq):
+        if periods.empty:
+            return
+
+        self.flush_data()
+
+        StockData = EOD_Date_Model.StockData
+        columns = ["ticker", "stock_datetime", *(column for column in StockData.__table__.columns.keys() if column.startswith("stock_adj_"))]
+        daily_rows = pd.DataFrame(self.session.query(*(getattr(StockData, column) for column in columns)).filter(
+            self.in_tickers(periods["ticker"].unique().tolist()), StockData.resample_freq == "days", periods["start_date"].min() <= StockData.stock_datetime, StockData.stock_datetime <= periods["end_date"].max()
+        ).all(), columns=columns)
+
+        bars = resample_bars(within_periods(daily_rows, periods), resample_freq)
+        bars.insert(0, "id", [uuid.uuid4() for _ in range(len(bars))])
+
+        self.load_domains(periods["ticker"].tolist(), resample_freq)
+
+        domains = {}
+        for ticker, group in periods.groupby("ticker", sort=False):
+            domain = self.get_domain(ticker, resample_freq)
+            for start, end in zip(group["start_date"], group["end_date"]):
+                domain = domain + SparsityMappingString(resample_freq=resample_freq, string=f"/{start}|{end}", calendar=self.calendar)
+
+            domains[(ticker, resample_freq)] = domain
+
+        #the bar of a partly covered period may be dated before the bar replacing it, so stored bars are deleted.
+        #The delete, the new bars and their domains are committed together, so a failed write loses no period.
+        with self.engine.connect() as connection, connection.begin() as transaction:
+            with timed(self.metrics, "write"):
+                #tickers missing the same periods share one statement
+                for (start, end), group in periods.groupby(["start_date", "end_date"], sort=False):
+                    connection.execute(delete(StockData).where(
+                        self.in_tickers(group["ticker"].tolist()), StockData.resample_freq == resample_freq, start <= StockData.stock_datetime, StockData.stock_datetime <= end
+                    ))
+
+            self.data_writer.insert(bars, connection)
+            self.upsert_domains(domains, connection)
+
+            with timed(self.metrics, "commit"):
+                transaction.commit()
+
+        if self.metrics is not None:
+            self.metrics.add("rows_written", len(bars))
+
+        self.sync_domains({key: domain.string for key, domain in domains.items()})
+
+
     """
     Delete data from the database.
 
+    The rows of every ticker are removed with one DELETE, the affected domains are updated in one pass, and
+    both are committed together. On a partitioned stock_data table, partitions whose rows all lie in the
+    deleted range of the deleted tickers are truncated instead.
 
     Parameters
     ----------
@@ -245,23 +534,376 @@ class EODCollector(ABC):
         The date to end data deletion in the format YYYY-MM-DD
 
     """
+    @instrumented("delete_data")
     def delete_data(self, tickers, start_date, end_date, resample_freq):
-        for ticker in tickers:
-            existing_rows = self.session.query(EOD_Date_Model.StockData).filter(EOD_Date_Model.StockData.ticker == ticker, EOD_Date_Model.StockData.resample_freq == resample_freq, start_date <= EOD_Date_Model.StockData.stock_datetime, EOD_Date_Model.StockData.stock_datetime <= end_date)
-            existing_md = self.session.query(EOD_Date_Model.StockDomains).filter(EOD_Date_Model.StockDomains.ticker == ticker, EOD_Date_Model.StockDomains.resample_freq == resample_freq).first()
+        self.flush_data()
+        tickers = list(dict.fromkeys(tickers))
+
+        changed = {}
+        with timed(self.metrics, "domain"):
+            if not self.domain_ranges:
+                existing_domains = self.load_domains(tickers, resample_freq)
+                domain_table = DomainTable.from_domains({(ticker, resample_freq): domain for ticker, domain in existing_domains.items()}, calendar=self.calendar)
+                remaining = domain_table - DomainTable.window(domain_table.keys, start_date, end_date, calendar=self.calendar)
+
+                for key in domain_table.keys:
+                    domain = remaining.get(key)
+                    if domain.string != self.domains[key].string:
+                        changed[key] = domain
 
-            existing_rows.delete()
-            existing_domain = SparsityMappingString(resample_freq=resample_freq, string=existing_md.sparsity_mapping if existing_md else None)
+        StockData = EOD_Date_Model.StockData
 
-            deletion_domain = SparsityMappingString(resample_freq=resample_freq, string=f"/{start_date}|{end_date}")
-            new_domain = existing_domain - deletion_domain
+        try:
+            if self.engine.dialect.name == "postgresql":
+                self.truncate_covered_partitions(tickers, start_date, end_date, resample_freq)
+
+            with timed(self.metrics, "write"):
+                deleted = self.session.execute(
+                    delete(StockData).where(self.in_tickers(tickers), StockData.resample_freq == resample_freq, start_date <= StockData.stock_datetime, StockData.stock_datetime <= end_date),
+                    execution_options={"synchronize_session": False}
+                )
+
+            if self.metrics is not None:
+                self.metrics.add("rows_deleted", max(deleted.rowcount, 0))
+
+            if self.domain_ranges:
+                with timed(self.metrics, "domain"):
+                    mappings = self.subtract_domain_range(tickers, start_date, end_date, resample_freq)
+
+                with timed(self.metrics, "commit"):
+                    self.session.commit()
+
+        except Exception:
+            self.session.rollback()
+            raise
+
+        #commits the deleted rows and the domains together
+        if self.domain_ranges:
+            self.sync_domains(mappings)
+        else:
+            self.write_domains(changed)
+
+        if resample_freq == "days":
+            self.invalidate_derived(tickers, start_date, end_date)
+
+    """
+    Filters stock_data on a list of tickers
+    """
+    def in_tickers(self, tickers):
+        StockData = EOD_Date_Model.StockData
+
+        #a single array parameter keeps the statement the same size whatever the number of tickers
+        if self.engine.dialect.name == "postgresql":
+            return StockData.ticker == any_(bindparam("tickers", tickers, type_=ARRAY(String)))
+
+        return StockData.ticker.in_(tickers)
+
+    """
+    Deletes the derived months and years rows of the periods touching changed daily rows, so the next
+    collect_data rebuilds them. Does nothing unless derive_resampled is set.
+    """
+    def invalidate_derived(self, tickers, start_date, end_date):
+        for resample_freq in DERIVED_FREQS:
+            if self.derives(resample_freq):
+                period = covering_periods([("", start_date, end_date)], resample_freq)
+                self.delete_data(tickers, period["start_date"].iat[0], period["end_date"].iat[0], resample_freq)
+
+    """
+    Truncates the leaf partitions of resample_freq whose rows all belong to tickers and lie between start_date
+    and end_date, in the session's transaction. Does nothing unless stock_data is partitioned.
+
+    Only leaves whose date range lies inside the deleted range are probed, all with one statement.
+    """
+    def truncate_covered_partitions(self, tickers, start_date, end_date, resample_freq):
+        start_date, end_date = str(start_date), str(end_date)
+        leaves = [leaf for leaf, first, last in self.get_partition_leaves().get(resample_freq, []) if first is None or (start_date <= first and last <= end_date)]
+
+        if not leaves:
+            return
+
+        #a partition is covered if it holds rows and none of them survive the delete
+        covered = self.session.execute(text(" UNION ALL ".join(
+            f"SELECT {i} WHERE EXISTS (SELECT 1 FROM {leaf}) AND NOT EXISTS (SELECT 1 FROM {leaf} WHERE NOT (ticker = ANY(:tickers) AND stock_datetime BETWEEN :start_date AND :end_date))"
+            for i, leaf in enumerate(leaves)
+        )), {"tickers": tickers, "start_date": start_date, "end_date": end_date}).scalars().all()
+
+        for i in covered:
+            self.session.execute(text(f"TRUNCATE {leaves[i]}"))
+
+    """
+    Lists the leaf partitions of stock_data, loaded once per collector. Create a new collector after
+    partitioning stock_data with EOD_Date_Model.migrate.
+
+    Returns
+    -------
+
+    leaves: dict(resample_options.member -> [](String, String | None, String | None))
+        (name, first, last) of every leaf partition of each resample_freq, where first and last are the closed
+        date range the partition accepts, or None if it accepts any date. Empty unless stock_data is partitioned.
+    """
+    def get_partition_leaves(self):
+        if self.partition_leaves is not None:
+            return self.partition_leaves
+
+        self.partition_leaves = {}
+        if not EOD_Date_Model(self.database_url).is_partitioned(self.engine):
+            return self.partition_leaves
+
+        for resample_freq in self.resample_options:
+            rows = self.session.execute(text(
+                "SELECT relid::regclass::text, pg_get_expr(relpartbound, relid) FROM pg_partition_tree(:parent) JOIN pg_class ON pg_class.oid = relid WHERE isleaf"
+            ), {"parent": f"stock_data_{resample_freq.name}"}).all()
+
+            self.partition_leaves[resample_freq.name] = [(leaf, *partition_dates(bound)) for leaf, bound in rows]
+
+        return self.partition_leaves
 
-            if existing_md:
-                if new_domain.is_null:
-                    self.session.delete(existing_md)
+
+    """
+    Loads the stored domains of many tickers into the domain cache with a single query.
+
+    Parameters
+    ----------
+
+    tickers: []String
+        The tickers to load
+
+    resample_freq: resample_options.member
+        The resample frequency of the domains
+
+    refresh: Boolean
+        Reload tickers that are already cached
+
+    Returns
+    -------
+
+    domains: dict(String -> SparsityMappingString)
+        The domain of each ticker. Tickers without a stored domain get an empty domain.
+
+    """
+    @instrumented("domain")
+    def load_domains(self, tickers, resample_freq, refresh=False):
+        missing = [ticker for ticker in dict.fromkeys(tickers) if refresh or (ticker, resample_freq) not in self.domains]
+
+        if missing:
+            records = self.session.query(EOD_Date_Model.StockDomains).filter(EOD_Date_Model.StockDomains.ticker.in_(missing), EOD_Date_Model.StockDomains.resample_freq == resample_freq).all()
+            records = {record.ticker: record for record in records}
+
+            for ticker in missing:
+                record = records.get(ticker)
+                self.domain_records[(ticker, resample_freq)] = record
+                self.domains[(ticker, resample_freq)] = SparsityMappingString(resample_freq=resample_freq, string=record.sparsity_mapping if record else None, calendar=self.calendar)
+
+        return {ticker: self.domains[(ticker, resample_freq)] for ticker in tickers}
+
+    """
+    Returns the cached domain of a ticker, loading it from the database if it is not cached yet.
+    """
+    def get_domain(self, ticker, resample_freq):
+        if (ticker, resample_freq) not in self.domains:
+            self.load_domains([ticker], resample_freq)
+
+        return self.domains[(ticker, resample_freq)]
+
+    """
+    Stores the domain of a ticker and updates the domain cache. Empty domains are removed from the database.
+
+    Parameters
+    ----------
+
+    ticker: string
+        Ticker to set
+
+    resample_freq: resample_options.member
+        The resample frequency of the domain
+
+    domain: SparsityMappingString
+        The new domain
+
+    """
+    def write_domain(self, ticker, resample_freq, domain):
+        self.write_domains({(ticker, resample_freq): domain})
+
+    """
+    Stores many domains and updates the domain cache with a single commit. Empty domains are removed from the
+    database. Any other changes pending in the session are committed with them.
+
+    Parameters
+    ----------
+
+    domains: dict((String, resample_options.member) -> SparsityMappingString)
+        The new domain of each (ticker, resample_freq)
+
+    """
+    @instrumented("domain")
+    def write_domains(self, domains):
+        missing = {}
+        for ticker, resample_freq in domains:
+            if (ticker, resample_freq) not in self.domain_records:
+                missing.setdefault(resample_freq, []).append(ticker)
+
+        for resample_freq, tickers in missing.items():
+            self.load_domains(tickers, resample_freq, refresh=True)
+
+        records = {}
+
+        try:
+            for (ticker, resample_freq), domain in domains.items():
+                record = self.domain_records[(ticker, resample_freq)]
+
+                if domain.is_null:
+                    if record is not None:
+                        self.session.delete(record)
+                        record = None
+
+                elif record is None:
+                    record = EOD_Date_Model.StockDomains(id=uuid.uuid4(), ticker=ticker, resample_freq=resample_freq, sparsity_mapping=domain.string)
+                    self.session.add(record)
 
                 else:
-                    existing_md.sparsity_mapping = new_domain.string
+                    record.sparsity_mapping = domain.string
+
+                records[(ticker, resample_freq)] = record
+
+            if self.domain_ranges:
+                self.session.flush()
+                ranges = [{"ticker": ticker, "resample_freq": resample_freq, "ranges": to_multirange(domain.string, resample_freq)} for (ticker, resample_freq), domain in domains.items() if not domain.is_null]
+
+                if ranges:
+                    self.session.execute(text(f"UPDATE stock_domains SET {DOMAIN_RANGES_COLUMN} = CAST(:ranges AS datemultirange) WHERE ticker = :ticker AND resample_freq = :resample_freq"), ranges)
+
+            with timed(self.metrics, "commit"):
+                self.session.commit()
+
+        except Exception:
+            self.session.rollback()
+            for key in domains:
+                self.domains.pop(key, None)
+                self.domain_records.pop(key, None)
+            raise
+
+        self.domain_records.update(records)
+        self.domains.update(domains)
+
+    """
+    Adds a closed interval to the domain of a ticker with one atomic statement on the date_ranges column,
+    creating the domain if it does not exist. sparsity_mapping is rendered from the result in the same
+    statement. Requires domain_ranges.
+    """
+    @instrumented("domain")
+    def add_domain_range(self, ticker, resample_freq, start_date, end_date):
+        merged = f"COALESCE(stock_domains.{DOMAIN_RANGES_COLUMN}, '{{}}') + EXCLUDED.{DOMAIN_RANGES_COLUMN}"
+
+        try:
+            sparsity_mapping = self.session.execute(text(f"""
+                INSERT INTO stock_domains (id, ticker, resample_freq, sparsity_mapping, {DOMAIN_RANGES_COLUMN})
+                VALUES (:id, :ticker, :resample_freq, :sparsity_mapping, datemultirange(daterange(CAST(:start_date AS date), CAST(:end_date AS date), '[]')))
+                ON CONFLICT (ticker, resample_freq) DO UPDATE SET {DOMAIN_RANGES_COLUMN} = {merged}, sparsity_mapping = {sparsity_mapping_sql(merged)}
+                RETURNING sparsity_mapping
+            """), {"id": uuid.uuid4(), "ticker": ticker, "resample_freq": resample_freq, "sparsity_mapping": f"/{start_date}|{end_date}", "start_date": start_date, "end_date": end_date}).scalar_one()
+
+            with timed(self.metrics, "commit"):
+                self.session.commit()
+
+        except Exception:
+            self.session.rollback()
+            raise
+
+        self.sync_domains({(ticker, resample_freq): sparsity_mapping})
+
+    """
+    Subtracts a closed interval from the domains of many tickers with one UPDATE on the date_ranges column and
+    removes the domains left empty, in the session's transaction. Requires domain_ranges.
+
+    Returns
+    -------
 
-            self.session.commit()
-            
\ No newline at end of file
+    mappings: dict((String, resample_options.member) -> String | None)
+        The new sparsity mapping of every changed domain, None if it was removed
+    """
+    def subtract_domain_range(self, tickers, start_date, end_date, resample_freq):
+        interval = "daterange(CAST(:start_date AS date), CAST(:end_date AS date), '[]')"
+        remaining = f"{DOMAIN_RANGES_COLUMN} - datemultirange({interval})"
+        parameters = {"tickers": tickers, "resample_freq": resample_freq, "start_date": start_date, "end_date": end_date}
+
+        changed = self.session.execute(text(f"""
+            UPDATE stock_domains SET {DOMAIN_RANGES_COLUMN} = {remaining}, sparsity_mapping = {sparsity_mapping_sql(remaining)}
+            WHERE resample_freq = :resample_freq AND ticker = ANY(:tickers) AND {DOMAIN_RANGES_COLUMN} && {interval}
+            RETURNING ticker, sparsity_mapping
+        """), parameters).all()
+
+        self.session.execute(text(f"DELETE FROM stock_domains WHERE resample_freq = :resample_freq AND ticker = ANY(:tickers) AND isempty({DOMAIN_RANGES_COLUMN})"), parameters)
+
+        return {(ticker, resample_freq): sparsity_mapping for ticker, sparsity_mapping in changed}
+
+    """
+    Updates the domain cache after domains were changed in SQL. The cached records of those domains are
+    expired, so the next write_domains reloads them.
+    """
+    @instrumented("domain")
+    def sync_domains(self, mappings):
+        for (ticker, resample_freq), sparsity_mapping in mappings.items():
+            record = self.domain_records.pop((ticker, resample_freq), None)
+            if record is not None:
+                self.session.expire(record)
+
+            self.domains[(ticker, resample_freq)] = SparsityMappingString(resample_freq=resample_freq, string=sparsity_mapping, calendar=self.calendar)
+
+    """
+    Lists the tickers whose domain contains every day between start_date and end_date. Runs in SQL on the
+    GiST index of date_ranges. Requires domain_ranges.
+    """
+    def covered_tickers(self, start_date, end_date, resample_freq):
+        return self.session.execute(text(
+            f"SELECT ticker FROM stock_domains WHERE resample_freq = :resample_freq AND {DOMAIN_RANGES_COLUMN} @> daterange(CAST(:start_date AS date), CAST(:end_date AS date), '[]') ORDER BY ticker"
+        ), {"resample_freq": resample_freq, "start_date": start_date, "end_date": end_date}).scalars().all()
+
+    """
+    Lists the gaps of every domain between start_date and end_date in SQL, without loading any domain.
+    Requires domain_ranges.
+
+    Parameters
+    ----------
+
+    start_date: string
+        The start of the window in the format YYYY-MM-DD
+
+    end_date: string
+        The end of the window in the format YYYY-MM-DD
+
+    resample_freq: resample_options.member
+
+    tickers: None | []String
+        The tickers to check. Tickers without a domain have the whole window as a gap. Defaults to every
+        ticker with a domain.
+
+    Returns
+    -------
+
+    gaps: [](String, datetime.date, datetime.date)
+        Closed (ticker, start, end) intervals, sorted by ticker and start
+
+    Notes
+    -----
+    Gaps are counted in calendar days, so weekends and holidays that a trading calendar counts as covered
+    may be reported as gaps.
+    """
+    def domain_gaps(self, start_date, end_date, resample_freq, tickers=None):
+        if tickers is None:
+            domains, ticker, where = "stock_domains d", "d.ticker", "WHERE d.resample_freq = :resample_freq"
+        else:
+            domains, ticker, where = "unnest(CAST(:tickers AS text[])) t(ticker) LEFT JOIN stock_domains d ON d.ticker = t.ticker AND d.resample_freq = :resample_freq", "t.ticker", ""
+
+        return [tuple(gap) for gap in self.session.execute(text(f"""
+            SELECT {ticker}, lower(g), upper(g) - 1
+            FROM {domains} CROSS JOIN LATERAL unnest(datemultirange(daterange(CAST(:start_date AS date), CAST(:end_date AS date), '[]')) - COALESCE(d.{DOMAIN_RANGES_COLUMN}, '{{}}')) g
+            {where}
+            ORDER BY 1, 2
+        """), {"resample_freq": resample_freq, "start_date": start_date, "end_date": end_date, "tickers": tickers}).all()]
+
+    """
+    Lists the tickers whose domain misses any day between start_date and end_date, for example the tickers
+    lacking the last quarter of a year. See domain_gaps.
+    """
+    def uncovered_tickers(self, start_date, end_date, resample_freq, tickers=None):
+        return list(dict.fromkeys(ticker for ticker, _, _ in self.domain_gaps(start_date, end_date, resample_freq, tickers)))
@@ -0,0 +1,153 @@
+import io
+import os
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.csv as pa_csv
+
+#Tiingo CSV columns and the stock_data columns they are read into. Other columns are never converted.
+TIINGO_COLUMNS = {
+    'date': 'stock_datetime',
+    'adjVolume': 'stock_adj_volume',
+    'adjOpen': 'stock_adj_open',
+    'adjClose': 'stock_adj_close',
+    'adjHigh': 'stock_adj_high',
+    'adjLow': 'stock_adj_low',
+}
+
+VALUE_SCHEMA = pa.schema([
+    ('stock_datetime', pa.date32()),
+    ('stock_adj_volume', pa.float64()),
+    ('stock_adj_open', pa.float64()),
+    ('stock_adj_close', pa.float64()),
+    ('stock_adj_high', pa.float64()),
+    ('stock_adj_low', pa.float64()),
+])
+
+#the columns of stock_data in the order parse_csv returns them
+ROW_SCHEMA = pa.schema([('id', pa.string()), ('ticker', pa.string()), ('resample_freq', pa.string())] + list(VALUE_SCHEMA))
+
+class ChunkStream(io.RawIOBase):
+    """
+    Read only file object over an iterator of byte chunks, for example httpx.Response.iter_bytes(). Chunks
+    are consumed as the reader asks for data, so the whole body is never held in memory.
+    """
+    def __init__(self, chunks):
+        self.chunks = iter(chunks)
+        self.pending = b""
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        while not self.pending:
+            self.pending = next(self.chunks, None)
+            if self.pending is None:
+                self.pending = b""
+                return 0
+
+        size = min(len(buffer), len(self.pending))
+        buffer[:size] = self.pending[:size]
+        self.pending = self.pending[size:]
+
+        return size
+
+
+"""
+Opens a streaming reader over a Tiingo CSV body that yields record batches of VALUE_SCHEMA
+
+The header is read first and mapped through TIINGO_COLUMNS, so the columns are renamed by the reader
+and converted straight to their stock_data types.
+
+Parameters
+----------
+
+chunks: iterable(bytes)
+    The body
+
+block_size: int
+    Bytes parsed into each record batch
+
+Returns
+-------
+
+reader: pyarrow.csv.CSVStreamingReader | []
+    No batches if the body is only a header, which Tiingo returns for ranges without rows
+
+Raises
+------
+
+ValueError
+    If the body does not start with a Tiingo CSV header
+"""
+def open_csv(chunks, block_size=1 << 20):
+    stream = io.BufferedReader(ChunkStream(chunks))
+
+    header = stream.readline().decode().strip().split(",")
+    names = [TIINGO_COLUMNS.get(name, name) for name in header]
+
+    missing = [name for name in VALUE_SCHEMA.names if name not in names]
+    if missing:
+        raise ValueError(f"Unexpected CSV header {','.join(header)}")
+
+    #pyarrow rejects a body without any bytes after the header as an empty CSV file
+    if not stream.peek(1):
+        return []
+
+    return pa_csv.open_csv(
+        stream,
+        read_options=pa_csv.ReadOptions(column_names=names, block_size=block_size),
+        convert_options=pa_csv.ConvertOptions(column_types=VALUE_SCHEMA, include_columns=VALUE_SCHEMA.names),
+    )
+
+
+"""
+Parses a Tiingo CSV body into record batches of ROW_SCHEMA, ready for BulkWriter
+
+Parameters
+----------
+
+chunks: iterable(bytes)
+    The body
+
+ticker: string
+
+resample_freq: resample_options.member
+
+block_size: int
+    Bytes parsed into each record batch
+
+Yields
+------
+
+batch: pyarrow.RecordBatch
+"""
+def read_batches(chunks, ticker, resample_freq, block_size=1 << 20):
+    for batch in open_csv(chunks, block_size=block_size):
+        if batch.num_rows:
+            yield add_keys(batch, ticker, resample_freq)
+
+
+"""
+Prepends the id, ticker and resample_freq columns to a batch of VALUE_SCHEMA
+"""
+def add_keys(batch, ticker, resample_freq):
+    repeat = lambda value: pa.array([value], pa.string()).take(np.zeros(batch.num_rows, dtype=np.int32))
+    return pa.RecordBatch.from_arrays([random_ids(batch.num_rows), repeat(ticker), repeat(resample_freq)] + batch.columns, schema=ROW_SCHEMA)
+
+
+HEX_DIGITS = np.frombuffer(b"0123456789abcdef", dtype=np.uint8)
+
+"""
+Generates random version 4 UUIDs as 32 digit hex strings without a Python object per id
+"""
+def random_ids(n):
+    octets = np.frombuffer(os.urandom(16 * n), dtype=np.uint8).reshape(n, 16).copy()
+    octets[:, 6] = octets[:, 6] & 0x0F | 0x40
+    octets[:, 8] = octets[:, 8] & 0x3F | 0x80
+
+    digits = np.empty((n, 32), dtype=np.uint8)
+    digits[:, 0::2] = HEX_DIGITS[octets >> 4]
+    digits[:, 1::2] = HEX_DIGITS[octets & 0x0F]
+
+    return pa.array(digits.reshape(-1).view("S32"), pa.binary()).cast(pa.string())
@@ -0,0 +1,278 @@
+import pandas as pd
+import pyarrow as pa
+import pyarrow.csv as pa_csv
+from io import StringIO, BytesIO
+
+import time
+import uuid
+
+from sqlalchemy import Table, MetaData
+from sqlalchemy.dialects import postgresql, sqlite
+
+from stock_pretraining.schemas.eod_model import Base
+from stock_pretraining.data_processing.eod_collectors.instrumentation import timed
+
+class BulkWriter():
+    """
+    Writes retrieved frames to a table.
+
+    On PostgreSQL engines using psycopg2 or psycopg, frames are streamed in with a single COPY ... FROM STDIN
+    through a CSV buffer. Other engines fall back to DataFrame.to_sql.
+
+    Frames may be pandas DataFrames or pyarrow Tables and RecordBatches. Arrow frames are written to the CSV
+    buffer by pyarrow without passing through pandas.
+
+    In upsert mode, rows that share a key with a stored row replace its values instead of failing. On PostgreSQL
+    the frames are copied into a temporary staging table and merged with INSERT ... ON CONFLICT DO UPDATE in the
+    same transaction. PostgreSQL engines without COPY support and SQLite use the same statement with bound rows.
+
+    Parameters
+    ----------
+
+    engine: sqlalchemy.Engine
+        The engine to write through
+
+    table: string
+        The table to write to
+
+    flush_rows: int | None
+        If set, frames are accumulated until at least flush_rows rows are buffered and then written with one COPY.
+        Otherwise every frame is written as soon as it is received.
+
+    flush_seconds: float | None
+        If set, accumulated frames are also written once the oldest of them has been buffered for flush_seconds.
+        The age is checked whenever a frame is received.
+
+    mode: Enum("append", "upsert")
+        Whether rows are appended or merged on key_columns
+
+    key_columns: []string
+        Columns of a unique index on table, used to resolve conflicts in upsert mode
+
+    immutable_columns: []string
+        Columns that keep their stored value when a row is replaced in upsert mode
+
+    clock: () -> float
+        Monotonic clock in seconds
+
+    metrics: Metrics | None
+        If set, flushes are timed as the write and commit stages and written rows are counted
+
+    Notes
+    -----
+    before_commit may be set to a function that receives the SQLAlchemy connection of a flush and writes further
+    changes in its transaction, after_commit to a function called once that transaction is committed and
+    on_rollback to a function called when a flush fails.
+    """
+    def __init__(self, engine, table="stock_data", flush_rows=None, mode="append", key_columns=("ticker", "resample_freq", "stock_datetime"), immutable_columns=("id",), flush_seconds=None, clock=time.monotonic, metrics=None):
+        assert mode in ("append", "upsert"), f"invalid mode {mode}, expected 'append' or 'upsert'"
+
+        self.engine = engine
+        self.table = table
+        self.flush_rows = flush_rows
+        self.flush_seconds = flush_seconds
+        self.clock = clock
+        self.metrics = metrics
+        self.mode = mode
+        self.key_columns = list(key_columns)
+        self.immutable_columns = list(immutable_columns)
+        self.reflected_table = None
+
+        self.use_copy = engine.dialect.name == "postgresql" and engine.dialect.driver in ("psycopg2", "psycopg")
+
+        self.frames = []
+        self.callbacks = []
+        self.pending_keys = set()
+        self.buffered_rows = 0
+        self.buffered_since = None
+
+        self.before_commit = None
+        self.after_commit = None
+        self.on_rollback = None
+
+    """
+    Buffers a frame and flushes if the buffer is full or accumulation is disabled.
+
+    Parameters
+    ----------
+
+    df: pd.DataFrame
+        Rows matching the table schema
+
+    key: hashable
+        Identifies what the rows belong to, for example (ticker, resample_freq). See has_pending.
+
+    on_flush: () -> None
+        Called once the rows have been committed
+    """
+    def write(self, df, key=None, on_flush=None):
+        if not self.frames:
+            self.buffered_since = self.clock()
+
+        self.frames.append(df)
+        self.buffered_rows += len(df)
+
+        if on_flush is not None:
+            self.callbacks.append(on_flush)
+
+        if key is not None:
+            self.pending_keys.add(key)
+
+        if not self.flush_rows or self.buffered_rows >= self.flush_rows or self.expired():
+            self.flush()
+
+    def expired(self):
+        return self.flush_seconds is not None and self.clock() - self.buffered_since >= self.flush_seconds
+
+    def has_pending(self, key=None):
+        return bool(self.frames) if key is None else key in self.pending_keys
+
+    """
+    Writes every buffered frame in one statement and runs before_commit in the same transaction, then runs the
+    on_flush callbacks in the order they were given
+    """
+    def flush(self):
+        if not self.frames:
+            return
+
+        frames, callbacks = self.frames, self.callbacks
+        self.frames, self.callbacks, self.pending_keys, self.buffered_rows, self.buffered_since = [], [], set(), 0, None
+
+        df = concat_frames(frames)
+
+        try:
+            with self.engine.connect() as connection, connection.begin() as transaction:
+                self.insert(df, connection)
+
+                with timed(self.metrics, "commit"):
+                    if self.before_commit is not None:
+                        self.before_commit(connection)
+
+                    transaction.commit()
+
+        except Exception:
+            if self.on_rollback is not None:
+                self.on_rollback()
+            raise
+
+        if self.metrics is not None:
+            self.metrics.add("rows_written", len(df))
+
+        if self.after_commit is not None:
+            self.after_commit()
+
+        for callback in callbacks:
+            callback()
+
+    """
+    Writes a frame on connection at once, in its transaction, without buffering it or counting it as written
+    """
+    def insert(self, df, connection):
+        with timed(self.metrics, "write"):
+            if self.mode == "upsert":
+                self.upsert(to_pandas(df), connection)
+            elif self.use_copy:
+                self.copy(df, connection)
+            else:
+                self.to_sql(to_pandas(df), connection)
+
+    """
+    Appends rows with DataFrame.to_sql. Engines without a native uuid type store the mapped Uuid columns as hex
+    strings, which to_sql does not convert to, so uuid.UUID values are bound as hex there.
+    """
+    def to_sql(self, df, connection):
+        if self.engine.dialect.name != "postgresql":
+            df = hex_uuids(df)
+
+        df.to_sql(self.table, connection, if_exists='append', index=False)
+
+    def copy(self, df, connection):
+        self.copy_into(connection.connection.cursor(), self.table, df)
+
+    """
+    Merges rows on key_columns. Later rows win over earlier rows with the same key.
+    """
+    def upsert(self, df, connection):
+        df = df.drop_duplicates(subset=self.key_columns, keep="last")
+        updated_columns = [column for column in df.columns if column not in self.key_columns and column not in self.immutable_columns]
+
+        if not self.use_copy:
+            table = self.get_table()
+            insert = {"postgresql": postgresql.insert, "sqlite": sqlite.insert}[self.engine.dialect.name](table)
+            statement = insert.on_conflict_do_update(index_elements=self.key_columns, set_={column: insert.excluded[column] for column in updated_columns})
+
+            connection.execute(statement, df.to_dict("records"))
+            return
+
+        staging = f"{self.table}_staging"
+        columns = ", ".join(f'"{column}"' for column in df.columns)
+        updates = ", ".join(f'"{column}" = EXCLUDED."{column}"' for column in updated_columns)
+        conflict = "DO UPDATE SET " + updates if updates else "DO NOTHING"
+
+        cursor = connection.connection.cursor()
+        cursor.execute(f"CREATE TEMPORARY TABLE {staging} (LIKE {self.table} INCLUDING DEFAULTS) ON COMMIT DROP")
+        self.copy_into(cursor, staging, df)
+        cursor.execute(f"INSERT INTO {self.table} ({columns}) SELECT {columns} FROM {staging} ON CONFLICT ({', '.join(self.key_columns)}) {conflict}")
+
+    """
+    Returns the mapped table, or reflects tables this package does not define so column types survive binding
+    """
+    def get_table(self):
+        if self.table in Base.metadata.tables:
+            return Base.metadata.tables[self.table]
+
+        if self.reflected_table is None:
+            self.reflected_table = Table(self.table, MetaData(), autoload_with=self.engine)
+
+        return self.reflected_table
+
+    def copy_into(self, cursor, table, df):
+        if isinstance(df, pa.Table):
+            buffer = BytesIO()
+            pa_csv.write_csv(df, buffer, write_options=pa_csv.WriteOptions(include_header=False))
+            names = df.column_names
+        else:
+            buffer = StringIO()
+            df.to_csv(buffer, index=False, header=False)
+            names = df.columns
+
+        buffer.seek(0)
+        columns = ", ".join(f'"{column}"' for column in names)
+        statement = f"COPY {table} ({columns}) FROM STDIN WITH (FORMAT csv)"
+
+        if self.engine.dialect.driver == "psycopg2":
+            cursor.copy_expert(statement, buffer)
+        else:
+            with cursor.copy(statement) as copy:
+                copy.write(buffer.getvalue())
+
+
+#the frame types BulkWriter accepts
+FRAME_TYPES = (pd.DataFrame, pa.Table, pa.RecordBatch)
+
+"""
+Concatenates frames into one Table if they are all Arrow, or into one DataFrame otherwise
+"""
+def concat_frames(frames):
+    if all(isinstance(frame, pd.DataFrame) for frame in frames):
+        return frames[0] if len(frames) == 1 else pd.concat(frames, ignore_index=True)
+
+    if any(isinstance(frame, pd.DataFrame) for frame in frames):
+        return pd.concat([to_pandas(frame) for frame in frames], ignore_index=True)
+
+    return pa.concat_tables([pa.Table.from_batches([frame]) if isinstance(frame, pa.RecordBatch) else frame for frame in frames])
+
+
+"""
+Replaces uuid.UUID values with their hex strings
+"""
+def hex_uuids(df):
+    columns = [column for column in df.columns if df[column].dtype == object and len(df) and isinstance(df[column].iat[0], uuid.UUID)]
+    if not columns:
+        return df
+
+    return df.assign(**{column: df[column].map(lambda value: value.hex if isinstance(value, uuid.UUID) else value) for column in columns})
+
+
+def to_pandas(df):
+    return df if isinstance(df, pd.DataFrame) else df.to_pandas()
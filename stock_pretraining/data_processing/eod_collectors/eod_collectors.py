@@ -1,5 +1,11 @@
 from stock_pretraining.environment import get_env_variable
 from stock_pretraining.data_processing.eod_collectors.abstract_eod_collector import EODCollector
+from stock_pretraining.data_processing.eod_collectors.rate_limiter import RateLimiter
+from stock_pretraining.data_processing.eod_collectors.response_cache import ResponseCache
+from stock_pretraining.data_processing.eod_collectors.bulk_writer import FRAME_TYPES
+from stock_pretraining.data_processing.eod_collectors.arrow_csv import ROW_SCHEMA, read_batches
+from stock_pretraining.data_processing.eod_collectors.instrumentation import instrumented, timed
+from stock_pretraining.data_processing.domain_table import DomainTable
 
 import httpx
 from io import StringIO
@@ -7,10 +13,17 @@ from io import StringIO
 from stock_pretraining.schemas.eod_model import resample_options
 
 import pandas as pd
+import pyarrow as pa
 import uuid
+import random
+import asyncio
+import itertools
+import time
 
 from datetime import datetime
 
+TIINGO_URL = "https://api.tiingo.com"
+
 class TiingoCollector(EODCollector):
     def __init__(self, config=None):
         super().__init__(config)
@@ -23,12 +36,60 @@ class TiingoCollector(EODCollector):
 
         self.datetime_format = "%Y-%m-%d"
 
+        self.headers = {
+            'Content-Type': 'application/json',
+            'Authorization': f'Token {self.api_key}'
+        }
+        self.client = httpx.Client(base_url=TIINGO_URL, headers=self.headers)
+        self.rate_limiter = RateLimiter([(self.hourly_request_limit, 3600), (self.daily_request_limit, 86400)])
+        self.cache = ResponseCache(self.cache_dir, max_bytes=self.cache_max_bytes, ttl=self.cache_ttl) if self.cache_dir else None
+
     def date_to_str(self, date):
         return date.strftime(self.datetime_format)
 
     def str_to_date(self, string):
         return datetime.strptime(string, self.datetime_format)
 
+    """
+    Set configuration for TiingoCollector instance.
+
+    Notes
+    -----
+    The optional keys max_retries (default 5) and retry_backoff (seconds, default 1.0) bound the retries of
+    transport errors, 429 and 5xx responses, which every request waits for with jittered exponential backoff
+    and any Retry-After header. See retry_wait.
+
+    The optional keys max_concurrency, hourly_request_limit and daily_request_limit only affect
+    collect_data_async. The request limits default to the limits of Tiingo's free tier, 50 requests per hour
+    and 1000 per day, so paid plans should raise them. Set them to None to disable them.
+
+    The optional key flush_rows makes the collector accumulate rows from many gaps and write them
+    with a single COPY once at least flush_rows rows are buffered.
+
+    The optional key write_mode may be set to "upsert" to merge rows on (ticker, resample_freq,
+    stock_datetime), so overwriting an overlapping range is one write instead of a delete and insert.
+
+    The optional key trading_calendar, for example "NYSE", makes daily domains count weekends and
+    holidays as covered, so collect_data never requests ranges without trading days.
+
+    The optional key cache_dir enables an on-disk cache of responses. See ResponseCache. cache_ttl
+    (seconds, default 3600) bounds how long responses that reach the current day are reused, and
+    cache_max_bytes (default 1 GiB) bounds the size of the cache.
+
+    The optional key stream_responses makes retrieve_data stream response bodies into a pyarrow CSV reader
+    and return a pyarrow Table instead of a DataFrame. See retrieve_arrow.
+
+    The optional key domain_ranges makes domain updates single UPDATE statements on the date_ranges column
+    of stock_domains, which must have been added with EOD_Date_Model(domain_ranges=True). PostgreSQL only.
+
+    The optional key derive_resampled makes collect_data build months and years rows from daily rows
+    instead of requesting them. See EODCollector.derive_data.
+
+    The optional key metrics may be set to True or to a Metrics instance to time requests, parsing, writes,
+    commits and domain operations. metrics_path turns metrics on and writes them to a file in metrics_format,
+    "prometheus" (default) or "jsonl", after every collect_data and delete_data call and every
+    metrics_interval seconds. See Metrics. Without them, instrumentation is off.
+    """
     def set_config(self, config=None):
         if not config:
             config = {}
@@ -41,24 +102,310 @@ class TiingoCollector(EODCollector):
 
         assert "api_key" in config.keys(), "You must either specify an api_key in your configuration or include a TIINGO_API_KEY as an environment variable."
         assert "database_url" in config.keys(), "You must either specify a database_url in your configuration or include a database_url as an environment variable."
-        
+
         self.api_key = config['api_key']
         self.database_url = config['database_url']
 
+        self.max_concurrency = config.get('max_concurrency', 8)
+        self.hourly_request_limit = config.get('hourly_request_limit', 50)
+        self.daily_request_limit = config.get('daily_request_limit', 1000)
+        self.max_retries = config.get('max_retries', 5)
+        self.retry_backoff = config.get('retry_backoff', 1.0)
+        self.flush_rows = config.get('flush_rows', None)
+        self.write_mode = config.get('write_mode', "append")
+        self.trading_calendar = config.get('trading_calendar', None)
+        self.cache_dir = config.get('cache_dir', None)
+        self.cache_ttl = config.get('cache_ttl', 3600)
+        self.cache_max_bytes = config.get('cache_max_bytes', 1 << 30)
+        self.derive_resampled = config.get('derive_resampled', False)
+        self.stream_responses = config.get('stream_responses', False)
+        self.domain_ranges = config.get('domain_ranges', False)
+        self.metrics = config.get('metrics', None)
+        self.metrics_path = config.get('metrics_path', None)
+        self.metrics_format = config.get('metrics_format', "prometheus")
+        self.metrics_interval = config.get('metrics_interval', None)
+
+    def request_url(self, ticker, start_date, end_date, resample_freq):
+        return f"/tiingo/daily/{ticker}/prices?startDate={start_date}&endDate={end_date}&resampleFreq={self.resample_map[resample_freq]}&format=csv"
+
     def retrieve_data(self, ticker, start_date, end_date, resample_freq=None):
         if resample_freq is None:
-            resample_freq = self.resample_map["day"]
+            resample_freq = "days"
 
-        headers = {
-            'Content-Type': 'application/json',
-            'Authorization': f'Token {self.api_key}'
-        }
+        if self.stream_responses:
+            return self.retrieve_arrow(ticker, start_date, end_date, resample_freq)
+
+        cached = self.cache.get(ticker, start_date, end_date, resample_freq) if self.cache else None
+        if cached is not None:
+            self.record_cache_hit()
+            return self.timed_parse(self.parse_csv, ticker, resample_freq, cached)
+
+        url = self.request_url(ticker, start_date, end_date, resample_freq)
+
+        for attempt in itertools.count():
+            try:
+                started = time.perf_counter()
+                response = self.client.get(url)
+                self.record_response(response, time.perf_counter() - started, len(response.content))
+            except httpx.TransportError as e:
+                if (wait := self.retry_wait(attempt)) is None:
+                    return f'Failed to retrieve data for {ticker} with the following error: "{e}".'
+
+                time.sleep(wait)
+                continue
+
+            if (wait := self.retry_wait(attempt, response)) is None:
+                break
+
+            time.sleep(wait)
+
+        conditional_df = self.timed_parse(self.parse_response, ticker, resample_freq, response)
+
+        if self.cache and isinstance(conditional_df, pd.DataFrame):
+            self.cache.put(ticker, start_date, end_date, resample_freq, response.text)
+
+        return conditional_df
+
+    """
+    retrieve_data through a streaming response. Body chunks are parsed by a pyarrow CSV reader with a fixed
+    schema as they arrive, so the body is never decoded into one string, and ids are generated without a
+    Python object per row. Errors are detected from the status code and content type, and from the CSV header.
+    Requests are retried like those of retrieve_data.
+
+    Returns
+    -------
+
+    conditional_table: pyarrow.Table | String
+        Rows of ROW_SCHEMA, which BulkWriter writes directly. Otherwise, an error message.
+    """
+    def retrieve_arrow(self, ticker, start_date, end_date, resample_freq="days"):
+        cached = self.cache.get(ticker, start_date, end_date, resample_freq) if self.cache else None
+        if cached is not None:
+            self.record_cache_hit()
+            return self.timed_parse(self.parse_arrow, ticker, resample_freq, [cached.encode()])
+
+        url = self.request_url(ticker, start_date, end_date, resample_freq)
+
+        for attempt in itertools.count():
+            try:
+                conditional_table, error_response = self.stream_arrow(ticker, start_date, end_date, resample_freq, url)
+            except httpx.TransportError as e:
+                if (wait := self.retry_wait(attempt)) is None:
+                    return f'Failed to retrieve data for {ticker} with the following error: "{e}".'
+            else:
+                if error_response is None or (wait := self.retry_wait(attempt, error_response)) is None:
+                    break
+
+            time.sleep(wait)
+
+        return conditional_table
+
+    """
+    Sends one streaming request for retrieve_arrow and caches the body of a successful response
+
+    Returns
+    -------
+
+    conditional_table: pyarrow.Table | String
+        Rows of ROW_SCHEMA. Otherwise, an error message.
+
+    error_response: httpx.Response | None
+        The response, if it reported an error
+    """
+    def stream_arrow(self, ticker, start_date, end_date, resample_freq, url):
+        started = time.perf_counter()
+        with self.client.stream("GET", url) as response:
+            if self.is_error_response(response):
+                response.read()
+                self.record_response(response, time.perf_counter() - started, len(response.content))
+                return f'Failed to retrieve data for {ticker} with the following response: "{response.text}".', response
+
+            #keep the raw chunks for the cache as they pass through the reader
+            chunks = []
+            body = response.iter_bytes()
+            if self.cache:
+                body = (chunks.append(chunk) or chunk for chunk in body)
+
+            #parsing runs while the body arrives, so time spent waiting for chunks is told apart from parsing
+            headers = time.perf_counter() - started
+            received = [headers, 0]
+            if self.metrics is not None:
+                body = timed_chunks(body, received)
+
+            parse_started = time.perf_counter()
+            conditional_table = self.parse_arrow(ticker, resample_freq, body)
+            parsed = time.perf_counter() - parse_started
+
+        self.record_response(response, received[0], received[1])
+        self.record_parse(conditional_table, parsed - (received[0] - headers))
+
+        if self.cache and isinstance(conditional_table, pa.Table):
+            self.cache.put(ticker, start_date, end_date, resample_freq, b"".join(chunks).decode())
+
+        return conditional_table, None
+
+    """
+    Asynchronous retrieve_data. Waits for the rate limiter before every attempt and retries
+    429 and 5xx responses with jittered exponential backoff. Cached responses skip the rate limiter.
+
+    Parameters
+    ----------
+
+    client: httpx.AsyncClient
+        Client created by make_async_client
+
+    ticker: string
+        Ticker to retrieve
+
+    start_date: string
+        The date to begin data collection in the format YYYY-MM-DD
+
+    end_date: string
+        The date to end data collection in the format YYYY-MM-DD
+
+    resample_freq: resample_options.member
+        The interval between data collection instances
+
+    Returns
+    -------
+
+    conditional_df: pd.Dataframe | String
+        The data to append to the database if no error occured. Otherwise, an error message.
+    """
+    async def retrieve_data_async(self, client, ticker, start_date, end_date, resample_freq="days"):
+        if self.cache:
+            cached = await asyncio.to_thread(self.cache.get, ticker, start_date, end_date, resample_freq)
+            if cached is not None:
+                self.record_cache_hit()
+                if self.stream_responses:
+                    return await asyncio.to_thread(self.timed_parse, self.parse_arrow, ticker, resample_freq, [cached.encode()])
+
+                return await asyncio.to_thread(self.timed_parse, self.parse_csv, ticker, resample_freq, cached)
+
+        url = self.request_url(ticker, start_date, end_date, resample_freq)
+
+        for attempt in itertools.count():
+            await self.rate_limiter.acquire()
 
-        response = httpx.get(f"https://api.tiingo.com/tiingo/daily/{ticker}/prices?startDate={start_date}&endDate={end_date}&resampleFreq={self.resample_map[resample_freq]}&format=csv", headers=headers)
+            try:
+                started = time.perf_counter()
+                response = await client.get(url)
+                self.record_response(response, time.perf_counter() - started, len(response.content))
+            except httpx.TransportError as e:
+                if (wait := self.retry_wait(attempt)) is None:
+                    return f'Failed to retrieve data for {ticker} with the following error: "{e}".'
+
+                await asyncio.sleep(wait)
+                continue
+
+            if (wait := self.retry_wait(attempt, response)) is None:
+                break
+
+            await asyncio.sleep(wait)
+
+        #parse off the event loop so other responses keep streaming in
+        if self.stream_responses and not self.is_error_response(response):
+            conditional_df = await asyncio.to_thread(self.timed_parse, self.parse_arrow, ticker, resample_freq, [response.content])
+        else:
+            conditional_df = await asyncio.to_thread(self.timed_parse, self.parse_response, ticker, resample_freq, response)
+
+        if self.cache and isinstance(conditional_df, FRAME_TYPES):
+            await asyncio.to_thread(self.cache.put, ticker, start_date, end_date, resample_freq, response.text)
+
+        return conditional_df
+
+    """
+    Returns the seconds to wait before retrying an attempt, or None if it is not retried. Transport errors,
+    signalled by response=None, and 429 and 5xx responses are retried up to max_retries times.
+    """
+    def retry_wait(self, attempt, response=None):
+        if attempt >= self.max_retries or (response is not None and response.status_code != 429 and response.status_code < 500):
+            return None
+
+        return self.retry_delay(attempt, response)
+
+    """
+    Full jitter exponential backoff, never shorter than a Retry-After header given in seconds
+    """
+    def retry_delay(self, attempt, response=None):
+        delay = random.uniform(0, self.retry_backoff * 2 ** attempt)
+
+        retry_after = response.headers.get("Retry-After") if response is not None else None
+        if retry_after is not None and retry_after.isdigit():
+            delay = max(delay, float(retry_after))
+
+        return delay
+
+    """
+    Records the latency, body size in bytes and status of a response if metrics are set
+    """
+    def record_response(self, response, seconds, size):
+        if self.metrics is None:
+            return
+
+        self.metrics.observe("http", seconds)
+        self.metrics.add("http_requests")
+        self.metrics.add("http_bytes", size)
+
+        if self.is_error_response(response):
+            self.metrics.add("http_errors")
+
+    def record_cache_hit(self):
+        if self.metrics is not None:
+            self.metrics.add("cache_hits")
+
+    """
+    Records the time spent parsing a body and the number of rows parsed if metrics are set
+    """
+    def record_parse(self, conditional_df, seconds):
+        if self.metrics is None:
+            return
+
+        self.metrics.observe("parse", seconds)
+        if isinstance(conditional_df, FRAME_TYPES):
+            self.metrics.add("rows_parsed", len(conditional_df))
+
+    """
+    Calls parse with args and records it as the parse stage
+    """
+    def timed_parse(self, parse, *args):
+        if self.metrics is None:
+            return parse(*args)
+
+        started = time.perf_counter()
+        conditional_df = parse(*args)
+        self.record_parse(conditional_df, time.perf_counter() - started)
+
+        return conditional_df
+
+    def make_async_client(self, **kwargs):
+        limits = httpx.Limits(max_connections=self.max_concurrency, max_keepalive_connections=self.max_concurrency)
+        return httpx.AsyncClient(base_url=TIINGO_URL, headers=self.headers, limits=limits, **kwargs)
+
+    def parse_response(self, ticker, resample_freq, response):
         if response.is_error or "Error" in response.text:
             return f'Failed to retrieve data for {ticker} with the following response: "{response.text}".'
 
-        df = pd.read_csv(StringIO(response.text), sep=",")
+        return self.parse_csv(ticker, resample_freq, response.text)
+
+    """
+    Tiingo reports errors as JSON, even when CSV is requested
+    """
+    def is_error_response(self, response):
+        return response.is_error or response.headers.get("content-type", "").startswith("application/json")
+
+    """
+    Parses body chunks into a pyarrow Table of ROW_SCHEMA, or returns an error message if they are not a Tiingo CSV
+    """
+    def parse_arrow(self, ticker, resample_freq, chunks):
+        try:
+            return pa.Table.from_batches(list(read_batches(chunks, ticker, resample_freq)), schema=ROW_SCHEMA)
+
+        except (ValueError, pa.ArrowInvalid) as e:
+            return f'Failed to parse data for {ticker}: "{e}".'
+
+    def parse_csv(self, ticker, resample_freq, text):
+        df = pd.read_csv(StringIO(text), sep=",")
 
         df = df.rename(columns={
             'date': 'stock_datetime',
@@ -73,4 +420,123 @@ class TiingoCollector(EODCollector):
         df['id'] = [uuid.uuid4() for _ in range(len(df))]
         df = df[['id', 'ticker', 'resample_freq', 'stock_datetime', 'stock_adj_volume', 'stock_adj_open', 'stock_adj_close', 'stock_adj_high', 'stock_adj_low']]
 
-        return df
\ No newline at end of file
+        return df
+
+    """
+    Asynchronous collect_data. Gaps are fetched concurrently through one pooled httpx.AsyncClient,
+    bounded by max_concurrency and the request limits, while a single writer stores finished
+    fetches in a worker thread.
+
+    Parameters
+    ----------
+
+    tickers: []String
+        A list of tickers to collect
+
+    start_date: string
+        The date to begin data collection in the format YYYY-MM-DD
+
+    end_date: string
+        The date to end data collection in the format YYYY-MM-DD
+
+    resample_freq: resample_options.member
+        The interval between data collection instances
+
+    client: httpx.AsyncClient
+        Client to send requests through. Defaults to a new client from make_async_client.
+
+    Returns
+    -------
+
+    None
+
+    Raises
+    ------
+
+    Exception
+        After every other gap has been collected, if any gap failed to be retrieved or written
+    """
+    @instrumented("collect_data")
+    async def collect_data_async(self, tickers, start_date, end_date, resample_freq, client=None):
+        if self.derives(resample_freq):
+            periods = self.plan_derived(tickers, start_date, end_date, resample_freq)
+
+            for (start, end), group in periods.groupby(["start_date", "end_date"], sort=False):
+                await self.collect_data_async(group["ticker"].tolist(), start, end, "days", client=client)
+
+            return await asyncio.to_thread(self.write_derived, periods, resample_freq)
+
+        with timed(self.metrics, "domain"):
+            existing_domains = self.load_domains(tickers, resample_freq)
+            domain_table = DomainTable.from_domains({(ticker, resample_freq): domain for ticker, domain in existing_domains.items()}, calendar=self.calendar)
+            plan = domain_table.plan(start_date, end_date)
+
+        owns_client = client is None
+        if owns_client:
+            client = self.make_async_client()
+
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+        written = asyncio.Queue(maxsize=2 * self.max_concurrency)
+        failures = []
+
+        async def fetch(ticker, start, end):
+            start, end = self.date_to_str(start), self.date_to_str(end)
+
+            try:
+                async with semaphore:
+                    conditional_df = await self.retrieve_data_async(client, ticker, start, end, resample_freq)
+
+            except Exception as e:
+                conditional_df = f"Failed to retrieve data for {ticker}: {e}"
+
+            if isinstance(conditional_df, FRAME_TYPES):
+                await written.put((ticker, start, end, resample_freq, conditional_df))
+            else:
+                failures.append(conditional_df)
+
+        async def write():
+            while (item := await written.get()) is not None:
+                try:
+                    await asyncio.to_thread(self.write_data, *item)
+                except Exception as e:
+                    failures.append(f"Failed to write data for {item[0]}: {e}")
+
+        writer = asyncio.create_task(write())
+
+        try:
+            await asyncio.gather(*(fetch(*interval) for interval in plan))
+
+        finally:
+            await written.put(None)
+            await writer
+
+            try:
+                if self.pending_domains is None:
+                    await asyncio.to_thread(self.flush_data)
+            except Exception as e:
+                failures.append(f"Failed to flush buffered data: {e}")
+
+            if owns_client:
+                await client.aclose()
+
+        if failures:
+            raise Exception(f"Exception in collect_data_async: {len(failures)} of {len(plan)} gaps failed. " + " ".join(failures))
+
+
+"""
+Passes chunks through while adding the seconds spent waiting for each of them to received[0] and their size
+to received[1]
+"""
+def timed_chunks(chunks, received):
+    chunks = iter(chunks)
+
+    while True:
+        started = time.perf_counter()
+        chunk = next(chunks, None)
+        received[0] += time.perf_counter() - started
+
+        if chunk is None:
+            return
+
+        received[1] += len(chunk)
+        yield chunk
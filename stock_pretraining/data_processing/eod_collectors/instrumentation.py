@@ -0,0 +1,230 @@
+from contextlib import contextmanager, nullcontext
+from functools import wraps
+from pathlib import Path
+
+import inspect
+import json
+import os
+import threading
+import time
+
+#returned by timed when instrumentation is turned off, so untimed stages cost one function call
+NULL_TIMER = nullcontext()
+
+METRIC_PREFIX = "stock_pretraining_collector"
+
+class Metrics():
+    """
+    Counters and stage timers of the collection pipeline.
+
+    Every measurement is a named amount added to a running total. Stages timed with time add their
+    duration to <stage>_seconds and one to <stage>_calls. The collectors record
+
+        collect_data, set_data, delete_data: time spent in each call, including nested stages
+        http: waiting for Tiingo responses. http_requests, http_bytes and http_errors count them.
+        parse: turning response bodies into rows. rows_parsed counts the rows.
+        write: statements that store flushed rows or delete rows. rows_written and rows_deleted count the rows.
+        commit: commits, together with the domain writes run in the transaction of a flush
+        domain: loading, planning, merging and storing domains
+        cache_hits: responses served by the response cache
+        tickers_refreshed, tickers_failed: tickers of the batches a Refresher collected or failed to collect
+
+    Stages may overlap, so set_data time includes the http and parse time of its request. A stage timed while
+    the same thread is already timing it, for example a collect_data nested in derive_data, is counted once.
+
+    Each amount is also passed to every hook as hook(name, amount) when it is recorded, so measurements can
+    be forwarded elsewhere, for example to a statsd client. Hooks run in the thread that recorded the amount.
+
+    Parameters
+    ----------
+
+    hooks: [](string, float) -> None
+        Called with every recorded amount
+
+    exporter: MetricsExporter | None
+        Written to whenever the outermost timed stage exits, and every exporter.interval seconds
+
+    clock: () -> float
+        Monotonic clock in seconds
+    """
+    def __init__(self, hooks=(), exporter=None, clock=time.perf_counter):
+        self.hooks = list(hooks)
+        self.exporter = exporter
+        self.clock = clock
+
+        self.totals = {}
+        self.active = threading.local()
+        self.depth = 0
+        self.exported_at = clock()
+
+        #the async collector records from the event loop and from worker threads
+        self.lock = threading.Lock()
+
+    def add_hook(self, hook):
+        self.hooks.append(hook)
+
+    """
+    Adds amount to the total of name
+    """
+    def add(self, name, amount=1):
+        with self.lock:
+            self.totals[name] = self.totals.get(name, 0) + amount
+
+        for hook in self.hooks:
+            hook(name, amount)
+
+    """
+    Records one call of stage that took seconds, for stages timed by the caller, such as concurrent requests
+    """
+    def observe(self, stage, seconds):
+        self.add(f"{stage}_seconds", seconds)
+        self.add(f"{stage}_calls")
+
+    """
+    Times the block as one call of stage
+    """
+    @contextmanager
+    def time(self, stage):
+        stages = self.active.__dict__.setdefault("stages", set())
+        if stage in stages:
+            yield
+            return
+
+        stages.add(stage)
+        with self.lock:
+            self.depth += 1
+
+        start = self.clock()
+        try:
+            yield
+        finally:
+            stages.discard(stage)
+            self.observe(stage, self.clock() - start)
+
+            with self.lock:
+                self.depth -= 1
+                outermost = self.depth == 0
+
+            if self.exporter is not None and (outermost or self.exporter.due(self.clock() - self.exported_at)):
+                self.export()
+
+    def export(self):
+        self.exported_at = self.clock()
+        self.exporter.export(self.snapshot())
+
+    def snapshot(self):
+        with self.lock:
+            return dict(self.totals)
+
+    def reset(self):
+        with self.lock:
+            self.totals = {}
+
+
+class MetricsExporter():
+    """
+    Writes snapshots of Metrics to a file.
+
+    In "prometheus" format the file is replaced by every snapshot in the Prometheus text exposition format,
+    with every total as a counter named stock_pretraining_collector_<name>_total, so it can be read by the
+    node_exporter textfile collector. In "jsonl" format every snapshot is appended as one JSON line with a
+    timestamp.
+
+    Parameters
+    ----------
+
+    path: string | Path
+        File to write to
+
+    format: Enum("prometheus", "jsonl")
+
+    interval: float | None
+        If set, snapshots are also written every interval seconds while a stage is running, so long
+        backfills can be followed
+    """
+    def __init__(self, path, format="prometheus", interval=None):
+        assert format in ("prometheus", "jsonl"), f"invalid format {format}, expected 'prometheus' or 'jsonl'"
+
+        self.path = Path(path)
+        self.format = format
+        self.interval = interval
+
+    def due(self, elapsed):
+        return self.interval is not None and elapsed >= self.interval
+
+    def export(self, totals):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+
+        if self.format == "jsonl":
+            with open(self.path, "a") as file:
+                file.write(json.dumps({"timestamp": time.time(), "metrics": totals}) + "\n")
+            return
+
+        #replaced atomically, so a scrape never reads a partly written file
+        temporary = self.path.with_suffix(self.path.suffix + ".tmp")
+        with open(temporary, "w") as file:
+            file.write(to_prometheus(totals))
+
+        os.replace(temporary, self.path)
+
+
+"""
+Renders totals in the Prometheus text exposition format
+"""
+def to_prometheus(totals):
+    lines = []
+    for name, value in sorted(totals.items()):
+        metric = f"{METRIC_PREFIX}_{name}_total"
+        lines += [f"# TYPE {metric} counter", f"{metric} {value!r}"]
+
+    return "\n".join(lines) + "\n"
+
+
+"""
+Times a stage if metrics is set. Otherwise, returns a shared no-op context.
+"""
+def timed(metrics, stage):
+    return NULL_TIMER if metrics is None else metrics.time(stage)
+
+
+"""
+Decorates a method or coroutine method of an object with a metrics attribute, so every call is timed as stage
+"""
+def instrumented(stage):
+    def decorator(method):
+        if inspect.iscoroutinefunction(method):
+            @wraps(method)
+            async def coroutine_wrapper(self, *args, **kwargs):
+                if self.metrics is None:
+                    return await method(self, *args, **kwargs)
+
+                with self.metrics.time(stage):
+                    return await method(self, *args, **kwargs)
+
+            return coroutine_wrapper
+
+        @wraps(method)
+        def wrapper(self, *args, **kwargs):
+            if self.metrics is None:
+                return method(self, *args, **kwargs)
+
+            with self.metrics.time(stage):
+                return method(self, *args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+"""
+Returns the Metrics configured in set_config: metrics may be a Metrics instance or True, and metrics_path
+turns metrics on and exports them in metrics_format every metrics_interval seconds
+"""
+def metrics_from_config(metrics=None, metrics_path=None, metrics_format="prometheus", metrics_interval=None):
+    if metrics is True or (metrics is None and metrics_path):
+        metrics = Metrics()
+
+    if metrics and metrics_path:
+        metrics.exporter = MetricsExporter(metrics_path, format=metrics_format, interval=metrics_interval)
+
+    return metrics or None
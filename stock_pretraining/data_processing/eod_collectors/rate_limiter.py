@@ -0,0 +1,64 @@
+import asyncio
+import time
+
+class TokenBucket():
+    """
+    Allows up to capacity requests per period, refilling continuously.
+
+    The bucket starts full, so a fresh process may burst up to capacity requests.
+    """
+    def __init__(self, capacity, period, clock=time.monotonic):
+        self.capacity = capacity
+        self.rate = capacity / period
+        self.clock = clock
+
+        self.tokens = capacity
+        self.updated = clock()
+
+    def refill(self):
+        now = self.clock()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    """
+    Returns the number of seconds until a token is available
+    """
+    def wait_time(self):
+        self.refill()
+
+        if self.tokens >= 1:
+            return 0
+
+        return (1 - self.tokens) / self.rate
+
+    def take(self):
+        self.tokens -= 1
+
+
+class RateLimiter():
+    """
+    Waits until every bucket has a token, then takes one token from each.
+
+    Parameters
+    ----------
+
+    limits: [](int | None, float)
+        (requests, period in seconds) pairs. Limits set to None are ignored.
+
+    clock: () -> float
+        Monotonic clock in seconds
+
+    sleep: async (float) -> None
+        Coroutine used to wait for tokens
+    """
+    def __init__(self, limits, clock=time.monotonic, sleep=asyncio.sleep):
+        self.buckets = [TokenBucket(requests, period, clock=clock) for requests, period in limits if requests]
+        self.sleep = sleep
+
+    async def acquire(self):
+        #checking and taking tokens never yields to the event loop, so concurrent callers can not overdraw
+        while (wait := max((bucket.wait_time() for bucket in self.buckets), default=0)) > 0:
+            await self.sleep(wait)
+
+        for bucket in self.buckets:
+            bucket.take()
@@ -0,0 +1,199 @@
+from datetime import date, timedelta
+from pathlib import Path
+
+import asyncio
+import json
+import os
+import time
+
+class Refresher():
+    """
+    Brings the domains of a ticker universe up to a date by collecting only their missing tails.
+
+    The last covered date of every ticker is read from StockDomains. Tickers whose domains end on the
+    same date miss the same tail and are collected together in batches of batch_size, so the run never
+    plans or requests the ranges that are already covered. Gaps inside a domain are left alone.
+
+    After every batch, the finished tickers and the failures are written to checkpoint_path. A run
+    with the same end_date and resample_freq skips the tickers a previous run finished and retries the
+    failed ones, so an interrupted refresh resumes where it stopped.
+
+    Parameters
+    ----------
+
+    collector: EODCollector
+        The collector to refresh through
+
+    checkpoint_path: None | string | Path
+        JSON file to record progress in. Progress is not recorded if None.
+
+    batch_size: int
+        Number of tickers collected between checkpoints
+
+    use_async: bool
+        Collect batches with collector.collect_data_async
+
+    verbose: bool
+        Print progress and throughput after every batch. If the collector has metrics, the refreshed and failed
+        tickers of every batch are also counted as tickers_refreshed and tickers_failed.
+
+    clock: () -> float
+        Monotonic clock in seconds
+    """
+    def __init__(self, collector, checkpoint_path=None, batch_size=256, use_async=False, verbose=False, clock=time.perf_counter):
+        assert batch_size > 0, "batch_size must be positive"
+
+        self.collector = collector
+        self.checkpoint_path = None if checkpoint_path is None else Path(checkpoint_path)
+        self.batch_size = batch_size
+        self.use_async = use_async
+        self.verbose = verbose
+        self.clock = clock
+
+    """
+    Collects the missing tail of every ticker up to end_date
+
+    Parameters
+    ----------
+
+    tickers: []String
+        The universe to refresh
+
+    end_date: None | string
+        The date to refresh to in the format YYYY-MM-DD. Defaults to the current day.
+
+    resample_freq: resample_options.member
+        The resample frequency to refresh
+
+    start_date: None | string
+        The date to begin collection for tickers without a domain. Those tickers are skipped if None.
+
+    Returns
+    -------
+
+    report: dict
+        refreshed: number of tickers whose tail was collected in this run, including failed ones
+        up_to_date: number of tickers that were already covered up to end_date or finished by an earlier run
+        skipped: tickers without a domain, if start_date is None
+        failed: dict(String -> String), the error of every ticker whose batch failed
+        seconds: duration of the run
+        tickers_per_second: refreshed tickers per second
+    """
+    def run(self, tickers, end_date=None, resample_freq="days", start_date=None):
+        started = self.clock()
+        end_date = end_date or date.today().isoformat()
+
+        checkpoint = self.load_checkpoint(end_date, resample_freq)
+        done, failed = set(checkpoint["done"]), dict(checkpoint["failed"])
+
+        tickers = list(dict.fromkeys(tickers))
+        pending = [ticker for ticker in tickers if ticker not in done]
+        tails, skipped = self.tails(pending, end_date, resample_freq, start_date)
+
+        outdated = {ticker for group in tails.values() for ticker in group}.union(skipped)
+        up_to_date = [ticker for ticker in pending if ticker not in outdated]
+        done.update(up_to_date)
+
+        total = sum(len(group) for group in tails.values())
+        refreshed = 0
+
+        for tail_start in sorted(tails):
+            group = tails[tail_start]
+
+            for i in range(0, len(group), self.batch_size):
+                batch = group[i:i + self.batch_size]
+
+                try:
+                    self.collect(batch, tail_start, end_date, resample_freq)
+                    done.update(batch)
+                    for ticker in batch:
+                        failed.pop(ticker, None)
+
+                    self.count("tickers_refreshed", len(batch))
+
+                except Exception as e:
+                    failed.update({ticker: str(e) for ticker in batch})
+                    self.count("tickers_failed", len(batch))
+
+                refreshed += len(batch)
+                self.save_checkpoint(end_date, resample_freq, done, failed)
+
+                if self.verbose:
+                    print(f"Refreshed {refreshed}/{total} tickers ({throughput(refreshed, self.clock() - started):.1f} tickers/s)")
+
+        self.save_checkpoint(end_date, resample_freq, done, failed)
+        seconds = self.clock() - started
+
+        return {
+            "refreshed": refreshed,
+            "up_to_date": len(tickers) - len(pending) + len(up_to_date),
+            "skipped": skipped,
+            "failed": failed,
+            "seconds": seconds,
+            "tickers_per_second": throughput(refreshed, seconds),
+        }
+
+    """
+    Groups tickers by the first date their domain is missing before end_date
+
+    Returns
+    -------
+
+    tails: dict(string -> []String)
+        Tickers by the start of their missing tail in the format YYYY-MM-DD
+
+    skipped: []String
+        Tickers without a domain, if start_date is None
+    """
+    def tails(self, tickers, end_date, resample_freq, start_date=None):
+        #read the stored domains rather than the cache, which another process may have outdated
+        domains = self.collector.load_domains(tickers, resample_freq, refresh=True)
+        end_ordinal = date.fromisoformat(end_date).toordinal()
+
+        tails, skipped = {}, []
+        for ticker, domain in domains.items():
+            if domain.is_null:
+                if start_date is None:
+                    skipped.append(ticker)
+                else:
+                    tails.setdefault(start_date, []).append(ticker)
+
+            elif domain.ends[-1] < end_ordinal:
+                tails.setdefault((date.fromordinal(domain.ends[-1]) + timedelta(days=1)).isoformat(), []).append(ticker)
+
+        return tails, skipped
+
+    def collect(self, tickers, start_date, end_date, resample_freq):
+        if self.use_async:
+            asyncio.run(self.collector.collect_data_async(tickers, start_date, end_date, resample_freq))
+        else:
+            self.collector.collect_data(tickers, start_date, end_date, resample_freq)
+
+    def count(self, name, tickers):
+        if self.collector.metrics is not None:
+            self.collector.metrics.add(name, tickers)
+
+    """
+    Reads the progress of an earlier run with the same end_date and resample_freq
+    """
+    def load_checkpoint(self, end_date, resample_freq):
+        if self.checkpoint_path is not None and self.checkpoint_path.exists():
+            checkpoint = json.loads(self.checkpoint_path.read_text())
+
+            if (checkpoint["end_date"], checkpoint["resample_freq"]) == (end_date, resample_freq):
+                return checkpoint
+
+        return {"end_date": end_date, "resample_freq": resample_freq, "done": [], "failed": {}}
+
+    def save_checkpoint(self, end_date, resample_freq, done, failed):
+        if self.checkpoint_path is None:
+            return
+
+        #replace the file in one step, so an interruption never leaves a partial checkpoint
+        temporary = self.checkpoint_path.with_suffix(f".{os.getpid()}.tmp")
+        temporary.write_text(json.dumps({"end_date": end_date, "resample_freq": resample_freq, "done": sorted(done), "failed": failed}))
+        os.replace(temporary, self.checkpoint_path)
+
+
+def throughput(tickers, seconds):
+    return tickers / seconds if seconds > 0 else 0.0
@@ -0,0 +1,121 @@
+import pandas as pd
+
+#resample frequencies that can be built from daily rows, and their pandas period codes
+DERIVED_FREQS = {
+    "months": "M",
+    "years": "Y",
+}
+
+VALUE_AGGREGATIONS = {
+    "stock_adj_open": "first",
+    "stock_adj_high": "max",
+    "stock_adj_low": "min",
+    "stock_adj_close": "last",
+    "stock_adj_volume": "sum",
+}
+
+"""
+Widens intervals to the whole periods they touch and merges the periods of each ticker
+
+Parameters
+----------
+
+intervals: [](string, datetime.datetime, datetime.datetime)
+    (ticker, start, end) intervals, for example DomainTable.intervals()
+
+resample_freq: Enum("months", "years")
+    The period length
+
+last_date: None | datetime.date
+    Periods are cut off after this date, so the period that contains it is only covered up to it
+
+Returns
+-------
+
+periods: pd.DataFrame
+    ticker, start_date, end_date columns, with dates as YYYY-MM-DD strings, sorted by ticker and start_date
+"""
+def covering_periods(intervals, resample_freq, last_date=None):
+    code = DERIVED_FREQS[resample_freq]
+    periods = pd.DataFrame(intervals, columns=["ticker", "start_date", "end_date"])
+
+    periods["start_date"] = pd.to_datetime(periods["start_date"]).dt.to_period(code).dt.start_time
+    periods["end_date"] = pd.to_datetime(periods["end_date"]).dt.to_period(code).dt.end_time.dt.normalize()
+
+    if last_date is not None:
+        periods["end_date"] = periods["end_date"].clip(upper=pd.Timestamp(last_date))
+        periods = periods[periods["start_date"] <= periods["end_date"]]
+
+    periods = periods.sort_values(["ticker", "start_date"], ignore_index=True)
+
+    #a run of periods continues while a start is at most one day after every earlier end of the ticker
+    reach = periods.groupby("ticker", sort=False)["end_date"].cummax()
+    new_run = (periods["ticker"] != periods["ticker"].shift()) | (periods["start_date"] > reach.shift() + pd.Timedelta(days=1))
+
+    periods = periods.groupby(new_run.cumsum(), sort=False).agg(ticker=("ticker", "first"), start_date=("start_date", "min"), end_date=("end_date", "max"))
+    periods["start_date"] = periods["start_date"].dt.strftime("%Y-%m-%d")
+    periods["end_date"] = periods["end_date"].dt.strftime("%Y-%m-%d")
+
+    return periods.reset_index(drop=True)
+
+
+"""
+Aggregates daily rows into one OHLCV bar per ticker and period
+
+The bar opens at the first open and closes at the last close of the period, spans the highest high and
+lowest low, and sums the volume. It is dated on the last day of the period with a daily row.
+
+Parameters
+----------
+
+rows: pd.DataFrame
+    Daily rows with ticker, stock_datetime and the adjusted value columns
+
+resample_freq: Enum("months", "years")
+    The period length
+
+Returns
+-------
+
+bars: pd.DataFrame
+    ticker, resample_freq, stock_datetime and the adjusted value columns, sorted by ticker and stock_datetime
+"""
+def resample_bars(rows, resample_freq):
+    rows = rows.sort_values(["ticker", "stock_datetime"], ignore_index=True)
+    period = pd.to_datetime(rows["stock_datetime"]).dt.to_period(DERIVED_FREQS[resample_freq])
+
+    aggregations = {"stock_datetime": ("stock_datetime", "last")}
+    aggregations.update({column: (column, function) for column, function in VALUE_AGGREGATIONS.items()})
+
+    bars = rows.groupby([rows["ticker"], period.rename("period")], sort=False).agg(**aggregations)
+    bars = bars.reset_index(level="ticker").reset_index(drop=True)
+    bars.insert(1, "resample_freq", resample_freq)
+
+    return bars
+
+
+"""
+Keeps the rows that lie in one of the periods of their ticker
+
+Parameters
+----------
+
+rows: pd.DataFrame
+    Rows with ticker and stock_datetime columns
+
+periods: pd.DataFrame
+    ticker, start_date, end_date columns, as returned by covering_periods
+
+Returns
+-------
+
+rows: pd.DataFrame
+    The matching rows, with the columns of rows
+"""
+def within_periods(rows, periods):
+    matched = rows.reset_index(drop=True).merge(periods, on="ticker")
+    dates = pd.to_datetime(matched["stock_datetime"])
+    inside = (pd.to_datetime(matched["start_date"]) <= dates) & (dates <= pd.to_datetime(matched["end_date"]))
+
+    #the periods of a ticker are merged, so a row lies in at most one of them
+    return matched.loc[inside, rows.columns].reset_index(drop=True)
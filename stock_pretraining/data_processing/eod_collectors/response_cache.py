@@ -0,0 +1,143 @@
+from datetime import date
+from pathlib import Path
+
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+import zlib
+
+class ResponseCache():
+    """
+    An on-disk cache of successful CSV responses keyed by (ticker, start_date, end_date, resample_freq).
+
+    Bodies are stored zlib compressed under the SHA-256 of their content, so identical responses share a
+    file, and an SQLite index maps request keys to bodies. A response whose range ended before the day it
+    was fetched is historical and stays valid until it is evicted. A response whose range reached the
+    day it was fetched may still change and expires after ttl seconds. Once the stored bodies exceed
+    max_bytes, the least recently used entries are evicted.
+
+    Daily requests are also served from any valid entry whose range covers them, by dropping the rows
+    outside the requested range. Other frequencies only match exactly, since their bars depend on the
+    requested range.
+
+    Parameters
+    ----------
+
+    directory: string | Path
+        Directory to store the cache in
+
+    max_bytes: int
+        Maximum total size of the compressed bodies
+
+    ttl: float
+        Seconds a response that reaches the day it was fetched stays valid
+
+    clock: () -> float
+        Wall clock in seconds since the epoch
+    """
+    def __init__(self, directory, max_bytes=1 << 30, ttl=3600, clock=time.time):
+        self.directory = Path(directory)
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.clock = clock
+
+        (self.directory / "bodies").mkdir(parents=True, exist_ok=True)
+
+        #the async collector reads and writes the cache from worker threads
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(self.directory / "index.sqlite", check_same_thread=False, isolation_level=None)
+        self.connection.execute("""
+            CREATE TABLE IF NOT EXISTS responses (
+                ticker TEXT, resample_freq TEXT, start_date TEXT, end_date TEXT,
+                digest TEXT, size INTEGER, fetched_date TEXT, fetched_at REAL, accessed_at REAL,
+                PRIMARY KEY (ticker, resample_freq, start_date, end_date)
+            )
+        """)
+
+    """
+    Returns the cached body of a request, or None if no valid entry matches it
+    """
+    def get(self, ticker, start_date, end_date, resample_freq):
+        now = self.clock()
+
+        with self.lock:
+            query = "SELECT start_date, end_date, digest FROM responses WHERE ticker = ? AND resample_freq = ? AND (end_date < fetched_date OR fetched_at >= ?) AND "
+            if resample_freq == "days":
+                query += "start_date <= ? AND end_date >= ? ORDER BY julianday(end_date) - julianday(start_date) LIMIT 1"
+            else:
+                query += "start_date = ? AND end_date = ?"
+
+            row = self.connection.execute(query, (ticker, resample_freq, now - self.ttl, start_date, end_date)).fetchone()
+            if row is None:
+                return None
+
+            cached_start, cached_end, digest = row
+            self.connection.execute("UPDATE responses SET accessed_at = ? WHERE ticker = ? AND resample_freq = ? AND start_date = ? AND end_date = ?", (now, ticker, resample_freq, cached_start, cached_end))
+
+        try:
+            body = zlib.decompress(self.body_path(digest).read_bytes()).decode()
+        except FileNotFoundError:
+            return None
+
+        if (cached_start, cached_end) == (start_date, end_date):
+            return body
+
+        return select_dates(body, start_date, end_date)
+
+    """
+    Stores the body of a successful response
+    """
+    def put(self, ticker, start_date, end_date, resample_freq, body):
+        now = self.clock()
+        data = zlib.compress(body.encode())
+        digest = hashlib.sha256(data).hexdigest()
+
+        path = self.body_path(digest)
+        if not path.exists():
+            path.parent.mkdir(exist_ok=True)
+            temporary = path.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+            temporary.write_bytes(data)
+            os.replace(temporary, path)
+
+        with self.lock:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (ticker, resample_freq, start_date, end_date, digest, len(data), date.fromtimestamp(now).isoformat(), now, now)
+            )
+            self.evict()
+
+    """
+    Removes least recently used entries until the bodies fit in max_bytes
+    """
+    def evict(self):
+        stored = self.connection.execute("SELECT COALESCE(SUM(size), 0) FROM (SELECT DISTINCT digest, size FROM responses)").fetchone()[0]
+        if stored <= self.max_bytes:
+            return
+
+        for ticker, resample_freq, start_date, end_date, digest, size in self.connection.execute("SELECT ticker, resample_freq, start_date, end_date, digest, size FROM responses ORDER BY accessed_at").fetchall():
+            self.connection.execute("DELETE FROM responses WHERE ticker = ? AND resample_freq = ? AND start_date = ? AND end_date = ?", (ticker, resample_freq, start_date, end_date))
+
+            if self.connection.execute("SELECT 1 FROM responses WHERE digest = ? LIMIT 1", (digest,)).fetchone() is None:
+                self.body_path(digest).unlink(missing_ok=True)
+                stored -= size
+
+            if stored <= self.max_bytes:
+                return
+
+    def body_path(self, digest):
+        return self.directory / "bodies" / digest[:2] / f"{digest}.zlib"
+
+    def close(self):
+        self.connection.close()
+
+
+"""
+Keeps the header and the rows of a CSV body whose leading YYYY-MM-DD date lies in [start_date, end_date]
+"""
+def select_dates(body, start_date, end_date):
+    header, _, rows = body.partition("\n")
+    selected = [row for row in rows.splitlines() if start_date <= row[:10] <= end_date]
+
+    return "\n".join([header] + selected) + "\n"
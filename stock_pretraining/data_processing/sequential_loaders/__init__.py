@@ -1 +1,6 @@
-from .sequential_loader import SequentialLoader
\ No newline at end of file
+from .sequential_loader import SequentialLoader
+from .parquet_mirror import ParquetMirror
+from .panel_store import PanelStore
+from .window_index import WindowIndex, PanelWindows
+from .feature_store import FeatureStore
+from .token_corpus import TokenCorpus, TokenWindows
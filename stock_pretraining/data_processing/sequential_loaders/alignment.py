@@ -0,0 +1,79 @@
+from stock_pretraining.data_processing.utils import EPOCH_ORDINAL
+
+from datetime import date
+
+import numpy as np
+import pandas as pd
+
+"""
+Aligns the rows of many tickers on a shared date axis with a single scatter
+
+Parameters
+----------
+
+rows: pd.DataFrame
+    Rows shaped like the result of SequentialLoader.load_rows
+
+tickers: []string
+    The ticker axis. Rows of other tickers are ignored.
+
+columns: []string
+    The value columns to align
+
+outer_join: bool
+    Keep every date that any ticker has a row for. Otherwise only dates every ticker has a row for are kept.
+
+ffill: bool
+    Fill missing values with the last earlier value of the same ticker. Values before a ticker's first row
+    stay NaN.
+
+Returns
+-------
+
+dates: []datetime.date
+    The date axis
+
+values: np.ndarray
+    [date x ticker x column] float32 values, NaN where no row is stored unless filled
+
+mask: np.ndarray
+    [date x ticker] bool, True where a row is stored
+"""
+def align(rows, tickers, columns, outer_join=False, ffill=False):
+    ticker_ids = pd.Index(tickers).get_indexer(rows["ticker"])
+    rows, ticker_ids = rows[ticker_ids >= 0], ticker_ids[ticker_ids >= 0]
+
+    ordinals, date_ids = np.unique(to_ordinals(rows["stock_datetime"]), return_inverse=True)
+
+    values = np.full((len(ordinals), len(tickers), len(columns)), np.nan, dtype=np.float32)
+    mask = np.zeros((len(ordinals), len(tickers)), dtype=bool)
+    values[date_ids, ticker_ids] = rows[columns].to_numpy(dtype=np.float32)
+    mask[date_ids, ticker_ids] = True
+
+    if not outer_join:
+        shared = mask.all(axis=1)
+        ordinals, values, mask = ordinals[shared], values[shared], mask[shared]
+
+    if ffill:
+        values = forward_fill(values, mask)
+
+    return [date.fromordinal(ordinal) for ordinal in ordinals.tolist()], values, mask
+
+
+"""
+Carries the last stored row of every ticker forward over the dates it has no row for
+"""
+def forward_fill(values, mask):
+    #for every (date, ticker), the position of the latest date at or before it with a stored row
+    latest = np.where(mask, np.arange(len(mask))[:, None], 0)
+    np.maximum.accumulate(latest, axis=0, out=latest)
+
+    filled = values[latest, np.arange(mask.shape[1])[None, :]]
+    filled[~np.maximum.accumulate(mask, axis=0)] = np.nan
+
+    return filled
+
+
+def to_ordinals(dates):
+    days = pd.to_datetime(pd.Series(dates, dtype=object)).to_numpy(dtype="datetime64[D]")
+    return days.astype(np.int64) + EPOCH_ORDINAL
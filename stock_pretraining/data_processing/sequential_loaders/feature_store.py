@@ -0,0 +1,309 @@
+from stock_pretraining.data_processing.domain_table import DomainTable
+from stock_pretraining.data_processing.sequential_loaders.alignment import to_ordinals
+
+from datetime import date
+from pathlib import Path
+
+import json
+import os
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+#the stock_data columns features are computed from, stored next to the features as the lookback of later updates
+INPUT_COLUMNS = ["stock_adj_close", "stock_adj_volume"]
+
+class FeatureStore():
+    """
+    A columnar cache of features derived from stock_data, stored as one Parquet file per ticker.
+
+    Features are named and computed with vectorized pandas operations over every ticker at once:
+
+        log_return: log of the ratio of a close to the previous close
+        log_volume: log(1 + volume)
+        return_zscore_<window>: z-score of log_return over the last window rows, for every window in windows
+        volume_zscore_<window>: z-score of log_volume over the last window rows, for every window in windows
+
+    The domain every ticker's features were computed from is kept in root/features.json. When update finds
+    that a domain changed, only the rows from the first changed date onwards are recomputed. They are
+    computed together with the lookback rows before that date that the longest window reads, which are
+    taken from the cache, so the result is identical to recomputing the whole history.
+
+    Parameters
+    ----------
+
+    root: string | Path
+        Directory of the store. Created on the first update.
+
+    windows: []int
+        Lengths of the rolling z-score windows in rows
+    """
+    def __init__(self, root, windows=(20,)):
+        assert all(window > 1 for window in windows), "windows must be longer than one row"
+
+        self.root = Path(root)
+        self.windows = sorted(set(windows))
+
+    @property
+    def meta_path(self):
+        return self.root / "features.json"
+
+    @property
+    def features(self):
+        return ["log_return", "log_volume"] + [f"{name}_zscore_{window}" for window in self.windows for name in ("return", "volume")]
+
+    """
+    Number of rows before a date that features on that date depend on. The z-score of window log returns
+    reads window closes before the current one.
+    """
+    @property
+    def lookback(self):
+        return max([1] + self.windows)
+
+    """
+    Loads the domains the cached features were computed from
+
+    Returns
+    -------
+
+    domains: DomainTable
+    """
+    def load_domains(self):
+        meta = self.load_meta()
+        return DomainTable.from_domains({(ticker, resample_freq): mapping for ticker, resample_freq, mapping in meta["domains"]})
+
+    def load_meta(self):
+        if not self.meta_path.exists():
+            return {"windows": self.windows, "domains": []}
+
+        with open(self.meta_path) as file:
+            return json.load(file)
+
+    """
+    Brings the features of tickers up to date with the domains served by a SequentialLoader
+
+    Parameters
+    ----------
+
+    loader: SequentialLoader
+        Source of rows and domains
+
+    tickers: []string
+
+    resample_freq: resample_options.member
+
+    chunk_tickers: int
+        Number of tickers loaded at once
+
+    Returns
+    -------
+
+    rows: int
+        The number of recomputed rows
+    """
+    def update(self, loader, tickers, resample_freq="days", chunk_tickers=256):
+        meta = self.load_meta()
+        cached = self.load_domains()
+
+        #features computed with other windows can not be reused
+        rebuild = meta["windows"] != self.windows
+
+        tickers = list(dict.fromkeys(tickers))
+        current = {}
+        rows = 0
+
+        for i in range(0, len(tickers), chunk_tickers):
+            keys = [(ticker, resample_freq) for ticker in tickers[i:i + chunk_tickers]]
+            domains = DomainTable.from_domains({key: domain for key, domain in zip(keys, loader.get_domains([ticker for ticker, _ in keys], resample_freq).values())})
+
+            starts = changed_from(DomainTable().select(keys) if rebuild else cached.select(keys), domains.select(keys))
+            if starts:
+                rows += self.recompute(loader, starts, int(domains.ends.max(initial=min(starts.values()))), resample_freq)
+
+            current.update(domains.domains())
+
+        if rebuild:
+            cached = DomainTable()
+
+        self.write_meta(cached.update(current))
+
+        return rows
+
+    """
+    Recomputes the features of every ticker from its changed date onwards
+
+    Parameters
+    ----------
+
+    starts: dict(string -> int)
+        The day ordinal of the first changed date of each ticker
+
+    last: int
+        The day ordinal of the last date in any of their domains
+    """
+    def recompute(self, loader, starts, last, resample_freq):
+        rows = loader.load_rows(list(starts), date.fromordinal(min(starts.values())), date.fromordinal(last), resample_freq, columns=INPUT_COLUMNS)
+        rows = rows[to_ordinals(rows["stock_datetime"]) >= np.array([starts[ticker] for ticker in rows["ticker"]], dtype=np.int64)]
+
+        #prepend the cached rows each ticker's windows read before its changed date
+        kept, contexts = {}, []
+        for ticker, start in starts.items():
+            path = self.path(ticker, resample_freq)
+            if not path.exists():
+                continue
+
+            cached = pq.read_table(path).to_pandas()
+            kept[ticker] = cached[to_ordinals(cached["stock_datetime"]) < start]
+            contexts.append(kept[ticker].tail(self.lookback)[["stock_datetime"] + INPUT_COLUMNS].assign(ticker=ticker))
+
+        combined = pd.concat(contexts + [rows[["ticker", "stock_datetime"] + INPUT_COLUMNS]], ignore_index=True)
+        combined = combined.sort_values(["ticker", "stock_datetime"], kind="stable", ignore_index=True)
+        computed = compute_features(combined, self.windows)
+
+        for ticker in starts:
+            new = computed[computed["ticker"] == ticker].drop(columns="ticker")
+            previous = kept.get(ticker)
+
+            if previous is not None and len(previous):
+                new = pd.concat([previous, new[to_ordinals(new["stock_datetime"]) >= starts[ticker]]], ignore_index=True)
+
+            self.write_ticker(self.path(ticker, resample_freq), new)
+
+        return len(rows)
+
+    """
+    Reads cached features
+
+    Parameters
+    ----------
+
+    tickers: []string
+
+    start_date: datetime.date | string
+
+    end_date: datetime.date | string
+
+    resample_freq: resample_options.member
+
+    columns: []string | None
+        The features to read. Defaults to every feature.
+
+    Returns
+    -------
+
+    rows: pd.DataFrame
+        ticker, resample_freq, stock_datetime and the requested features, ordered by ticker and stock_datetime
+    """
+    def read(self, tickers, start_date, end_date, resample_freq="days", columns=None):
+        columns = list(self.features if columns is None else columns)
+        unknown = [column for column in columns if column not in self.features]
+        assert not unknown, f"Unknown features {', '.join(unknown)}. Available features are {', '.join(self.features)}"
+
+        start, end = to_ordinals([start_date, end_date]).tolist()
+        frames = []
+
+        for ticker in sorted(dict.fromkeys(tickers)):
+            path = self.path(ticker, resample_freq)
+            if not path.exists():
+                continue
+
+            df = pq.read_table(path, columns=["stock_datetime"] + columns).to_pandas()
+            ordinals = to_ordinals(df["stock_datetime"])
+            df = df[(start <= ordinals) & (ordinals <= end)]
+
+            df.insert(0, "resample_freq", resample_freq)
+            df.insert(0, "ticker", ticker)
+            frames.append(df)
+
+        if not frames:
+            return pd.DataFrame({column: pd.Series(dtype=object if column in ("ticker", "resample_freq", "stock_datetime") else float) for column in ["ticker", "resample_freq", "stock_datetime"] + columns})
+
+        return pd.concat(frames, ignore_index=True)
+
+    def path(self, ticker, resample_freq):
+        return self.root / f"resample_freq={resample_freq}" / f"ticker={ticker}" / "features.parquet"
+
+    """
+    Atomically replaces the file of a ticker, or removes it if no rows are left
+    """
+    def write_ticker(self, path, df):
+        if len(df) == 0:
+            path.unlink(missing_ok=True)
+            return
+
+        df = df.assign(stock_datetime=pd.to_datetime(df["stock_datetime"]).dt.date)
+        schema = pa.schema([("stock_datetime", pa.date32())] + [(column, pa.float64()) for column in INPUT_COLUMNS + self.features])
+
+        path.parent.mkdir(parents=True, exist_ok=True)
+        temporary = path.with_suffix(".parquet.tmp")
+
+        pq.write_table(pa.Table.from_pandas(df[schema.names], schema=schema, preserve_index=False), temporary)
+        os.replace(temporary, path)
+
+    def write_meta(self, domains):
+        self.root.mkdir(parents=True, exist_ok=True)
+        temporary = self.meta_path.with_suffix(".json.tmp")
+
+        with open(temporary, "w") as file:
+            json.dump({
+                "windows": self.windows,
+                "domains": [[ticker, resample_freq, domain.string] for (ticker, resample_freq), domain in domains.domains().items() if not domain.is_null],
+            }, file)
+
+        os.replace(temporary, self.meta_path)
+
+
+"""
+Computes every feature of rows ordered by ticker and stock_datetime. Windows never cross tickers.
+
+Parameters
+----------
+
+rows: pd.DataFrame
+    ticker, stock_datetime and INPUT_COLUMNS
+
+windows: []int
+
+Returns
+-------
+
+features: pd.DataFrame
+    rows with a column for every feature. Features without enough earlier rows are NaN.
+"""
+def compute_features(rows, windows):
+    ticker = rows["ticker"]
+    close = rows["stock_adj_close"].astype(np.float64)
+
+    features = rows.copy()
+    features["log_return"] = np.log(close).groupby(ticker).diff()
+    features["log_volume"] = np.log1p(rows["stock_adj_volume"].astype(np.float64))
+
+    for window in windows:
+        for name, column in (("return", "log_return"), ("volume", "log_volume")):
+            rolling = features[column].groupby(ticker).rolling(window, min_periods=window)
+            mean = rolling.mean().reset_index(level=0, drop=True)
+            std = rolling.std(ddof=0).reset_index(level=0, drop=True)
+
+            features[f"{name}_zscore_{window}"] = ((features[column] - mean) / std.replace(0.0, np.nan)).sort_index()
+
+    return features
+
+
+"""
+Finds the first date where the domains of two tables with the same keys differ
+
+Returns
+-------
+
+starts: dict(string -> int)
+    The day ordinal of the first changed date of every ticker whose domain changed
+"""
+def changed_from(previous, current):
+    first = np.full(len(current.keys), np.iinfo(np.int64).max, dtype=np.int64)
+
+    for changes in (current - previous, previous - current):
+        np.minimum.at(first, changes.rows, changes.starts)
+
+    return {ticker: int(start) for (ticker, _), start in zip(current.keys, first.tolist()) if start != np.iinfo(np.int64).max}
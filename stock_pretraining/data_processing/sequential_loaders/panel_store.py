@@ -0,0 +1,201 @@
+from stock_pretraining.data_processing.sequential_loaders.parquet_mirror import VALUE_COLUMNS
+from stock_pretraining.data_processing.sparsity_mapping import SparsityMappingString
+from stock_pretraining.data_processing.sequential_loaders.alignment import to_ordinals
+
+from datetime import date
+from pathlib import Path
+
+import json
+
+import numpy as np
+import pandas as pd
+
+class PanelStore():
+    """
+    A dense [ticker x date x feature] float32 cube and a [ticker x date] validity mask stored as .npy files.
+
+    The files are opened as copy-on-write memory maps, so worker processes that open the same store share
+    its pages through the OS page cache and only read the pages they touch. A store may be passed to
+    DataLoader workers: the memory maps are reopened in each process instead of being pickled.
+
+    mask[t, d] is True if dates[d] lies in the domain of tickers[t] and a row is stored for it. Every other
+    value is NaN. The domains the store was built from are kept in domains as sparsity mapping strings.
+
+    Parameters
+    ----------
+
+    path: string | Path
+        Directory written by PanelStore.build
+    """
+    def __init__(self, path):
+        self.path = Path(path)
+
+        with open(self.path / "meta.json") as file:
+            meta = json.load(file)
+
+        self.tickers = meta["tickers"]
+        self.features = meta["features"]
+        self.resample_freq = meta["resample_freq"]
+        self.dates = [date.fromisoformat(value) for value in meta["dates"]]
+        self.domains = meta.get("domains", {})
+
+        self.ticker_index = {ticker: i for i, ticker in enumerate(self.tickers)}
+        self._values = None
+        self._mask = None
+
+    def __getstate__(self):
+        return {**self.__dict__, "_values": None, "_mask": None}
+
+    @property
+    def values(self):
+        if self._values is None:
+            self._values = np.load(self.path / "values.npy", mmap_mode="c")
+
+        return self._values
+
+    @property
+    def mask(self):
+        if self._mask is None:
+            self._mask = np.load(self.path / "mask.npy", mmap_mode="c")
+
+        return self._mask
+
+    @property
+    def shape(self):
+        return (len(self.tickers), len(self.dates), len(self.features))
+
+    """
+    Returns a window of one ticker as tensors that share memory with the store
+
+    Parameters
+    ----------
+
+    ticker: string | int
+        A ticker or its position in tickers
+
+    start: int
+        Position of the first date in dates
+
+    length: int
+        Number of dates in the window
+
+    Returns
+    -------
+
+    values, mask: torch.Tensor, torch.Tensor
+        [length x feature] float32 values and a [length] bool mask
+    """
+    def window(self, ticker, start, length):
+        import torch
+
+        row = self.ticker_index[ticker] if isinstance(ticker, str) else ticker
+        return torch.from_numpy(self.values[row, start:start + length]), torch.from_numpy(self.mask[row, start:start + length])
+
+    """
+    Writes a panel store from the rows served by a SequentialLoader
+
+    Rows are read in two passes. The first reads only dates to build the date axis, and the second
+    scatters the values of chunk_tickers tickers at a time, so memory is bounded by one chunk of rows.
+
+    Parameters
+    ----------
+
+    path: string | Path
+        Directory to write the store to
+
+    loader: SequentialLoader
+        Source of rows and domains
+
+    tickers: []string
+
+    start_date: string
+
+    end_date: string
+
+    resample_freq: resample_options.member
+
+    features: []string
+        The value columns to store. Defaults to every column of stock_data other than id.
+
+    chunk_tickers: int
+        Number of tickers loaded at once
+
+    Returns
+    -------
+
+    store: PanelStore
+    """
+    @classmethod
+    def build(cls, path, loader, tickers, start_date, end_date, resample_freq="days", features=None, chunk_tickers=256):
+        path = Path(path)
+        path.mkdir(parents=True, exist_ok=True)
+
+        tickers = list(dict.fromkeys(tickers))
+        features = list(VALUE_COLUMNS if features is None else features)
+        chunks = [tickers[i:i + chunk_tickers] for i in range(0, len(tickers), chunk_tickers)]
+
+        ordinals = np.unique(np.concatenate([
+            to_ordinals(loader.load_rows(chunk, start_date, end_date, resample_freq, columns=[])["stock_datetime"]) for chunk in chunks
+        ] or [np.array([], dtype=np.int64)]))
+
+        values = np.lib.format.open_memmap(path / "values.npy", mode="w+", dtype=np.float32, shape=(len(tickers), len(ordinals), len(features)))
+        mask = np.lib.format.open_memmap(path / "mask.npy", mode="w+", dtype=np.bool_, shape=(len(tickers), len(ordinals)))
+
+        stored_domains = {}
+        offset = 0
+        for chunk in chunks:
+            rows = loader.load_rows(chunk, start_date, end_date, resample_freq, columns=features)
+            domains = loader.get_domains(chunk, resample_freq)
+
+            ticker_rows = pd.Index(chunk).get_indexer(rows["ticker"])
+            date_columns = np.searchsorted(ordinals, to_ordinals(rows["stock_datetime"]))
+
+            covered = np.zeros((len(chunk), len(ordinals)), dtype=bool)
+            for i, ticker in enumerate(chunk):
+                covered[i] = domain_mask(domains[ticker], ordinals)
+                stored_domains[ticker] = str(domains[ticker])
+
+            block = np.full((len(chunk), len(ordinals), len(features)), np.nan, dtype=np.float32)
+            present = np.zeros((len(chunk), len(ordinals)), dtype=bool)
+            block[ticker_rows, date_columns] = rows[features].to_numpy(dtype=np.float32)
+            present[ticker_rows, date_columns] = True
+
+            valid = covered & present
+            block[~valid] = np.nan
+
+            values[offset:offset + len(chunk)] = block
+            mask[offset:offset + len(chunk)] = valid
+            offset += len(chunk)
+
+        values.flush()
+        mask.flush()
+        del values, mask
+
+        with open(path / "meta.json", "w") as file:
+            json.dump({
+                "tickers": tickers,
+                "features": features,
+                "resample_freq": resample_freq,
+                "dates": [date.fromordinal(ordinal).isoformat() for ordinal in ordinals.tolist()],
+                "domains": stored_domains,
+            }, file)
+
+        return cls(path)
+
+
+"""
+Marks the day ordinals that lie in a domain
+"""
+def domain_mask(domain, ordinals):
+    if not isinstance(domain, SparsityMappingString):
+        domain = SparsityMappingString("days", string=domain)
+
+    if domain.is_null:
+        return np.zeros(len(ordinals), dtype=bool)
+
+    #the last interval starting at or before each ordinal is the only one that can contain it
+    interval = np.searchsorted(np.asarray(domain.starts, dtype=np.int64), ordinals, side="right") - 1
+    ends = np.asarray(domain.ends, dtype=np.int64)
+
+    return (interval >= 0) & (ordinals <= ends[np.maximum(interval, 0)])
+
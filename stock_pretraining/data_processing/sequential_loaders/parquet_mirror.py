@@ -0,0 +1,271 @@
+from stock_pretraining.environment import get_env_variable
+from stock_pretraining.schemas.eod_model import StockData, StockDomains
+from stock_pretraining.data_processing.domain_table import DomainTable, to_ordinal
+
+from sqlalchemy import create_engine, select, and_, or_
+
+from datetime import date
+from pathlib import Path
+
+import json
+import os
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+VALUE_COLUMNS = ["stock_adj_volume", "stock_adj_open", "stock_adj_close", "stock_adj_high", "stock_adj_low"]
+
+FILE_SCHEMA = pa.schema([("stock_datetime", pa.date32())] + [(column, pa.float64()) for column in VALUE_COLUMNS])
+PARTITION_SCHEMA = pa.schema([("resample_freq", pa.string()), ("ticker", pa.string()), ("year", pa.int32())])
+
+class ParquetMirror():
+    """
+    A local copy of stock_data stored as hive partitioned Parquet files.
+
+    Rows are laid out as root/resample_freq=<freq>/ticker=<ticker>/year=<year>/data.parquet, sorted by
+    stock_datetime, so reads only open the files of the requested tickers and years and skip row groups
+    outside the requested dates. The domain held for every (ticker, resample_freq) is stored next to the
+    data in root/domains.json, and sync only exports the difference between it and the stored domain in
+    StockDomains.
+
+    Parameters
+    ----------
+
+    root: string | Path
+        Directory of the mirror. Created on the first sync.
+
+    row_group_size: int
+        Maximum number of rows per Parquet row group. A file holds at most a year of one ticker, so by default
+        every file is one row group. Smaller row groups let reads of short date ranges skip more rows, at the
+        cost of larger footers.
+    """
+    def __init__(self, root, row_group_size=64_000):
+        self.root = Path(root)
+        self.row_group_size = row_group_size
+
+    @property
+    def domains_path(self):
+        return self.root / "domains.json"
+
+    """
+    Loads the domains held by the mirror
+
+    Returns
+    -------
+
+    domains: DomainTable
+        The mirrored domain of every (ticker, resample_freq)
+    """
+    def load_domains(self):
+        if not self.domains_path.exists():
+            return DomainTable()
+
+        with open(self.domains_path) as file:
+            records = json.load(file)
+
+        return DomainTable.from_domains({(ticker, resample_freq): mapping for ticker, resample_freq, mapping in records})
+
+    def get_domain(self, ticker, resample_freq):
+        return self.load_domains().get((ticker, resample_freq))
+
+    """
+    Brings the mirror up to date with the database.
+
+    Intervals that were added to a domain in StockDomains are exported, and intervals that were removed
+    are dropped from the mirror. Only the year files touched by those intervals are rewritten.
+
+    Parameters
+    ----------
+
+    database_url: string
+        The database to mirror. Defaults to the database_url environment variable.
+
+    tickers: []string | None
+        The tickers to sync. Defaults to every ticker in StockDomains.
+
+    resample_freq: resample_options.member | None
+        The resample frequency to sync. Defaults to every frequency.
+
+    refresh: bool
+        Export the whole domain of every synced key again. Use after overwriting rows in place.
+
+    Returns
+    -------
+
+    rows: int
+        The number of exported rows
+    """
+    def sync(self, database_url=None, tickers=None, resample_freq=None, refresh=False):
+        engine = create_engine(database_url or get_env_variable("database_url"))
+
+        try:
+            query = select(StockDomains.ticker, StockDomains.resample_freq, StockDomains.sparsity_mapping)
+            if tickers is not None:
+                query = query.where(StockDomains.ticker.in_(tickers))
+            if resample_freq is not None:
+                query = query.where(StockDomains.resample_freq == resample_freq)
+
+            with engine.connect() as connection:
+                stored = DomainTable.from_domains({(ticker, freq): mapping for ticker, freq, mapping in connection.execute(query)})
+
+            mirrored = self.load_domains()
+            synced_keys = [key for key in mirrored.keys if (tickers is None or key[0] in tickers) and (resample_freq is None or key[1] == resample_freq)]
+            synced_keys += [key for key in stored.keys if key not in mirrored]
+
+            previous = mirrored.select(synced_keys)
+            current = stored.select(synced_keys)
+
+            added = current if refresh else current - previous
+            removed = previous if refresh else previous - current
+
+            rows = self.export(engine, added, removed)
+
+        finally:
+            engine.dispose()
+
+        self.write_domains(mirrored.update(current.domains()))
+
+        return rows
+
+    """
+    Reads mirrored rows
+
+    Parameters
+    ----------
+
+    tickers: []string
+
+    start_date: datetime.date | string
+
+    end_date: datetime.date | string
+
+    resample_freq: resample_options.member
+
+    columns: []string | None
+        The value columns to read. Defaults to every column of stock_data other than id.
+
+    Returns
+    -------
+
+    rows: pd.DataFrame
+        ticker, resample_freq, stock_datetime and the requested columns, ordered by ticker and stock_datetime
+    """
+    def read(self, tickers, start_date, end_date, resample_freq="days", columns=None):
+        start_date, end_date = date.fromordinal(to_ordinal(start_date)), date.fromordinal(to_ordinal(end_date))
+        columns = ["ticker", "resample_freq", "stock_datetime"] + list(VALUE_COLUMNS if columns is None else columns)
+
+        paths = [str(path) for ticker in tickers for year in range(start_date.year, end_date.year + 1) if (path := self.partition_path(ticker, resample_freq, year)).exists()]
+        if not paths:
+            return pd.DataFrame({column: pd.Series(dtype=object if column in ("ticker", "resample_freq", "stock_datetime") else float) for column in columns})
+
+        dataset = ds.dataset(paths, schema=pa.unify_schemas([FILE_SCHEMA, PARTITION_SCHEMA]), format="parquet", partitioning=ds.partitioning(PARTITION_SCHEMA, flavor="hive"), partition_base_dir=str(self.root))
+        stock_datetime = ds.field("stock_datetime")
+        table = dataset.to_table(columns=columns, filter=(stock_datetime >= pa.scalar(start_date, pa.date32())) & (stock_datetime <= pa.scalar(end_date, pa.date32())))
+
+        return table.to_pandas().sort_values(["ticker", "stock_datetime"], kind="stable", ignore_index=True)
+
+    def partition_path(self, ticker, resample_freq, year):
+        return self.root / f"resample_freq={resample_freq}" / f"ticker={ticker}" / f"year={year}" / "data.parquet"
+
+    """
+    Queries the added intervals and rewrites every year file that an added or removed interval touches
+    """
+    def export(self, engine, added, removed, batch_size=500):
+        touched = {}
+
+        for table, kind in ((added, "added"), (removed, "removed")):
+            for row, start, end in zip(table.rows.tolist(), table.starts.tolist(), table.ends.tolist()):
+                key = table.keys[row]
+                for year in range(date.fromordinal(start).year, date.fromordinal(end).year + 1):
+                    touched.setdefault((key, year), {"added": [], "removed": []})[kind].append((start, end))
+
+        exported = self.query(engine, added, batch_size)
+
+        for (key, year), intervals in touched.items():
+            path = self.partition_path(*key, year)
+            stale = intervals["added"] + intervals["removed"]
+
+            frames = []
+            if path.exists():
+                existing = pq.read_table(path).to_pandas()
+                frames.append(existing[~covered(existing["stock_datetime"], stale)])
+
+            new = exported.get(key)
+            if new is not None:
+                frames.append(new[pd.to_datetime(new["stock_datetime"]).dt.year == year])
+
+            self.write_partition(path, pd.concat(frames, ignore_index=True) if frames else pd.DataFrame(columns=FILE_SCHEMA.names))
+
+        return sum(len(frame) for frame in exported.values())
+
+    """
+    Fetches the rows of every interval in a DomainTable, batching intervals into OR'ed range filters that
+    each use the natural key index
+
+    Returns
+    -------
+
+    rows: dict((ticker, resample_freq) -> pd.DataFrame)
+    """
+    def query(self, engine, table, batch_size):
+        intervals = list(zip(table.rows.tolist(), table.starts.tolist(), table.ends.tolist()))
+        frames = {}
+
+        with engine.connect() as connection:
+            for i in range(0, len(intervals), batch_size):
+                conditions = [and_(
+                    StockData.ticker == table.keys[row][0],
+                    StockData.resample_freq == table.keys[row][1],
+                    StockData.stock_datetime.between(date.fromordinal(start), date.fromordinal(end)),
+                ) for row, start, end in intervals[i:i + batch_size]]
+
+                query = select(StockData.ticker, StockData.resample_freq, StockData.stock_datetime, *[getattr(StockData, column) for column in VALUE_COLUMNS]).where(or_(*conditions))
+                df = pd.DataFrame(connection.execute(query).all(), columns=["ticker", "resample_freq"] + FILE_SCHEMA.names)
+
+                df["resample_freq"] = [getattr(freq, "name", freq) for freq in df["resample_freq"]]
+                for (ticker, resample_freq), rows in df.groupby(["ticker", "resample_freq"], sort=False):
+                    frames.setdefault((ticker, resample_freq), []).append(rows[FILE_SCHEMA.names])
+
+        return {key: pd.concat(parts, ignore_index=True) for key, parts in frames.items()}
+
+    """
+    Atomically replaces a year file, or removes it if no rows are left
+    """
+    def write_partition(self, path, df):
+        if len(df) == 0:
+            path.unlink(missing_ok=True)
+            return
+
+        df = df.assign(stock_datetime=pd.to_datetime(df["stock_datetime"]).dt.date)
+        df = df.drop_duplicates(subset="stock_datetime", keep="last").sort_values("stock_datetime")
+
+        path.parent.mkdir(parents=True, exist_ok=True)
+        temporary = path.with_suffix(".parquet.tmp")
+
+        pq.write_table(pa.Table.from_pandas(df, schema=FILE_SCHEMA, preserve_index=False), temporary, row_group_size=self.row_group_size)
+        os.replace(temporary, path)
+
+    def write_domains(self, domains):
+        self.root.mkdir(parents=True, exist_ok=True)
+        temporary = self.domains_path.with_suffix(".json.tmp")
+
+        with open(temporary, "w") as file:
+            json.dump([[ticker, resample_freq, domain.string] for (ticker, resample_freq), domain in domains.domains().items() if not domain.is_null], file)
+
+        os.replace(temporary, self.domains_path)
+
+
+"""
+Marks the dates that fall in any of the given closed day ordinal intervals
+"""
+def covered(dates, intervals):
+    ordinals = np.array([to_ordinal(value) for value in pd.to_datetime(dates).dt.date], dtype=np.int64)
+    mask = np.zeros(len(ordinals), dtype=bool)
+
+    for start, end in intervals:
+        mask |= (start <= ordinals) & (ordinals <= end)
+
+    return mask
@@ -0,0 +1,99 @@
+from stock_pretraining.data_processing.sequential_loaders.sequential_loader import SequentialLoader
+from stock_pretraining.data_processing.sequential_loaders.parquet_mirror import VALUE_COLUMNS
+from stock_pretraining.data_processing.sequential_loaders.alignment import to_ordinals
+
+import numpy as np
+import pandas as pd
+import torch
+from torch.utils.data import IterableDataset, get_worker_info
+
+class SequenceStream(IterableDataset):
+    """
+    Streams non-overlapping sequences of sequence_length consecutive rows of one ticker.
+
+    Rows are read through SequentialLoader.stream_rows, so memory stays bounded by one chunk of rows
+    whatever the number of tickers or the length of the date range. Sequences never span a gap in the
+    ticker's domain, so rows left over at the end of a ticker or before a gap that do not fill a sequence
+    are dropped.
+
+    Tickers are split round robin across DataLoader workers. Every worker builds its own SequentialLoader
+    from config when iteration starts, so each opens its own connection and reads a disjoint set of tickers.
+
+    Yields
+    ------
+
+    sequence: dict
+        ticker: string
+        start_date: string, the date of the first row in the format YYYY-MM-DD
+        values: torch.Tensor, [sequence_length x column] float32
+    """
+    def __init__(self, config, tickers, start_date, end_date, resample_freq="days", sequence_length=256, columns=None, chunk_rows=10_000):
+        super().__init__()
+
+        self.config = dict(config)
+        self.tickers = sorted(dict.fromkeys(tickers))
+        self.start_date = start_date
+        self.end_date = end_date
+        self.resample_freq = resample_freq
+        self.sequence_length = sequence_length
+        self.columns = list(VALUE_COLUMNS if columns is None else columns)
+        self.chunk_rows = chunk_rows
+
+    def worker_tickers(self):
+        worker = get_worker_info()
+
+        if worker is None:
+            return self.tickers
+
+        return self.tickers[worker.id::worker.num_workers]
+
+    def __iter__(self):
+        tickers = self.worker_tickers()
+        if not tickers:
+            return
+
+        loader = SequentialLoader(self.config)
+
+        try:
+            domains = loader.get_domains(tickers, self.resample_freq)
+            yield from self.sequences(loader.stream_rows(tickers, self.start_date, self.end_date, self.resample_freq, columns=self.columns, chunk_rows=self.chunk_rows), domains)
+
+        finally:
+            if loader.mirror is None:
+                loader.session.close()
+                loader.engine.dispose()
+
+    """
+    Cuts ticker ordered chunks into sequences, carrying the rows of a ticker that continue into the next chunk.
+    A sequence only holds rows of one interval of the ticker's domain, so it never spans a gap in coverage.
+    """
+    def sequences(self, chunks, domains):
+        carried = None
+
+        for chunk in chunks:
+            for ticker, rows in chunk.groupby("ticker", sort=False):
+                if carried is not None and len(carried) and carried["ticker"].iat[0] == ticker:
+                    rows = pd.concat([carried, rows], ignore_index=True)
+
+                values = rows[self.columns].to_numpy(dtype=np.float32)
+                dates = rows["stock_datetime"].tolist()
+
+                #rows are cut into runs that lie in one interval each. Rows left over at the end of a run are dropped,
+                #unless the run may continue into the next chunk.
+                domain = domains.get(ticker)
+                interval = np.zeros(len(rows), dtype=np.int64) if domain is None else domain.interval_index(to_ordinals(dates))
+                run_starts = np.flatnonzero(np.diff(interval, prepend=-2))
+                run_stops = np.append(run_starts[1:], len(rows))
+
+                complete = 0
+                for run_start, run_stop in zip(run_starts, run_stops):
+                    complete = run_stop - (run_stop - run_start) % self.sequence_length
+
+                    for start in range(run_start, complete, self.sequence_length):
+                        yield {
+                            "ticker": ticker,
+                            "start_date": pd.Timestamp(dates[start]).strftime("%Y-%m-%d"),
+                            "values": torch.from_numpy(values[start:start + self.sequence_length].copy()),
+                        }
+
+                carried = rows.iloc[complete:]
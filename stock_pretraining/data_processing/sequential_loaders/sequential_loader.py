@@ -1,27 +1,49 @@
 from stock_pretraining.environment import get_env_variable
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, select
 from sqlalchemy.orm import sessionmaker
 
-from stock_pretraining.schemas.eod_model import StockData
+from stock_pretraining.schemas.eod_model import StockData, StockDomains
+from stock_pretraining.data_processing.sparsity_mapping import SparsityMappingString
+from stock_pretraining.data_processing.sequential_loaders.parquet_mirror import ParquetMirror, VALUE_COLUMNS
+from stock_pretraining.data_processing.sequential_loaders.feature_store import FeatureStore
+from stock_pretraining.data_processing.sequential_loaders.alignment import align
+
+import numpy as np
+import pandas as pd
 
 """
 I think I'll use this class to retrieve data from the database and wrap it in a pytorch dataloader.
 I'll make it so that you can load sequences of rows from the database.
+
+If mirror_path is set in the configuration, rows are read from a ParquetMirror instead and no database
+connection is opened. Keep the mirror up to date with ParquetMirror(mirror_path).sync().
+
+If feature_path is set, the features of a FeatureStore can be requested by name wherever value columns
+are, for example columns=["stock_adj_close", "log_return", "return_zscore_20"]. Set feature_windows to
+the windows the store was built with. Keep the store up to date with FeatureStore.update.
 """
 class SequentialLoader():
     def __init__(self, config=None):
         config = self.set_config(config)
+        self.config = config
+
+        self.mirror = ParquetMirror(config['mirror_path']) if config.get('mirror_path') else None
+        self.feature_store = FeatureStore(config['feature_path'], windows=config.get('feature_windows', (20,))) if config.get('feature_path') else None
 
-        self.database_url = config['database_url']
+        if self.mirror is None:
+            self.database_url = config['database_url']
 
-        self.engine = create_engine(self.database_url)
-        Session = sessionmaker(bind=self.engine)
-        self.session = Session()
+            self.engine = create_engine(self.database_url)
+            Session = sessionmaker(bind=self.engine)
+            self.session = Session()
 
     def set_config(self, config):
         if not config:
             config = {}
 
+        if config.get('mirror_path'):
+            return config
+
         if not "database_url" in config.keys():
             config['database_url'] = get_env_variable("database_url")
 
@@ -33,18 +55,196 @@ class SequentialLoader():
         ...
 
 
-    def get_rows(self, tickers, start_date, end_date, resample_freq="daily", outer_join=False):
-        """
-        1. Find the dates in the database between the specified interval
-        """
-        
-        rows = self.session.query(StockData.stock_datetime).filter(StockData.ticker.in_(tickers), StockData.resample_freq == resample_freq, start_date <= StockData.stock_datetime, StockData.stock_datetime <= end_date)
-        print(rows.all())
+    """
+    Returns the rows of tickers between two dates, aligned on a shared date axis
 
+    Parameters
+    ----------
+
+    tickers: []string
 
+    start_date: string
 
+    end_date: string
+
+    resample_freq: resample_options.member
+
+    outer_join: bool
+        Keep every date that any ticker has a row for, with NaN values where a ticker has no row.
+        Otherwise only dates every ticker has a row for are kept.
+
+    columns: []string | None
+        The value columns to load. Defaults to every column of stock_data other than id.
+
+    ffill: bool
+        Fill missing values with the last earlier value of the same ticker
+
+    Returns
+    -------
+
+    rows: pd.DataFrame
+        ticker, resample_freq, stock_datetime and the requested columns, ordered by ticker and stock_datetime
     """
-    Returns a pytorch dataloader that contains sequences of data
+    def get_rows(self, tickers, start_date, end_date, resample_freq="days", outer_join=False, columns=None, ffill=False):
+        columns = list(VALUE_COLUMNS if columns is None else columns)
+        tickers = sorted(dict.fromkeys(tickers))
+
+        dates, values, mask = self.get_aligned(tickers, start_date, end_date, resample_freq, outer_join=outer_join, columns=columns, ffill=ffill)
+
+        #ticker major order, matching the order rows are stored and streamed in
+        df = pd.DataFrame(values.transpose(1, 0, 2).reshape(-1, len(columns)), columns=columns)
+        df.insert(0, "stock_datetime", dates * len(tickers))
+        df.insert(0, "resample_freq", resample_freq)
+        df.insert(0, "ticker", np.repeat(tickers, len(dates)))
+
+        return df
+
+    """
+    Loads tickers into a dense [date x ticker x column] array on a shared date axis. See alignment.align.
+
+    Returns
+    -------
+
+    dates, values, mask: []datetime.date, np.ndarray, np.ndarray
+        The date axis, [date x ticker x column] float32 values and a [date x ticker] mask of stored rows
+    """
+    def get_aligned(self, tickers, start_date, end_date, resample_freq="days", outer_join=False, columns=None, ffill=False):
+        columns = list(VALUE_COLUMNS if columns is None else columns)
+        rows = self.load_rows(tickers, start_date, end_date, resample_freq, columns=columns)
+
+        return align(rows, list(tickers), columns, outer_join=outer_join, ffill=ffill)
+
+    """
+    Returns the stored rows of tickers between two dates without aligning them
+
+    Returns
+    -------
+
+    rows: pd.DataFrame
+        ticker, resample_freq, stock_datetime and the requested columns, ordered by ticker and stock_datetime
+    """
+    def load_rows(self, tickers, start_date, end_date, resample_freq="days", columns=None):
+        columns = list(VALUE_COLUMNS if columns is None else columns)
+        values, features = self.split_columns(columns)
+
+        if self.mirror is not None:
+            rows = self.mirror.read(tickers, start_date, end_date, resample_freq, columns=values)
+        else:
+            rows = self.to_frame(self.session.execute(self.rows_query(tickers, start_date, end_date, resample_freq, values)).all(), values)
+
+        return self.join_features(rows, tickers, start_date, end_date, resample_freq, columns, features)
+
+    """
+    Yields the rows of tickers in bounded chunks, ordered by ticker and stock_datetime
+
+    Database reads go through a server side cursor, fetching chunk_rows rows at a time. Mirror reads load
+    one ticker at a time. Either way memory is bounded by a chunk regardless of the number of tickers or
+    the length of the date range.
+
+    Parameters
+    ----------
+
+    tickers: []string
+
+    start_date: string
+
+    end_date: string
+
+    resample_freq: resample_options.member
+
+    columns: []string | None
+        The value columns to load. Defaults to every column of stock_data other than id.
+
+    chunk_rows: int
+        Maximum number of rows per chunk
+
+    Returns
+    -------
+
+    chunks: generator(pd.DataFrame)
+        Frames shaped like the result of get_rows
+    """
+    def stream_rows(self, tickers, start_date, end_date, resample_freq="days", columns=None, chunk_rows=10_000):
+        columns = list(VALUE_COLUMNS if columns is None else columns)
+        values, features = self.split_columns(columns)
+
+        if self.mirror is not None:
+            for ticker in sorted(tickers):
+                df = self.mirror.read([ticker], start_date, end_date, resample_freq, columns=values)
+                df = self.join_features(df, [ticker], start_date, end_date, resample_freq, columns, features)
+
+                for i in range(0, len(df), chunk_rows):
+                    yield df.iloc[i:i + chunk_rows].reset_index(drop=True)
+
+            return
+
+        query = self.rows_query(tickers, start_date, end_date, resample_freq, values).execution_options(stream_results=True, yield_per=chunk_rows)
+
+        with self.engine.connect() as connection:
+            for partition in connection.execute(query).partitions():
+                df = self.to_frame(partition, values)
+
+                #features are read for the tickers and dates of the chunk only
+                if features and len(df):
+                    df = self.join_features(df, df["ticker"].unique().tolist(), df["stock_datetime"].min(), df["stock_datetime"].max(), resample_freq, columns, features)
+
+                yield df
+
+    def rows_query(self, tickers, start_date, end_date, resample_freq, columns):
+        return select(StockData.ticker, StockData.resample_freq, StockData.stock_datetime, *[getattr(StockData, column) for column in columns]).where(
+            StockData.ticker.in_(tickers), StockData.resample_freq == resample_freq, start_date <= StockData.stock_datetime, StockData.stock_datetime <= end_date
+        ).order_by(StockData.ticker, StockData.stock_datetime)
+
+    """
+    Splits requested columns into stock_data columns and features of the feature store
+    """
+    def split_columns(self, columns):
+        features = [column for column in columns if column not in VALUE_COLUMNS]
+        assert not features or self.feature_store is not None, f"Unknown columns {', '.join(features)}. Set feature_path in the configuration to load features."
+
+        return [column for column in columns if column in VALUE_COLUMNS], features
+
+    """
+    Adds the requested features to rows of stock_data. Rows without cached features get NaN.
+    """
+    def join_features(self, rows, tickers, start_date, end_date, resample_freq, columns, features):
+        if not features:
+            return rows
+
+        cached = self.feature_store.read(tickers, start_date, end_date, resample_freq, columns=features).drop(columns="resample_freq")
+        rows = rows.merge(cached, on=["ticker", "stock_datetime"], how="left")
+
+        return rows[["ticker", "resample_freq", "stock_datetime"] + columns]
+
+    def to_frame(self, rows, columns):
+        df = pd.DataFrame(rows, columns=["ticker", "resample_freq", "stock_datetime"] + columns)
+        df["resample_freq"] = [getattr(freq, "name", freq) for freq in df["resample_freq"]]
+
+        return df
+
+
+    """
+    Returns the domains of tickers from the mirror or the database
+
+    Returns
+    -------
+
+    domains: dict(string -> SparsityMappingString)
+        The domain of each ticker. Tickers without a stored domain get an empty domain.
+    """
+    def get_domains(self, tickers, resample_freq="days"):
+        if self.mirror is not None:
+            mirrored = self.mirror.load_domains()
+            return {ticker: mirrored.get((ticker, resample_freq)) for ticker in tickers}
+
+        records = self.session.query(StockDomains).filter(StockDomains.ticker.in_(tickers), StockDomains.resample_freq == resample_freq).all()
+        records = {record.ticker: record.sparsity_mapping for record in records}
+
+        return {ticker: SparsityMappingString(resample_freq=resample_freq, string=records.get(ticker)) for ticker in tickers}
+
+
+    """
+    Returns a pytorch dataset that streams sequences of data
 
     Parameters
     ----------
@@ -56,16 +256,27 @@ class SequentialLoader():
     end_date: string
 
     outer_join: bool
+        Unused. Every sequence holds the rows of a single ticker, so there is nothing to align.
+        Use get_aligned for cross sectional batches.
+
+    sequence_length: int
+        Number of consecutive rows of one ticker in each sequence
+
+    columns: []string | None
+        The value columns to load. Defaults to every column of stock_data other than id.
+
+    chunk_rows: int
+        Maximum number of rows fetched at once by each worker
 
     Returns
     -------
 
-    dataset: torch.utils.data.DataSet
+    dataset: torch.utils.data.IterableDataset
+        See SequenceStream. Each DataLoader worker opens its own connection and streams a disjoint
+        subset of tickers.
     """
-    def get_sequential(self, tickers, start_date, end_date, resample_freq="daily", outer_join=False):
+    def get_sequential(self, tickers, start_date, end_date, resample_freq="days", outer_join=False, sequence_length=256, columns=None, chunk_rows=10_000):
+        from stock_pretraining.data_processing.sequential_loaders.sequence_stream import SequenceStream
 
-        """
-        SELECT * FROM stock_data WHERE ticker IN ('NVDA', 'SPY') AND DATE '2020-01-01' <= stock_datetime AND stock_datetime <= DATE '2020-02-01';
-        """
+        return SequenceStream(self.config, tickers, start_date, end_date, resample_freq, sequence_length=sequence_length, columns=columns, chunk_rows=chunk_rows)
 
-        print(tickers, start_date, end_date, outer_join)
\ No newline at end of file
@@ -0,0 +1,329 @@
+from stock_pretraining.data_processing.sparsity_mapping import SparsityMappingString
+from stock_pretraining.data_processing.sequential_loaders.parquet_mirror import VALUE_COLUMNS
+from stock_pretraining.data_processing.sequential_loaders.alignment import to_ordinals
+
+from datetime import date
+from pathlib import Path
+
+import json
+import os
+
+import numpy as np
+
+class TokenCorpus():
+    """
+    Pre-tokenized rows of stock_data stored as binary shards of compact integer tokens.
+
+    Every shard is a raw [row x feature] uint16 array, or uint32 if the tokenizer has more than 65536
+    tokens, named shard_<n>.bin. The rows of a ticker are stored contiguously in one shard, ordered by date,
+    and shards are filled up to shard_rows rows. A ticker with more rows gets a shard of its own.
+
+    index.json records, for every ticker, its shard, row offset and number of rows, the domain it was built
+    from and the row bounds of every interval of that domain. Windows that lie within one interval are read
+    from the shards through np.memmap as slices, with no parsing. A corpus may be passed to DataLoader
+    workers: the memory maps are reopened in each process instead of being pickled.
+
+    Parameters
+    ----------
+
+    root: string | Path
+        Directory of the corpus. Created on the first update.
+    """
+    def __init__(self, root):
+        self.root = Path(root)
+        self.index = self.load_index()
+        self._shards = {}
+
+    def __getstate__(self):
+        return {**self.__dict__, "_shards": {}}
+
+    @property
+    def index_path(self):
+        return self.root / "index.json"
+
+    @property
+    def tickers(self):
+        return list(self.index["tickers"])
+
+    @property
+    def dtype(self):
+        return np.dtype(self.index["dtype"])
+
+    def load_index(self):
+        if not self.index_path.exists():
+            return {"tokenizer": None, "dtype": "uint16", "n_features": 0, "resample_freq": None, "next_shard": 0, "tickers": {}}
+
+        with open(self.index_path) as file:
+            return json.load(file)
+
+    """
+    Opens a shard as a read only [row x feature] memory map
+    """
+    def shard(self, shard):
+        if shard not in self._shards:
+            self._shards[shard] = np.memmap(self.shard_path(shard), dtype=self.dtype, mode="r").reshape(-1, self.index["n_features"])
+
+        return self._shards[shard]
+
+    def shard_path(self, shard):
+        return self.root / f"shard_{shard:05d}.bin"
+
+    """
+    Returns the tokens of rows of one ticker as a view of its shard
+
+    Parameters
+    ----------
+
+    ticker: string
+
+    start: int
+        Position of the first row among the rows of the ticker
+
+    length: int
+
+    Returns
+    -------
+
+    tokens: np.memmap
+        [length x feature] tokens
+    """
+    def rows(self, ticker, start, length):
+        entry = self.index["tickers"][ticker]
+        offset = entry["offset"] + start
+
+        return self.shard(entry["shard"])[offset:offset + length]
+
+    """
+    Tokenizes the rows of every ticker whose domain changed since the last update, or every ticker if the
+    tokenizer changed. Shards that only hold unchanged tickers are kept as they are. Shards that held a
+    changed ticker are replaced by new shards, into which their unchanged tickers are copied without being
+    tokenized again.
+
+    Parameters
+    ----------
+
+    loader: SequentialLoader
+        Source of rows and domains
+
+    tokenizer: Tokenizer
+        A fitted tokenizer. Rows are read in the order of tokenizer.columns.
+
+    tickers: []string
+        The universe of the corpus. Tickers that were built before and are not listed are dropped.
+
+    resample_freq: resample_options.member
+
+    shard_rows: int
+        Number of rows a shard is filled up to
+
+    chunk_tickers: int
+        Number of tickers loaded and tokenized at once
+
+    Returns
+    -------
+
+    tickers: []string
+        The tickers that were tokenized
+    """
+    def update(self, loader, tokenizer, tickers, resample_freq="days", shard_rows=1 << 20, chunk_tickers=256):
+        columns = list(VALUE_COLUMNS if tokenizer.columns is None else tokenizer.columns)
+        fingerprint = tokenizer.fingerprint()
+        dtype = "uint16" if tokenizer.vocab_size <= np.iinfo(np.uint16).max + 1 else "uint32"
+
+        #tokens of another tokenizer or frequency can not be reused
+        previous = self.index
+        if (previous["tokenizer"], previous["resample_freq"]) != (fingerprint, resample_freq):
+            previous = {**previous, "tickers": {}}
+
+        tickers = list(dict.fromkeys(tickers))
+        domains = {}
+        for i in range(0, len(tickers), chunk_tickers):
+            domains.update(loader.get_domains(tickers[i:i + chunk_tickers], resample_freq))
+
+        changed = [ticker for ticker in tickers if not domains[ticker].is_null and previous["tickers"].get(ticker, {}).get("domain") != domains[ticker].string]
+        dropped = [ticker for ticker in previous["tickers"] if ticker not in domains or domains[ticker].is_null]
+
+        #every shard that held a changed or dropped ticker is rewritten
+        stale = {previous["tickers"][ticker]["shard"] for ticker in changed + dropped if ticker in previous["tickers"]}
+        moved = [ticker for ticker, entry in previous["tickers"].items() if entry["shard"] in stale and ticker not in changed and ticker not in dropped]
+
+        writer = ShardWriter(self.root, dtype, len(columns), shard_rows, self.index["next_shard"])
+        entries = {ticker: entry for ticker, entry in previous["tickers"].items() if entry["shard"] not in stale and ticker not in dropped}
+
+        for ticker in moved:
+            entry = previous["tickers"][ticker]
+            entries[ticker] = {**entry, **writer.write(np.array(self.rows(ticker, 0, entry["rows"])))}
+
+        for i in range(0, len(changed), chunk_tickers):
+            chunk = changed[i:i + chunk_tickers]
+            first = min(domains[ticker].starts[0] for ticker in chunk)
+            last = max(domains[ticker].ends[-1] for ticker in chunk)
+
+            rows = loader.load_rows(chunk, date.fromordinal(first), date.fromordinal(last), resample_freq, columns=columns)
+            tokens = tokenizer.encode(rows[columns].to_numpy(dtype=np.float32)).astype(dtype)
+            ordinals = to_ordinals(rows["stock_datetime"])
+
+            positions = rows.groupby("ticker", sort=False).indices
+            for ticker in chunk:
+                index = positions.get(ticker, np.array([], dtype=np.int64))
+                entries[ticker] = {
+                    **writer.write(tokens[index]),
+                    "rows": len(index),
+                    "domain": domains[ticker].string,
+                    "bounds": interval_bounds(domains[ticker], ordinals[index]),
+                }
+
+        writer.close()
+
+        shards = {entry["shard"] for entry in self.index["tickers"].values()}
+        self._shards = {}
+        self.write_index({
+            "tokenizer": fingerprint,
+            "dtype": dtype,
+            "n_features": len(columns),
+            "resample_freq": resample_freq,
+            "next_shard": writer.next_shard,
+            "tickers": entries,
+        })
+
+        #shards are only removed once the index no longer refers to them
+        for shard in shards - {entry["shard"] for entry in entries.values()}:
+            self.shard_path(shard).unlink(missing_ok=True)
+
+        return changed
+
+    """
+    Lists every window of length rows that lies within one interval of a ticker's domain
+
+    Parameters
+    ----------
+
+    length: int
+        Number of rows in a window
+
+    stride: int
+        Distance between consecutive window starts within an interval
+
+    Returns
+    -------
+
+    ticker_id, start: np.ndarray, np.ndarray
+        The position of each window's ticker in tickers and the position of its first row among the rows
+        of the ticker
+    """
+    def windows(self, length, stride=1):
+        tickers = self.tickers
+        intervals = [(ticker_id, lo, hi) for ticker_id, ticker in enumerate(tickers) for lo, hi in self.index["tickers"][ticker]["bounds"]]
+        if not intervals:
+            return np.array([], dtype=np.int32), np.array([], dtype=np.int64)
+
+        ticker_id, lo, hi = (np.array(values, dtype=np.int64) for values in zip(*intervals))
+        counts = np.maximum(hi - lo - length, -1) // stride + 1
+
+        interval = np.repeat(np.arange(len(counts)), counts)
+        position = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+
+        return ticker_id[interval].astype(np.int32), lo[interval] + position * stride
+
+    def write_index(self, index):
+        self.root.mkdir(parents=True, exist_ok=True)
+        temporary = self.index_path.with_suffix(".json.tmp")
+
+        with open(temporary, "w") as file:
+            json.dump(index, file)
+
+        os.replace(temporary, self.index_path)
+        self.index = index
+
+
+class ShardWriter():
+    """
+    Packs the token rows of tickers into new shards of about shard_rows rows
+    """
+    def __init__(self, root, dtype, n_features, shard_rows, next_shard):
+        self.root = Path(root)
+        self.dtype = np.dtype(dtype)
+        self.n_features = n_features
+        self.shard_rows = shard_rows
+        self.next_shard = next_shard
+
+        self.parts = []
+        self.buffered_rows = 0
+
+    """
+    Buffers the rows of one ticker
+
+    Returns
+    -------
+
+    location: dict
+        The shard and row offset the rows are written to
+    """
+    def write(self, tokens):
+        if self.buffered_rows and self.buffered_rows + len(tokens) > self.shard_rows:
+            self.close()
+
+        location = {"shard": self.next_shard, "offset": self.buffered_rows}
+        self.parts.append(np.ascontiguousarray(tokens, dtype=self.dtype).reshape(-1, self.n_features))
+        self.buffered_rows += len(tokens)
+
+        return location
+
+    def close(self):
+        if not self.parts:
+            return
+
+        self.root.mkdir(parents=True, exist_ok=True)
+        path = self.root / f"shard_{self.next_shard:05d}.bin"
+        temporary = path.with_suffix(".bin.tmp")
+
+        with open(temporary, "wb") as file:
+            for part in self.parts:
+                part.tofile(file)
+
+        os.replace(temporary, path)
+        self.parts, self.buffered_rows = [], 0
+        self.next_shard += 1
+
+
+class TokenWindows():
+    """
+    Map style dataset of random access windows of a TokenCorpus
+
+    Items are [length x feature] int64 arrays copied from one slice of a memory mapped shard.
+
+    Parameters
+    ----------
+
+    corpus: TokenCorpus
+
+    length: int
+        Number of rows in a window
+
+    stride: int
+        Distance between consecutive window starts within an interval of a domain
+    """
+    def __init__(self, corpus, length, stride=1):
+        self.corpus = corpus
+        self.length = length
+        self.tickers = corpus.tickers
+        self.ticker_id, self.start = corpus.windows(length, stride=stride)
+
+    def __len__(self):
+        return len(self.ticker_id)
+
+    def __getitem__(self, i):
+        return self.corpus.rows(self.tickers[self.ticker_id[i]], int(self.start[i]), self.length).astype(np.int64)
+
+
+"""
+Returns the [first, last + 1) row positions of every interval of a domain among rows with the given dates
+"""
+def interval_bounds(domain, ordinals):
+    if not isinstance(domain, SparsityMappingString):
+        domain = SparsityMappingString("days", string=domain)
+
+    lo = np.searchsorted(ordinals, np.asarray(domain.starts, dtype=np.int64), side="left")
+    hi = np.searchsorted(ordinals, np.asarray(domain.ends, dtype=np.int64), side="right")
+
+    return [[int(start), int(stop)] for start, stop in zip(lo, hi) if stop > start]
@@ -0,0 +1,136 @@
+from stock_pretraining.data_processing.domain_table import DomainTable
+
+import numpy as np
+
+class WindowIndex():
+    """
+    Every valid fixed length window over a date axis, stored as flat (ticker_id, start_offset) arrays.
+
+    A window covers length + horizon consecutive positions of dates and is valid if all of them lie in a
+    single interval of the ticker's domain. Window starts are placed every stride positions from the
+    beginning of each interval. Looking up a window is a single array access.
+
+    Parameters
+    ----------
+
+    dates: []datetime.date
+        The sorted date axis that offsets refer to, for example PanelStore.dates
+
+    length: int
+        Number of input positions in a window
+
+    horizon: int
+        Number of positions after the input that must also be covered, for example prediction targets
+
+    stride: int
+        Distance between consecutive window starts within an interval
+    """
+    def __init__(self, dates, length, horizon=0, stride=1):
+        assert length > 0 and horizon >= 0 and stride > 0, "length and stride must be positive and horizon must not be negative"
+
+        self.ordinals = np.array([value.toordinal() for value in dates], dtype=np.int64)
+        self.length = length
+        self.horizon = horizon
+        self.stride = stride
+
+        self.tickers = []
+        self.ticker_ids = {}
+        self.domains = DomainTable()
+
+        self.ticker_id = np.array([], dtype=np.int32)
+        self.start_offset = np.array([], dtype=np.int32)
+
+    def __len__(self):
+        return len(self.ticker_id)
+
+    """
+    Returns the (ticker_id, start_offset) of a window. tickers[ticker_id] is the ticker of the window.
+    """
+    def __getitem__(self, i):
+        return int(self.ticker_id[i]), int(self.start_offset[i])
+
+    @property
+    def span(self):
+        return self.length + self.horizon
+
+    """
+    Replaces the windows of every ticker whose domain changed. Other tickers keep their windows, so growing
+    domains only costs the changed tickers.
+
+    Parameters
+    ----------
+
+    domains: dict(string -> SparsityMappingString | string)
+        The full current domain of each updated ticker
+
+    Returns
+    -------
+
+    self: WindowIndex
+    """
+    def update(self, domains):
+        for ticker in domains:
+            if ticker not in self.ticker_ids:
+                self.ticker_ids[ticker] = len(self.tickers)
+                self.tickers.append(ticker)
+
+        table = DomainTable.from_domains({(ticker, "days"): domain for ticker, domain in domains.items()})
+        changed = [key for key in table.keys if not same_intervals(table.get(key), self.domains.get(key))]
+        if not changed:
+            return self
+
+        table = table.select(changed)
+        self.domains = self.domains.update(table.domains())
+
+        #positions of the closed intervals on the date axis, [first, last + 1)
+        first = np.searchsorted(self.ordinals, table.starts, side="left")
+        stop = np.searchsorted(self.ordinals, table.ends, side="right")
+        counts = np.maximum(stop - first - self.span, -1) // self.stride + 1
+
+        interval_of_window = np.repeat(np.arange(len(counts)), counts)
+        position_in_interval = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+
+        ids = np.array([self.ticker_ids[key[0]] for key in table.keys], dtype=np.int32)
+        new_ticker_id = ids[table.rows[interval_of_window]] if len(interval_of_window) else np.array([], dtype=np.int32)
+        new_start_offset = (first[interval_of_window] + position_in_interval * self.stride).astype(np.int32)
+
+        keep = ~np.isin(self.ticker_id, ids)
+        ticker_id = np.concatenate([self.ticker_id[keep], new_ticker_id])
+        start_offset = np.concatenate([self.start_offset[keep], new_start_offset])
+
+        order = np.lexsort((start_offset, ticker_id))
+        self.ticker_id, self.start_offset = ticker_id[order], start_offset[order]
+
+        return self
+
+    """
+    Builds the index of a PanelStore from the domains it was built with
+    """
+    @classmethod
+    def from_store(cls, store, length, horizon=0, stride=1):
+        return cls(store.dates, length, horizon=horizon, stride=stride).update(store.domains)
+
+
+class PanelWindows():
+    """
+    Map style dataset of the windows of a WindowIndex over a PanelStore
+
+    Items are (values, mask) tensor pairs of shape [length + horizon x feature] and [length + horizon]
+    that share memory with the store.
+    """
+    def __init__(self, store, index):
+        assert list(index.ordinals) == [value.toordinal() for value in store.dates], "the window index must be built on the date axis of the store"
+
+        self.store = store
+        self.index = index
+
+    def __len__(self):
+        return len(self.index)
+
+    def __getitem__(self, i):
+        ticker_id, start = self.index[i]
+        return self.store.window(self.index.tickers[ticker_id], start, self.index.span)
+
+
+def same_intervals(domain_1, domain_2):
+    return list(domain_1.starts) == list(domain_2.starts) and list(domain_1.ends) == list(domain_2.ends)
@@ -1,15 +1,30 @@
-from stock_pretraining.data_processing.utils import increment, intervals_intersect
-from datetime import datetime
+from stock_pretraining.data_processing.utils import union_intervals, subtract_intervals
+from datetime import date, datetime
 
-import copy
+import numpy as np
+
+DEFAULT_DATETIME_FORMAT = "%Y-%m-%d"
 
 class SparsityMappingString():
-    def __init__(self, resample_freq, string=None, date_to_str=None, str_to_date=None, datetime_format=None):
+    """
+    A time domain made of closed, disjoint intervals.
+
+    The domain is parsed once into sorted lists of day ordinals (see datetime.toordinal).
+    Union and difference are linear merges over those lists, and the sparsity mapping string
+    is only rendered when SparsityMappingString.string is read.
+
+    If a TradingCalendar is given, daily domains step by trading days, so non-trading days between
+    intervals count as covered.
+    """
+    def __init__(self, resample_freq, string=None, date_to_str=None, str_to_date=None, datetime_format=None, calendar=None):
         if string is None:
             string = "/"
 
         if datetime_format is None:
-            datetime_format = "%Y-%m-%d"
+            datetime_format = DEFAULT_DATETIME_FORMAT
+
+        #the default conversions are known to round trip, so only custom ones are checked
+        custom_conversions = date_to_str is not None or str_to_date is not None or datetime_format != DEFAULT_DATETIME_FORMAT
 
         if date_to_str is None:
             date_to_str = lambda date: date.strftime(datetime_format)
@@ -20,318 +35,227 @@ class SparsityMappingString():
         self.datetime_format = datetime_format
         self.date_to_str = date_to_str
         self.str_to_date = str_to_date
+        self.resample_freq = resample_freq
+        self.calendar = calendar
 
-        now = datetime.now()
-        assert date_to_str(str_to_date(date_to_str(now))) == date_to_str(now), "str_to_date and date_to_str must provide valid back and forth conversions between date and string formats"
-        assert not ("/" in date_to_str(now)), "string representation of datetime must not contain forward slash character '/'."
-        assert not ("|" in date_to_str(now)), "string representation of datetime must not contain pipe character '|'."
+        if custom_conversions:
+            now = datetime.now()
+            assert date_to_str(str_to_date(date_to_str(now))) == date_to_str(now), "str_to_date and date_to_str must provide valid back and forth conversions between date and string formats"
+            assert not ("/" in date_to_str(now)), "string representation of datetime must not contain forward slash character '/'."
+            assert not ("|" in date_to_str(now)), "string representation of datetime must not contain pipe character '|'."
 
-        self.validate(string)
-        self.string = string
+        self._fast_conversions = not custom_conversions
+        self.starts, self.ends = self.parse(string)
+        self._string = string
 
-        self.resample_freq = resample_freq
+    """
+    Builds a SparsityMappingString directly from sorted, disjoint day ordinal intervals, sharing the
+    date conversions of this instance. No string is parsed or rendered.
+    """
+    def from_ordinals(self, starts, ends):
+        domain = object.__new__(SparsityMappingString)
+        domain.datetime_format = self.datetime_format
+        domain.date_to_str = self.date_to_str
+        domain.str_to_date = self.str_to_date
+        domain.resample_freq = self.resample_freq
+        domain.calendar = self.calendar
+        domain._fast_conversions = self._fast_conversions
+        domain.starts = starts
+        domain.ends = ends
+        domain._string = None
+
+        return domain
 
     @property
-    def is_null(self):
-        return self.string != "/"
-    
-    def __add__(self, other):
-        return self.add_domain(self.string, other.string)
-    
-    def __sub__(self, other):
-        return self.subtract_domain(self.string, other.string)
-    
-    def __str__(self):
-        return self.string
+    def string(self):
+        if self._string is None:
+            self._string = self.render(self.starts, self.ends)
 
-    def get_str_intervals(self):
-        string_intervals = self.string.split("/")
-        string_intervals = [i.split("|") for i in string_intervals if i != ""]
+        return self._string
 
-        return string_intervals
-    
-    
-    def get_intervals(self):
-        string_intervals = self.get_str_intervals()
-        date_intervals = []
-        for string_interval in string_intervals:
-            date_intervals.append([self.str_to_date(string_interval[0]), self.str_to_date(string_interval[1])])
+    """
+    The unit intervals are stepped by: the calendar for daily domains in trading calendar mode, otherwise resample_freq
+    """
+    @property
+    def unit(self):
+        if self.calendar is not None and self.resample_freq == "days":
+            return self.calendar
 
-        return date_intervals
+        return self.resample_freq
 
+    @property
+    def is_null(self):
+        return len(self.starts) == 0
 
-    def validate(self, mapstring):
-        mapstr = copy.copy(mapstring)
+    def __add__(self, other):
+        return self.from_ordinals(*union_intervals(self.starts, self.ends, other.starts, other.ends, self.unit))
 
-        try:
-            running_date = None
-            assert mapstr[0] == '/'
-            mapstr = mapstr[1:]
-            continuous_intervals = mapstr.split('/')
-            continuous_intervals = [i for i in continuous_intervals if i != ""]
+    def __sub__(self, other):
+        return self.from_ordinals(*subtract_intervals(self.starts, self.ends, other.starts, other.ends, self.unit))
 
-            for continuous_interval_string in continuous_intervals:
-                continuous_interval = continuous_interval_string.split("|")
-                assert len(continuous_interval) == 2
+    def __str__(self):
+        return self.string
 
-                start_date = self.str_to_date(continuous_interval[0])
-                stop_date = self.str_to_date(continuous_interval[1])
+    """
+    Determines weather two domains share at least one date
+    """
+    def intersects(self, other):
+        i, j = 0, 0
 
-                assert running_date == None or start_date > running_date
-                assert stop_date >= start_date
-                
-                running_date = stop_date
+        while i < len(self.starts) and j < len(other.starts):
+            if self.ends[i] < other.starts[j]:
+                i += 1
+            elif other.ends[j] < self.starts[i]:
+                j += 1
+            else:
+                return True
 
+        return False
 
-        except Exception:
-            raise ValueError(f"Improperly formatted sparsity mapping string {mapstring}")
+    """
+    Returns the index of the interval containing each day ordinal, or -1 for days outside of the domain
+    """
+    def interval_index(self, ordinals):
+        ordinals = np.asarray(ordinals, dtype=np.int64)
+        if self.is_null:
+            return np.full(ordinals.shape, -1, dtype=np.int64)
 
-        return "/" + mapstr
+        index = np.searchsorted(np.asarray(self.starts, dtype=np.int64), ordinals, side="right") - 1
+        inside = (index >= 0) & (ordinals <= np.asarray(self.ends, dtype=np.int64)[np.maximum(index, 0)])
 
+        return np.where(inside, index, -1)
+
+    def get_str_intervals(self):
+        return [[self._ordinal_to_str(start), self._ordinal_to_str(end)] for start, end in zip(self.starts, self.ends)]
 
-    def add_domain(self, sparsity_mapping_1, sparsity_mapping_2):
-        sparsity_mapping_1 = sparsity_mapping_1[1:]
 
-        sparsity_mapping_2 = sparsity_mapping_2[1:].split("/")
-        sparsity_mapping_2 = [i for i in sparsity_mapping_2 if i != ""]
+    def get_intervals(self):
+        return [[datetime.fromordinal(start), datetime.fromordinal(end)] for start, end in zip(self.starts, self.ends)]
+
+    def _str_to_ordinal(self, string):
+        if self._fast_conversions:
+            return date.fromisoformat(string).toordinal()
 
-        for subtract_interval in sparsity_mapping_2:
-            date_interval = subtract_interval.split("|")
-            date_interval = [self.str_to_date(date_interval[0]), self.str_to_date(date_interval[1])]
-            sparsity_mapping_1 = self.add_continuos_interval_to_domain(f"/{sparsity_mapping_1}", date_interval)
+        return self.str_to_date(string).toordinal()
 
-        return SparsityMappingString(resample_freq=self.resample_freq, string=sparsity_mapping_1)
+    def _ordinal_to_str(self, ordinal):
+        if self._fast_conversions:
+            return date.fromordinal(ordinal).isoformat()
 
+        return self.date_to_str(datetime.fromordinal(ordinal))
 
     """
-    Updates the sparsity mapping string of a stock domain by adding a new time interval
+    Parses a sparsity mapping string into sorted lists of interval start and end day ordinals
 
     Parameters
     ----------
 
-    sparsity_mapping: str
-        The sparsity mapping string representing the current domain
-
-    start: string 'YYYY-MM-DD'
-        The start date of the new domain entry
-
-    stop: string 'YYYY-MM-DD'
-        The stop date of the new domain entry
-
-    resample_freq: string
-        The resample frequency of the input intervals
+    mapstring: string
+        A sparsity mapping string
 
     Returns
     -------
 
-    updated_sparsity_mapping: string
-        The updated sparsity mapping string
+    starts, ends: []int, []int
+        The day ordinals of the start and end of each continuous interval
 
+    Raises
+    ------
 
+    ValueError
+        If mapstring is not a valid sparsity mapping string
     """
-    def add_continuos_interval_to_domain(self, domain, continuous_interval):
-        start, stop = continuous_interval
+    def parse(self, mapstring):
+        starts, ends = [], []
 
-        sparsity_mapping_array = domain[1:].split("/")
-        sparsity_mapping_array = [i for i in sparsity_mapping_array if i != ""]
-        sparsity_mapping_array = [[self.str_to_date(i) for i in interval_string.split("|")] for interval_string in sparsity_mapping_array]
-
-        new_sparsity_mapping_array = []
-        for interval in sparsity_mapping_array:
-            if intervals_intersect(interval, [start, stop], unit=self.resample_freq, datestrformat=self.datetime_format):
-                start = min(start, interval[0])
-                stop = max(stop, interval[1])
+        try:
+            assert mapstring[0] == '/'
+            continuous_intervals = [i for i in mapstring[1:].split('/') if i != ""]
 
-                continue
-            
-            new_sparsity_mapping_array.append(interval)
+            for continuous_interval_string in continuous_intervals:
+                continuous_interval = continuous_interval_string.split("|")
+                assert len(continuous_interval) == 2
 
-        new_sparsity_mapping_array.append([start, stop])
-        new_sparsity_mapping_array = sorted(new_sparsity_mapping_array, key=lambda x: x[0])
+                start = self._str_to_ordinal(continuous_interval[0])
+                stop = self._str_to_ordinal(continuous_interval[1])
 
-        return "".join([f'/{self.date_to_str(interval[0])}|{self.date_to_str(interval[1])}' for interval in new_sparsity_mapping_array])
+                assert not ends or start > ends[-1]
+                assert stop >= start
 
-        """
-        1. Collect ordered list of partial domains.
-        2. Loop through current pairs and check if start and stop intersect the partial domain
-            3. To check intersection, sort them by start, then see if end1 > start2 or end2 > start1
-            4. If there is an intersection, absorb the domain into the start and stop and remove it from the list
+                starts.append(start)
+                ends.append(stop)
 
-        5. Sort the list by starting date and combine into sparsity mapping string
-        6. Loop through final result. If the difference between and end and a start is less than a time unit, combine the two
-        """
+        except Exception:
+            raise ValueError(f"Improperly formatted sparsity mapping string {mapstring}")
 
+        return starts, ends
 
     """
-    Calculates the relative complement of two sparsity mapping strings
-
-    Parameters
-    ----------
-
-    sparsity_mapping_1: string
-        Base sparsity mapping string
-
-    sparsity_mapping_2: string
-        Sparsity mapping string to be subtracted
-
-    resample_freq: string
-        The resample frequency of the input intervals
-
-    return_closed: boolean
-        Weather to automatically convert the subtracted intervals into closed intervals
-
-    Returns
-    -------
-
-    difference: string
-        Sparsity mapping string representing the difference between the two domains
-
+    Renders sorted lists of interval start and end day ordinals as a sparsity mapping string
     """
-    def subtract_domain(self, sparsity_mapping_1, sparsity_mapping_2):
-        sparsity_mapping_2 = sparsity_mapping_2[1:].split("/")
-        sparsity_mapping_2 = [i for i in sparsity_mapping_2 if i != ""]
+    def render(self, starts, ends):
+        return "/" + "/".join(f"{self._ordinal_to_str(start)}|{self._ordinal_to_str(end)}" for start, end in zip(starts, ends))
 
-        for subtract_interval in sparsity_mapping_2:
-            sparsity_mapping_1 = self.subtract_continuous_interval_from_domain(sparsity_mapping_1, subtract_interval)
-        
-        return SparsityMappingString(resample_freq=self.resample_freq, string=sparsity_mapping_1)
+    def validate(self, mapstring):
+        self.parse(mapstring)
 
-        """
-        1. Loop through continuous intervals in sparsity mapping 2
-            2. Subtract from sparsity mapping 1
-        3. Return sparsity mapping 1
-        """
+        return mapstring
 
 
     """
-    A helper function for subtract_domain.
-    Takes the difference between a domain and a continuous interval
+    Calculates the union of two sparsity mapping strings
 
     Parameters
     ----------
 
-    domain: string 
-        A sparsity mapping string
-
-    subtraction_interval: string
-        An interval string of the form YYYY-MM-DD|YYYY-MM-DD
-
-    resample_freq: string
-        The resample frequency of the input intervals
+    sparsity_mapping_1: string
+        Base sparsity mapping string
 
-    return_closed: boolean
-        Weather to automatically convert the subtracted intervals into closed intervals
+    sparsity_mapping_2: string
+        Sparsity mapping string to be added
 
     Returns
     -------
-    difference: string
-        Sparsity mapping string representing the difference between the domain and subtraction_interval
-
-    """
-    def subtract_continuous_interval_from_domain(self, domain, subtraction_interval):
-        domain = domain.split("/")
-        domain = [i for i in domain if i != ""]
 
-        subtraction_interval = subtraction_interval.split("|")
-        subtraction_interval = [self.str_to_date(subtraction_interval[0]), self.str_to_date(subtraction_interval[1])]
+    union: SparsityMappingString
+        The union of the two domains. Intervals less than one resample_freq apart are merged.
 
-        all_intervals = []
-
-        for continuous_interval_str in domain:
-            continuous_interval = continuous_interval_str.split("|")
-            continuous_interval = [self.str_to_date(continuous_interval[0]), self.str_to_date(continuous_interval[1])]
-
-            difference = self.subtract_continuous_intervals(continuous_interval, subtraction_interval)
-            all_intervals.append(difference)
-
-        all_intervals = [i for i in all_intervals if i != ""]
-        return "/" + "/".join(all_intervals)
-
-        """
-        1. Loop through domain
-        2. Get continous interval difference
-        3. append to list
-        4. combine everything back into string
-        """
+    """
+    def add_domain(self, sparsity_mapping_1, sparsity_mapping_2):
+        starts_1, ends_1 = self.parse(sparsity_mapping_1)
+        starts_2, ends_2 = self.parse(sparsity_mapping_2)
 
+        return self.from_ordinals(*union_intervals(starts_1, ends_1, starts_2, ends_2, self.unit))
 
 
     """
-    A helper function of subtract_continuous_interval_from_domain. 
-    Applies to single continuous intervals rather than complete, possibly sparse domains.
-
+    Calculates the relative complement of two sparsity mapping strings
 
     Parameters
     ----------
 
-    interval1: string
-        Base continuous interval in sparsity mapping string notation
-
-    interval2: string
-        Continuous interval to be subtracted in sparsity mapping string notation
+    sparsity_mapping_1: string
+        Base sparsity mapping string
 
-    resample_freq: string
-        The resample frequency of the input intervals
+    sparsity_mapping_2: string
+        Sparsity mapping string to be subtracted
 
-    return_closed: boolean
-        Weather to automatically convert the subtracted intervals into closed intervals
-        
     Returns
     -------
 
-    updated_interval: string
-        A new interval in sparsity mapping string format
-
+    difference: SparsityMappingString
+        The difference between the two domains
 
     Notes
     -----
-    The resample frequency is included to prevent the creation of open intervals.
+    The resample frequency is used to prevent the creation of open intervals.
     Subtracting a closed interval from a closed interval results in an open interval.
     However, since the datapoints are discrete, we can easily convert between open and closed
     intervals by adding / subtracting one resample_freq.
 
-    Also, it should be noted that subtract_continuous intervals may return an interval
-
-
     """
-    def subtract_continuous_intervals(self, interval1, interval2):
-        if not intervals_intersect(interval1, interval2, unit=self.resample_freq, datestrformat=self.datetime_format):
-            interval1[0] = self.date_to_str(interval1[0])
-            interval1[1] = self.date_to_str(interval1[1])
-
-            return  f"{interval1[0]}|{interval1[1]}"
-        
-        if interval2[0] <= interval1[0] and interval1[1] <= interval2[1]:
-            return ""
-
-        #1 is proper subset
-        if interval1[0] < interval2[0] and interval2[1] < interval1[1]:
-            interval1[0] = self.date_to_str(interval1[0])
-            interval1[1] = self.date_to_str(interval1[1])
-            return f"{interval1[0]}|{increment(interval2[0], self.resample_freq, decrement=True)}/{increment(interval2[1], self.resample_freq)}|{interval1[1]}"
-        
-        #one starts in front of the other
-        if interval1[0] >= interval2[0]:
-            interval1[0] = self.date_to_str(interval1[0])
-            interval1[1] = self.date_to_str(interval1[1])
-            return f"{increment(interval2[1], self.resample_freq, decrement=True)}|{interval1[1]}"
-        
-        interval1[0] = self.date_to_str(interval1[0])
-        interval1[1] = self.date_to_str(interval1[1])
-        return f"{interval1[0]}|{increment(interval2[0], self.resample_freq)}"
-
-        """
-        Here are the cases:
-
-        1. interval 1 and interval 2 do not intersect:
-            return interval 1
-
-        2. Interval 1 is a subset of interval 2
-            Return ""
-
-        3. Interval 2 is a proper subset of interval 1
-            Produce two new intervals, (interval1[0], interval2[0]) and (interval2[1], interval1[1])
-
-        4. Interval 1 and interval 2 overlap, but neither properly contains the other:
-            Check which end of interval 1 lies within interval 2 and update that end
-        """
\ No newline at end of file
+    def subtract_domain(self, sparsity_mapping_1, sparsity_mapping_2):
+        starts_1, ends_1 = self.parse(sparsity_mapping_1)
+        starts_2, ends_2 = self.parse(sparsity_mapping_2)
+
+        return self.from_ordinals(*subtract_intervals(starts_1, ends_1, starts_2, ends_2, self.unit))
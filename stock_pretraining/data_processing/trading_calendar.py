@@ -0,0 +1,194 @@
+from dateutil.easter import easter
+from dateutil.relativedelta import relativedelta, MO, TH
+
+from datetime import date, timedelta
+from functools import lru_cache
+
+import numpy as np
+
+#single day closures outside the regular holiday rules
+NYSE_SPECIAL_CLOSURES = [
+    date(1994, 4, 27),
+    date(2001, 9, 11), date(2001, 9, 12), date(2001, 9, 13), date(2001, 9, 14),
+    date(2004, 6, 11),
+    date(2007, 1, 2),
+    date(2012, 10, 29), date(2012, 10, 30),
+    date(2018, 12, 5),
+    date(2025, 1, 9),
+]
+
+class TradingCalendar():
+    """
+    The trading days of an exchange as a sorted array of day ordinals.
+
+    A calendar can be used wherever a resample unit is expected for daily data. Stepping one unit moves to
+    the next or previous trading day, so domains that are only separated by weekends and holidays are
+    adjacent, and gaps that contain no trading day are empty. Ordinals outside the table step by plain days.
+
+    Parameters
+    ----------
+
+    trading_days: []int
+        Day ordinals of every trading day in the covered range
+
+    start, end: int
+        Day ordinals of the first and last day the table covers
+
+    name: string
+    """
+    def __init__(self, trading_days, start, end, name=None):
+        self.trading_days = np.unique(np.asarray(trading_days, dtype=np.int64))
+        self.start = start
+        self.end = end
+        self.name = name
+
+    def __repr__(self):
+        return f"TradingCalendar({self.name})"
+
+    """
+    Builds a calendar of weekdays that are not holidays
+
+    Parameters
+    ----------
+
+    holidays: []datetime.date
+        Weekdays without trading
+
+    start_date, end_date: datetime.date
+        The range the table covers
+    """
+    @classmethod
+    def from_holidays(cls, holidays, start_date, end_date, name=None):
+        start, end = start_date.toordinal(), end_date.toordinal()
+
+        ordinals = np.arange(start, end + 1, dtype=np.int64)
+        #ordinal 1 is a Monday
+        weekdays = ordinals[(ordinals - 1) % 7 < 5]
+
+        return cls(weekdays[~np.isin(weekdays, [holiday.toordinal() for holiday in holidays])], start, end, name=name)
+
+    @classmethod
+    def nyse(cls, start_year=1970, end_year=2099):
+        return _nyse(start_year, end_year)
+
+    """
+    Steps day ordinals by a number of trading days
+
+    Parameters
+    ----------
+
+    ordinals: np.ndarray[int64]
+
+    steps: int
+        Positive values step to later trading days, negative values to earlier ones. Ordinals that are not
+        trading days count as lying between the surrounding trading days.
+
+    Returns
+    -------
+
+    stepped: np.ndarray[int64]
+    """
+    def step_ordinals(self, ordinals, steps=1):
+        ordinals = np.asarray(ordinals, dtype=np.int64)
+
+        if steps > 0:
+            positions = np.searchsorted(self.trading_days, ordinals, side="right") + steps - 1
+        else:
+            positions = np.searchsorted(self.trading_days, ordinals, side="left") + steps
+
+        inside = (self.start <= ordinals) & (ordinals <= self.end) & (0 <= positions) & (positions < len(self.trading_days))
+        stepped = self.trading_days[np.clip(positions, 0, len(self.trading_days) - 1)]
+
+        return np.where(inside, stepped, ordinals + steps)
+
+    def step_ordinal(self, ordinal, steps=1):
+        return int(self.step_ordinals(np.array([ordinal]), steps)[0])
+
+    """
+    Moves ordinals forward to the first trading day at or after them
+    """
+    def ceil(self, ordinals):
+        return self.step_ordinals(np.asarray(ordinals, dtype=np.int64) - 1, 1)
+
+    """
+    Moves ordinals back to the last trading day at or before them
+    """
+    def floor(self, ordinals):
+        return self.step_ordinals(np.asarray(ordinals, dtype=np.int64) + 1, -1)
+
+    def is_trading_day(self, ordinals):
+        return np.isin(np.asarray(ordinals, dtype=np.int64), self.trading_days)
+
+
+@lru_cache(maxsize=None)
+def _nyse(start_year, end_year):
+    holidays = [holiday for year in range(start_year, end_year + 1) for holiday in nyse_holidays(year)]
+    return TradingCalendar.from_holidays(holidays, date(start_year, 1, 1), date(end_year, 12, 31), name="NYSE")
+
+
+"""
+Lists the weekdays a year's regular NYSE holidays and special closures fall on
+
+Notes
+-----
+The current holiday rules are applied to every year, except that Martin Luther King Jr. Day starts in
+1998 and Juneteenth in 2022. Holidays on a Saturday are observed on the Friday before and holidays on a
+Sunday on the Monday after, except New Year's Day, which is not observed when it falls on a Saturday.
+"""
+def nyse_holidays(year):
+    def observed(day):
+        if day.weekday() == 5:
+            return day - timedelta(days=1)
+        if day.weekday() == 6:
+            return day + timedelta(days=1)
+        return day
+
+    holidays = [
+        date(year, 2, 1) + relativedelta(weekday=MO(3)),
+        easter(year) - timedelta(days=2),
+        date(year, 5, 31) + relativedelta(weekday=MO(-1)),
+        observed(date(year, 7, 4)),
+        date(year, 9, 1) + relativedelta(weekday=MO(1)),
+        date(year, 11, 1) + relativedelta(weekday=TH(4)),
+        observed(date(year, 12, 25)),
+    ]
+
+    if date(year, 1, 1).weekday() != 5:
+        holidays.append(observed(date(year, 1, 1)))
+
+    if year >= 1998:
+        holidays.append(date(year, 1, 1) + relativedelta(weekday=MO(3)))
+
+    if year >= 2022:
+        holidays.append(observed(date(year, 6, 19)))
+
+    holidays += [closure for closure in NYSE_SPECIAL_CLOSURES if closure.year == year]
+
+    return sorted(holidays)
+
+
+CALENDARS = {
+    "NYSE": TradingCalendar.nyse,
+    "XNYS": TradingCalendar.nyse,
+}
+
+"""
+Resolves a trading calendar setting
+
+Parameters
+----------
+
+calendar: None | string | TradingCalendar
+    None, the name of a calendar in CALENDARS, or a calendar
+
+Returns
+-------
+
+calendar: None | TradingCalendar
+"""
+def get_calendar(calendar):
+    if calendar is None or isinstance(calendar, TradingCalendar):
+        return calendar
+
+    assert calendar in CALENDARS, f"unknown trading calendar {calendar}, expected one of {list(CALENDARS)}"
+    return CALENDARS[calendar]()
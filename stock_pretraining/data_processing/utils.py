@@ -1,6 +1,13 @@
 from dateutil.parser import parse
 from dateutil.relativedelta import relativedelta
 
+from stock_pretraining.data_processing.trading_calendar import TradingCalendar
+
+from datetime import date, datetime
+from functools import lru_cache
+
+import numpy as np
+
 """
 Increments datetime by 1 unit
 
@@ -10,7 +17,7 @@ Parameters
 timeval: datetime.datetime
     A valid datetime
 
-unit: relativedelta keyword argument
+unit: relativedelta keyword argument | TradingCalendar
     The time unit to increment by
 
 datestrformat: str
@@ -29,6 +36,9 @@ new_datestr: str
 """
 
 def increment(timeval, unit, decrement = False):
+    if isinstance(unit, TradingCalendar):
+        return datetime.fromordinal(unit.step_ordinal(timeval.toordinal(), -1 if decrement else 1))
+
     kwargs = {unit: (-1 if decrement else 1)}
     timeval = timeval + relativedelta(**kwargs)
 
@@ -60,4 +70,189 @@ def intervals_intersect(interval1, interval2, unit, datestrformat):
     s1, e1 = interval1
     s2, e2 = interval2
 
-    return not (e1 < increment(s2, unit=unit, decrement=True) or increment(s1, unit=unit, decrement=True) > e2)
\ No newline at end of file
+    return not (e1 < increment(s2, unit=unit, decrement=True) or increment(s1, unit=unit, decrement=True) > e2)
+
+"""
+Steps a proleptic Gregorian day ordinal by a number of resample units
+
+Parameters
+----------
+
+ordinal: int
+    A day ordinal as returned by datetime.toordinal
+
+unit: relativedelta keyword argument | TradingCalendar
+    The time unit to step by. A calendar steps by trading days.
+
+steps: int
+    The number of units to step. Negative values step backwards.
+
+Returns
+-------
+
+stepped: int
+    The stepped day ordinal
+
+Notes
+-----
+Daily steps are plain integer arithmetic. Other units go through relativedelta so that
+month and year ends are clamped the same way increment clamps them.
+"""
+def step_ordinal(ordinal, unit, steps=1):
+    if isinstance(unit, TradingCalendar):
+        return unit.step_ordinal(ordinal, steps)
+
+    if unit == "days":
+        return ordinal + steps
+
+    return _step_calendar_ordinal(ordinal, unit, steps)
+
+
+@lru_cache(maxsize=65536)
+def _step_calendar_ordinal(ordinal, unit, steps):
+    return (date.fromordinal(ordinal) + relativedelta(**{unit: steps})).toordinal()
+
+
+EPOCH_ORDINAL = date(1970, 1, 1).toordinal()
+
+"""
+Vectorized step_ordinal over an array of day ordinals
+
+Parameters
+----------
+
+ordinals: np.ndarray[int64]
+    Day ordinals as returned by datetime.toordinal
+
+unit: relativedelta keyword argument | TradingCalendar
+    The time unit to step by. A calendar steps by trading days.
+
+steps: int
+    The number of units to step. Negative values step backwards.
+
+Returns
+-------
+
+stepped: np.ndarray[int64]
+    The stepped day ordinals. Month and year steps clamp to the end of the month like relativedelta.
+"""
+def step_ordinals(ordinals, unit, steps=1):
+    ordinals = np.asarray(ordinals, dtype=np.int64)
+
+    if isinstance(unit, TradingCalendar):
+        return unit.step_ordinals(ordinals, steps)
+
+    if unit == "days":
+        return ordinals + steps
+
+    if unit == "weeks":
+        return ordinals + 7 * steps
+
+    if unit not in ("months", "years"):
+        return np.fromiter((step_ordinal(int(ordinal), unit, steps) for ordinal in ordinals), dtype=np.int64, count=len(ordinals))
+
+    month_steps = steps * (12 if unit == "years" else 1)
+
+    dates = (ordinals - EPOCH_ORDINAL).astype("datetime64[D]")
+    months = dates.astype("datetime64[M]")
+    day = (dates - months.astype("datetime64[D]")).astype(np.int64)
+
+    target = months + month_steps
+    month_length = ((target + 1).astype("datetime64[D]") - target.astype("datetime64[D]")).astype(np.int64)
+    stepped = target.astype("datetime64[D]") + np.minimum(day, month_length - 1)
+
+    return stepped.astype(np.int64) + EPOCH_ORDINAL
+
+
+"""
+Calculates the union of two sorted, disjoint lists of closed day ordinal intervals
+
+Parameters
+----------
+
+starts1, ends1: []int
+    Interval bounds of the first domain
+
+starts2, ends2: []int
+    Interval bounds of the second domain
+
+unit: resample_options.member | TradingCalendar
+    The minimum descrete unit for intervals. Intervals less than one unit apart are merged.
+
+Returns
+-------
+
+starts, ends: []int, []int
+    Interval bounds of the union
+"""
+def union_intervals(starts1, ends1, starts2, ends2, unit):
+    starts, ends = [], []
+    i, j = 0, 0
+    n1, n2 = len(starts1), len(starts2)
+
+    while i < n1 or j < n2:
+        if j >= n2 or (i < n1 and starts1[i] <= starts2[j]):
+            start, end = starts1[i], ends1[i]
+            i += 1
+        else:
+            start, end = starts2[j], ends2[j]
+            j += 1
+
+        if ends and ends[-1] >= step_ordinal(start, unit, -1):
+            if end > ends[-1]:
+                ends[-1] = end
+        else:
+            starts.append(start)
+            ends.append(end)
+
+    return starts, ends
+
+
+"""
+Calculates the relative complement of two sorted, disjoint lists of closed day ordinal intervals
+
+Parameters
+----------
+
+starts1, ends1: []int
+    Interval bounds of the base domain
+
+starts2, ends2: []int
+    Interval bounds of the domain to be subtracted
+
+unit: resample_options.member | TradingCalendar
+    The minimum descrete unit for intervals. Remaining intervals are closed by stepping
+    one unit away from the subtracted bounds.
+
+Returns
+-------
+
+starts, ends: []int, []int
+    Interval bounds of the difference
+"""
+def subtract_intervals(starts1, ends1, starts2, ends2, unit):
+    starts, ends = [], []
+    j = 0
+    n2 = len(starts2)
+
+    for start, end in zip(starts1, ends1):
+        while j < n2 and ends2[j] < start:
+            j += 1
+
+        cursor = start
+        k = j
+        while k < n2 and starts2[k] <= end and cursor <= end:
+            if starts2[k] > cursor:
+                stop = step_ordinal(starts2[k], unit, -1)
+                if stop >= cursor:
+                    starts.append(cursor)
+                    ends.append(stop)
+
+            cursor = max(cursor, step_ordinal(ends2[k], unit, 1))
+            k += 1
+
+        if cursor <= end:
+            starts.append(cursor)
+            ends.append(end)
+
+    return starts, ends
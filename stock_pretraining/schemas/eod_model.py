@@ -1,14 +1,18 @@
 from stock_pretraining.environment import get_env_variable
 
-from sqlalchemy import Column, Float, String, Date, Enum as SAEnum, UniqueConstraint
+from sqlalchemy import Column, Float, String, Date, Enum as SAEnum, UniqueConstraint, Index, Table, MetaData, PrimaryKeyConstraint
+from sqlalchemy.dialects import postgresql
 from sqlalchemy.dialects.postgresql import UUID as pgUUID
 from sqlalchemy.orm import validates, declarative_base
-from sqlalchemy import create_engine
+from sqlalchemy.schema import CreateTable
+from sqlalchemy import create_engine, text, inspect
 from sqlalchemy_utils import database_exists, create_database
 
 from stock_pretraining.data_processing.sparsity_mapping import SparsityMappingString
 
+import re
 import uuid
+from datetime import date, timedelta
 from dateutil.parser import parse
 from enum import Enum as PythonEnum
 
@@ -29,6 +33,16 @@ class StockData(Base):
     stock_adj_high = Column(Float)
     stock_adj_low = Column(Float)
 
+    #the natural key of a row. Every lookup in the collectors and loaders filters on these columns, in this order,
+    #and upserts resolve conflicts on them.
+    __table_args__ = (Index("uq_stock_data_natural_key", ticker, resample_freq, stock_datetime, unique=True),)
+
+stock_data_index = next(iter(StockData.__table__.indexes))
+stock_data_key = [column.name for column in stock_data_index.columns]
+
+#non unique index on the natural key created by earlier versions, replaced by stock_data_index
+LEGACY_STOCK_DATA_INDEX = "ix_stock_data_ticker_freq_datetime"
+
 class StockDomains(Base):
     __tablename__ = 'stock_domains'
 
@@ -41,25 +55,159 @@ class StockDomains(Base):
     @validates("sparsity_mapping")
     def validate_sparsity_mapping(self, key, mapstr):
         try:
-            base_validator = SparsityMappingString("day")
+            base_validator = SparsityMappingString("days")
             base_validator.validate(mapstr)
 
         except Exception:
-            raise ValueError(f"Improperly formatted sparsity mapping string /{mapstr}")
+            raise ValueError(f"Improperly formatted sparsity mapping string {mapstr}")
 
-        return "/" + mapstr
+        return mapstr
     
 
+#optional datemultirange mirror of sparsity_mapping, so domain algebra and coverage queries can run in SQL.
+#It is not mapped, so databases without it keep working.
+DOMAIN_RANGES_COLUMN = "date_ranges"
+DOMAIN_RANGES_INDEX = "ix_stock_domains_date_ranges"
+
+DOMAIN_RANGES_DDL = [
+    f"ALTER TABLE stock_domains ADD COLUMN IF NOT EXISTS {DOMAIN_RANGES_COLUMN} datemultirange",
+    f"CREATE INDEX IF NOT EXISTS {DOMAIN_RANGES_INDEX} ON stock_domains USING gist ({DOMAIN_RANGES_COLUMN})",
+]
+
+"""
+SQL expression rendering a datemultirange expression as a sparsity mapping string, or NULL if it is empty
+"""
+def sparsity_mapping_sql(ranges):
+    return f"(SELECT string_agg('/' || to_char(lower(r), 'YYYY-MM-DD') || '|' || to_char(upper(r) - 1, 'YYYY-MM-DD'), '' ORDER BY lower(r)) FROM unnest({ranges}) r)"
+
+
+"""
+Renders a sparsity mapping string as a datemultirange literal of the same closed intervals
+"""
+def to_multirange(sparsity_mapping, resample_freq="days"):
+    domain = SparsityMappingString(resample_freq, string=sparsity_mapping)
+    ranges = [f"[{date.fromordinal(start)},{date.fromordinal(end + 1)})" for start, end in zip(domain.starts, domain.ends)]
+
+    return "{" + ",".join(ranges) + "}"
+
+
+"""
+Builds the DDL for a declaratively partitioned stock_data table on PostgreSQL.
+
+stock_data is list partitioned by resample_freq. Daily data, which holds nearly all rows, is partitioned
+again by ticker hash or by year. Monthly and annual data stay in a single partition each.
+
+Parameters
+----------
+
+partition_by: Enum("ticker", "year")
+    How to partition daily data
+
+table_name: string
+    Name of the parent table. Partitions are always named after stock_data.
+
+ticker_partitions: int
+    Number of hash partitions when partitioning by ticker
+
+partition_years: []int
+    Years to create partitions for when partitioning by year. Other dates go to a default partition.
+
+Returns
+-------
+
+statements: []string
+    Statements creating the parent table, its partitions and the composite index
+"""
+def stock_data_partition_ddl(partition_by, table_name="stock_data", ticker_partitions=16, partition_years=None):
+    assert partition_by in ("ticker", "year"), f"invalid partition_by {partition_by}, expected 'ticker' or 'year'"
+
+    if partition_years is None:
+        partition_years = range(1970, date.today().year + 2)
+
+    sub_partition_column = "ticker" if partition_by == "ticker" else "stock_datetime"
+
+    #a partitioned table's primary key must contain its partition columns
+    table = Table(
+        table_name,
+        MetaData(),
+        *[Column(column.name, column.type) for column in StockData.__table__.columns],
+        PrimaryKeyConstraint("id", "resample_freq", sub_partition_column),
+        postgresql_partition_by="LIST (resample_freq)"
+    )
+
+    statements = [str(CreateTable(table).compile(dialect=postgresql.dialect())).strip()]
+
+    for resample_freq in resample_options:
+        partition = f"stock_data_{resample_freq.name}"
+
+        if resample_freq.name != "days":
+            statements.append(f"CREATE TABLE {partition} PARTITION OF {table_name} FOR VALUES IN ('{resample_freq.name}')")
+            continue
+
+        if partition_by == "ticker":
+            statements.append(f"CREATE TABLE {partition} PARTITION OF {table_name} FOR VALUES IN ('{resample_freq.name}') PARTITION BY HASH (ticker)")
+            statements += [f"CREATE TABLE {partition}_{i} PARTITION OF {partition} FOR VALUES WITH (MODULUS {ticker_partitions}, REMAINDER {i})" for i in range(ticker_partitions)]
+
+        else:
+            statements.append(f"CREATE TABLE {partition} PARTITION OF {table_name} FOR VALUES IN ('{resample_freq.name}') PARTITION BY RANGE (stock_datetime)")
+            statements += [f"CREATE TABLE {partition}_{year} PARTITION OF {partition} FOR VALUES FROM ('{year}-01-01') TO ('{year + 1}-01-01')" for year in partition_years]
+            statements.append(f"CREATE TABLE {partition}_default PARTITION OF {partition} DEFAULT")
+
+    #indexes on a partitioned table are created on every partition. Unique ones must contain the partition columns,
+    #which the natural key does.
+    statements.append(f"CREATE UNIQUE INDEX {stock_data_index.name} ON {table_name} ({', '.join(stock_data_key)})")
+
+    return statements
+
+
+"""
+Returns the closed (first, last) date range of a partition bound as rendered by pg_get_expr, for example
+FOR VALUES FROM ('2020-01-01') TO ('2021-01-01'), as YYYY-MM-DD strings. Bounds that do not limit
+stock_datetime, such as hash, list and default partitions, return (None, None).
+"""
+def partition_dates(bound):
+    match = re.fullmatch(r"FOR VALUES FROM \('(\d{4}-\d{2}-\d{2})'\) TO \('(\d{4}-\d{2}-\d{2})'\)", bound or "")
+    if match is None:
+        return None, None
+
+    return match.group(1), str(date.fromisoformat(match.group(2)) - timedelta(days=1))
+
+
 class EOD_Date_Model():
     resample_options = resample_options
     StockData = StockData
     StockDomains = StockDomains
 
-    def __init__(self, database_url=None):
+    """
+    Parameters
+    ----------
+
+    database_url: string
+        Defaults to the database_url environment variable
+
+    partition_by: None | Enum("ticker", "year")
+        Partition stock_data by resample_freq, then daily data by ticker hash or by year. PostgreSQL only.
+        See stock_data_partition_ddl.
+
+    ticker_partitions: int
+        Number of hash partitions when partitioning by ticker
+
+    partition_years: []int
+        Years to create partitions for when partitioning by year
+
+    domain_ranges: bool
+        Add a datemultirange column with a GiST index to stock_domains that mirrors sparsity_mapping.
+        PostgreSQL 14 or later only. See add_domain_ranges.
+    """
+    def __init__(self, database_url=None, partition_by=None, ticker_partitions=16, partition_years=None, domain_ranges=False):
         if database_url is None:
             database_url = get_env_variable("database_url")
 
         self.database_url = database_url
+        self.partition_by = partition_by
+        self.ticker_partitions = ticker_partitions
+        self.partition_years = partition_years
+        self.domain_ranges = domain_ranges
 
     def create(self):
         engine = create_engine(url=self.database_url)
@@ -68,10 +216,133 @@ class EOD_Date_Model():
             print("Creating database...")
             create_database(engine.url)
             print("Creating tables...")
-            Base.metadata.create_all(bind=engine)
+            self.create_tables(engine)
             print("Done.")
         else:
             print("Database Already Exists.")
+
+    def create_tables(self, engine):
+        self.create_stock_data(engine)
+
+        if self.domain_ranges:
+            self.add_domain_ranges(engine)
+
+    def create_stock_data(self, engine):
+        if self.partition_by is None:
+            Base.metadata.create_all(bind=engine)
+            return
+
+        assert engine.dialect.name == "postgresql", "stock_data can only be partitioned on PostgreSQL"
+
+        with engine.begin() as connection:
+            StockData.__table__.c.resample_freq.type.create(connection, checkfirst=True)
+
+            for statement in self.partition_ddl():
+                connection.execute(text(statement))
+
+            Base.metadata.create_all(bind=connection, tables=[StockDomains.__table__])
+
+    """
+    Adds the date_ranges column and its GiST index to stock_domains if they are missing, and fills it from
+    sparsity_mapping for rows that do not have it yet, in one transaction.
+    """
+    def add_domain_ranges(self, engine):
+        assert engine.dialect.name == "postgresql", "domain ranges require PostgreSQL 14 or later"
+
+        with engine.begin() as connection:
+            for statement in DOMAIN_RANGES_DDL:
+                connection.execute(text(statement))
+
+            missing = connection.execute(text(f"SELECT id, resample_freq, sparsity_mapping FROM stock_domains WHERE {DOMAIN_RANGES_COLUMN} IS NULL")).all()
+            if missing:
+                connection.execute(
+                    text(f"UPDATE stock_domains SET {DOMAIN_RANGES_COLUMN} = CAST(:ranges AS datemultirange) WHERE id = :id"),
+                    [{"id": id, "ranges": to_multirange(sparsity_mapping, resample_freq)} for id, resample_freq, sparsity_mapping in missing]
+                )
+
+    def partition_ddl(self, table_name="stock_data"):
+        return stock_data_partition_ddl(self.partition_by, table_name=table_name, ticker_partitions=self.ticker_partitions, partition_years=self.partition_years)
+
+    """
+    Brings an existing database up to the current schema.
+
+    Creates the unique natural key index on stock_data if it is missing. Rows duplicating the natural key are
+    deleted first, keeping one of them, and the non unique index of earlier versions is dropped. If partition_by
+    is set and stock_data is not partitioned yet, its rows are copied into a new partitioned table that then
+    replaces it, all in one transaction. Writers must be stopped while that runs. If domain_ranges is set, the
+    date_ranges column is added to stock_domains and filled.
+
+    Parameters
+    ----------
+
+    concurrently: bool
+        Build the index with CREATE INDEX CONCURRENTLY so writes are not blocked. PostgreSQL only, and
+        ignored while partitioning.
+    """
+    def migrate(self, concurrently=False):
+        engine = create_engine(url=self.database_url)
+
+        if self.domain_ranges:
+            self.add_domain_ranges(engine)
+
+        indexes = [index["name"] for index in inspect(engine).get_indexes("stock_data")]
+
+        if stock_data_index.name not in indexes:
+            with engine.begin() as connection:
+                self.deduplicate(connection)
+
+                if LEGACY_STOCK_DATA_INDEX in indexes:
+                    connection.execute(text(f"DROP INDEX {LEGACY_STOCK_DATA_INDEX}"))
+
+        if self.partition_by is not None and not self.is_partitioned(engine):
+            with engine.begin() as connection:
+                for statement in self.partition_migration():
+                    connection.execute(text(statement))
+
+            return
+
+        if concurrently and engine.dialect.name == "postgresql":
+            with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as connection:
+                connection.execute(text(f"CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS {stock_data_index.name} ON stock_data ({', '.join(stock_data_key)})"))
+
+            return
+
+        stock_data_index.create(engine, checkfirst=True)
+
+    """
+    Returns the statements that replace an unpartitioned stock_data with a partitioned copy of its rows.
+
+    The natural key index is only created once the old stock_data is dropped, since index names share the
+    schema namespace and the old table still holds an index of the same name.
+    """
+    def partition_migration(self):
+        columns = ", ".join(column.name for column in StockData.__table__.columns)
+        statements = [statement for statement in self.partition_ddl(table_name="stock_data_partitioned") if stock_data_index.name not in statement]
+
+        return statements + [
+            f"INSERT INTO stock_data_partitioned ({columns}) SELECT {columns} FROM stock_data",
+            "DROP TABLE stock_data",
+            "ALTER TABLE stock_data_partitioned RENAME TO stock_data",
+            f"CREATE UNIQUE INDEX {stock_data_index.name} ON stock_data ({', '.join(stock_data_key)})",
+        ]
+
+    """
+    Deletes rows that duplicate the natural key of another row, keeping one of them
+    """
+    def deduplicate(self, connection):
+        key_match = " AND ".join(f"duplicate.{column} = kept.{column}" for column in stock_data_key)
+
+        if connection.dialect.name == "postgresql":
+            connection.execute(text(f"DELETE FROM stock_data duplicate USING stock_data kept WHERE {key_match} AND duplicate.ctid < kept.ctid"))
+        else:
+            connection.execute(text(f"DELETE FROM stock_data WHERE rowid NOT IN (SELECT max(rowid) FROM stock_data GROUP BY {', '.join(stock_data_key)})"))
+
+    def is_partitioned(self, engine):
+        if engine.dialect.name != "postgresql":
+            return False
+
+        with engine.connect() as connection:
+            return connection.execute(text("SELECT relkind = 'p' FROM pg_class WHERE relname = 'stock_data' AND pg_table_is_visible(oid)")).scalar() or False
     
 
 if __name__ == "__main__":
@@ -0,0 +1,9 @@
+from .quantile_bins import ReservoirSample, bucketize
+
+#Tokenizer needs torch, so it is only imported once it is used
+def __getattr__(name):
+    if name == "Tokenizer":
+        from .tokenizer import Tokenizer
+        return Tokenizer
+
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,80 @@
+import numpy as np
+
+class ReservoirSample():
+    """
+    A uniform sample without replacement of at most size values per feature of a stream.
+
+    Every value gets a random priority and the size values with the lowest priorities are kept, which
+    selects every value of the stream with the same probability. Batches are merged with np.argpartition,
+    so memory stays bounded by size values per feature plus one batch.
+    """
+    def __init__(self, size, seed=None):
+        self.size = size
+        self.rng = np.random.default_rng(seed)
+        self.values = None
+        self.priorities = None
+
+    def add(self, batch):
+        if self.values is None:
+            self.values = [np.empty(0) for _ in range(batch.shape[1])]
+            self.priorities = [np.empty(0) for _ in range(batch.shape[1])]
+
+        assert batch.shape[1] == len(self.values), f"Expected {len(self.values)} features, got {batch.shape[1]}"
+
+        for feature in range(batch.shape[1]):
+            column = batch[:, feature]
+            column = column[np.isfinite(column)]
+
+            values = np.concatenate([self.values[feature], column])
+            priorities = np.concatenate([self.priorities[feature], self.rng.random(len(column))])
+
+            if len(values) > self.size:
+                keep = np.argpartition(priorities, self.size)[:self.size]
+                values, priorities = values[keep], priorities[keep]
+
+            self.values[feature], self.priorities[feature] = values, priorities
+
+    """
+    Returns the n_bins - 1 inner quantile edges and the n_bins bin medians of every feature
+    """
+    def quantiles(self, n_bins):
+        assert self.values is not None and all(len(values) for values in self.values), "No finite values to fit on"
+
+        edges = np.stack([np.quantile(values, np.arange(1, n_bins) / n_bins) for values in self.values])
+        centers = np.stack([np.quantile(values, (np.arange(n_bins) + 0.5) / n_bins) for values in self.values])
+
+        return edges, centers
+
+
+"""
+Assigns values to quantile bins with NumPy. A value equal to an edge goes to the bin above it, as in
+Tokenizer.forward, which does the same on tensors with torch.searchsorted(right=True).
+
+Parameters
+----------
+
+values: np.ndarray
+    [... x feature] values
+
+edges: np.ndarray
+    [feature x n_bins - 1] sorted inner bin edges of every feature
+
+nan_token: int
+    Token of NaN values
+
+Returns
+-------
+
+tokens: np.ndarray
+    [... x feature] int64 tokens in [0, n_bins), or nan_token where values is NaN
+"""
+def bucketize(values, edges, nan_token):
+    assert values.shape[-1] == edges.shape[0], f"Expected {edges.shape[0]} features, got {values.shape[-1]}"
+
+    tokens = np.empty(values.shape, dtype=np.int64)
+    for feature in range(edges.shape[0]):
+        tokens[..., feature] = np.searchsorted(edges[feature], values[..., feature], side="right")
+
+    tokens[np.isnan(values)] = nan_token
+
+    return tokens
@@ -1,14 +1,223 @@
+import torch
 import torch.nn as nn
 
+import numpy as np
+
+from stock_pretraining.tokenization.quantile_bins import ReservoirSample, bucketize
+
+import hashlib
+import json
+
 
 class Tokenizer(nn.Module):
+    """
+    Turns [batch x time x feature] value tensors into [batch x time x feature] tokens.
+
+    Every feature has its own quantile bin edges, so each of its n_bins tokens is about equally frequent in
+    the corpus the tokenizer was fitted on. Edges are fitted once with fit or fit_loader, which stream over
+    the corpus and keep a bounded uniform sample per feature, and saved with save. forward then bucketizes
+    whole batches at once with torch.searchsorted, the batched form of torch.bucketize that takes one row of
+    edges per feature. Missing values get nan_token.
+
+    Parameters
+    ----------
+
+    config: dict | None
+        n_bins: number of value tokens per feature. Defaults to 256.
+        sample_size: maximum number of values per feature kept while fitting. Defaults to 1,000,000.
+        columns: the loader columns fit_loader reads, in feature order. Defaults to every column of stock_data other than id.
+        seed: seed of the fitting sample
+    """
     def __init__(self, config=None):
-        super(self, Tokenizer).__init__()
+        super(Tokenizer, self).__init__()
 
         if not config:
             config = {}
 
-    def forward():
-        ...
+        self.config = config
+        self.n_bins = config.get("n_bins", 256)
+        self.sample_size = config.get("sample_size", 1_000_000)
+        self.columns = config.get("columns")
+
+        assert self.n_bins > 1, "n_bins must be at least 2"
+
+        #[feature x n_bins - 1] inner bin edges and [feature x n_bins] bin medians, set by fit
+        self.register_buffer("edges", None)
+        self.register_buffer("centers", None)
+
+    @property
+    def nan_token(self):
+        return self.n_bins
+
+    @property
+    def vocab_size(self):
+        return self.n_bins + 1
+
+    @property
+    def fitted(self):
+        return self.edges is not None
+
+    """
+    Tokenizes values
+
+    Parameters
+    ----------
+
+    x: torch.Tensor
+        [... x feature] values
+
+    Returns
+    -------
+
+    tokens: torch.Tensor
+        [... x feature] int64 tokens in [0, n_bins), or nan_token where x is NaN
+    """
+    def forward(self, x):
+        assert self.fitted, "Tokenizer must be fitted or loaded before use"
+        assert x.shape[-1] == self.edges.shape[0], f"Expected {self.edges.shape[0]} features, got {x.shape[-1]}"
+
+        edges = self.edges.to(dtype=x.dtype, device=x.device)
+        shape = x.shape
+
+        #one row per feature, so each row is searched against its own edges
+        values = x.reshape(-1, shape[-1]).transpose(0, 1).contiguous()
+        tokens = torch.searchsorted(edges, values, right=True)
+        tokens = tokens.masked_fill_(torch.isnan(values), self.nan_token)
+
+        return tokens.transpose(0, 1).reshape(shape)
+
+    """
+    Tokenizes a numpy array on the CPU, for offline stages such as TokenCorpus. Tokens match forward.
+
+    Parameters
+    ----------
+
+    values: np.ndarray
+        [... x feature] values
+
+    Returns
+    -------
+
+    tokens: np.ndarray
+        [... x feature] int64 tokens
+    """
+    def encode(self, values):
+        assert self.fitted, "Tokenizer must be fitted or loaded before use"
+        return bucketize(np.asarray(values, dtype=np.float32), self.edges.cpu().numpy(), self.nan_token)
+
+    """
+    Identifies the configuration and fitted edges, so tokens written with other edges can be detected
+    """
+    def fingerprint(self):
+        assert self.fitted, "Tokenizer must be fitted or loaded before use"
+
+        digest = hashlib.sha1(json.dumps(self.config, sort_keys=True, default=str).encode())
+        digest.update(self.edges.cpu().numpy().tobytes())
+
+        return digest.hexdigest()
+
+    """
+    Maps tokens back to the median value of their bin. nan_token maps to NaN.
+
+    Parameters
+    ----------
+
+    tokens: torch.Tensor
+        [... x feature] tokens
+
+    Returns
+    -------
+
+    values: torch.Tensor
+        [... x feature] float32 values
+    """
+    def decode(self, tokens):
+        assert self.fitted, "Tokenizer must be fitted or loaded before use"
+
+        features = torch.arange(tokens.shape[-1], device=tokens.device).expand_as(tokens)
+        centers = torch.nn.functional.pad(self.centers.to(tokens.device), (0, 1), value=float("nan"))
+
+        return centers[features, tokens]
+
+    """
+    Fits the bin edges on a corpus streamed in batches. Only a uniform sample of at most sample_size values
+    per feature is held in memory, however long the corpus is.
+
+    Parameters
+    ----------
+
+    batches: iterable(np.ndarray | torch.Tensor)
+        [... x feature] values. NaN and infinite values are ignored.
+
+    Returns
+    -------
+
+    tokenizer: Tokenizer
+    """
+    def fit(self, batches):
+        sample = ReservoirSample(self.sample_size, seed=self.config.get("seed"))
+
+        for batch in batches:
+            if isinstance(batch, torch.Tensor):
+                batch = batch.detach().cpu().numpy()
+
+            batch = np.asarray(batch, dtype=np.float64)
+            sample.add(batch.reshape(-1, batch.shape[-1]))
+
+        edges, centers = sample.quantiles(self.n_bins)
+        self.edges = torch.from_numpy(edges).to(torch.float32)
+        self.centers = torch.from_numpy(centers).to(torch.float32)
+
+        return self
+
+    """
+    Fits the bin edges on the rows a SequentialLoader streams, one chunk of rows at a time
+
+    Parameters
+    ----------
+
+    loader: SequentialLoader
+
+    tickers: []string
+
+    start_date: string
+
+    end_date: string
+
+    resample_freq: resample_options.member
+
+    chunk_rows: int
+        Maximum number of rows held at once
+
+    Returns
+    -------
+
+    tokenizer: Tokenizer
+    """
+    def fit_loader(self, loader, tickers, start_date, end_date, resample_freq="days", chunk_rows=100_000):
+        from stock_pretraining.data_processing.sequential_loaders.parquet_mirror import VALUE_COLUMNS
+
+        columns = list(VALUE_COLUMNS if self.columns is None else self.columns)
+        chunks = loader.stream_rows(tickers, start_date, end_date, resample_freq, columns=columns, chunk_rows=chunk_rows)
+
+        return self.fit(chunk[columns].to_numpy(dtype=np.float64) for chunk in chunks)
+
+    """
+    Saves the configuration and the fitted edges
+    """
+    def save(self, path):
+        assert self.fitted, "Tokenizer must be fitted before it is saved"
+        torch.save({"config": self.config, "state_dict": self.state_dict()}, path)
+
+    """
+    Loads a tokenizer written by save
+    """
+    @classmethod
+    def load(cls, path, map_location="cpu"):
+        saved = torch.load(path, map_location=map_location)
+
+        tokenizer = cls(saved["config"])
+        tokenizer.edges = saved["state_dict"]["edges"]
+        tokenizer.centers = saved["state_dict"]["centers"]
 
-    
\ No newline at end of file
+        return tokenizer
@@ -0,0 +1,112 @@
+import pytest
+import uuid
+import pandas as pd
+from datetime import datetime
+
+from stock_pretraining.data_processing import EODCollector
+from stock_pretraining.schemas.eod_model import Base, StockDomains
+
+#helpers shared by test modules are exposed as fixtures, so tests never import each other
+
+CSV = """date,close,high,low,open,volume,adjClose,adjHigh,adjLow,adjOpen,adjVolume,divCash,splitFactor
+2020-01-02,324.87,324.89,322.53,323.54,59151241,308.26,308.28,306.04,307.00,59151241,0.0,1.0
+2020-01-03,322.41,323.64,321.10,321.16,77709738,305.93,307.09,304.68,304.73,77709738,0.0,1.0
+"""
+
+
+class FakeCollector(EODCollector):
+    def __init__(self, config=None):
+        super().__init__(config)
+        self.requests = []
+        self.price = 1.0
+
+    def date_to_str(self, date):
+        return date if isinstance(date, str) else date.strftime("%Y-%m-%d")
+
+    def str_to_date(self, string):
+        return datetime.strptime(string, "%Y-%m-%d")
+
+    def set_config(self, config):
+        self.database_url = config["database_url"]
+        self.flush_rows = config.get("flush_rows")
+        self.write_mode = config.get("write_mode", "append")
+        self.trading_calendar = config.get("trading_calendar")
+        self.derive_resampled = config.get("derive_resampled", False)
+        self.domain_ranges = config.get("domain_ranges", False)
+        self.metrics = config.get("metrics")
+        self.metrics_path = config.get("metrics_path")
+        self.metrics_format = config.get("metrics_format", "prometheus")
+
+    def retrieve_data(self, ticker, start_date, end_date, resample_freq):
+        self.requests.append((ticker, start_date, end_date))
+        dates = pd.date_range(start_date, end_date, freq="D")
+
+        return pd.DataFrame({
+            'id': [uuid.uuid4() for _ in range(len(dates))],
+            'ticker': ticker,
+            'resample_freq': resample_freq,
+            'stock_datetime': dates.date,
+            'stock_adj_volume': 1.0,
+            'stock_adj_open': 1.0,
+            'stock_adj_close': self.price,
+            'stock_adj_high': 1.0,
+            'stock_adj_low': 1.0,
+        })
+
+
+"""
+The FakeCollector class, for test modules that extend it
+"""
+@pytest.fixture
+def fake_collector_class():
+    return FakeCollector
+
+
+"""
+Creates collectors on one SQLite database per test: make_collector(cls=FakeCollector, **config)
+"""
+@pytest.fixture
+def make_collector(tmp_path):
+    def make(cls=FakeCollector, **config):
+        collector = cls({"database_url": f"sqlite:///{tmp_path / 'stocks.db'}", **config})
+        Base.metadata.create_all(collector.engine)
+
+        return collector
+
+    return make
+
+
+@pytest.fixture
+def collector(make_collector):
+    return make_collector()
+
+
+"""
+Reads the stored domains of a collector as {(ticker, resample_freq): sparsity_mapping}
+"""
+@pytest.fixture
+def stored_domains():
+    def read(collector):
+        return {(record.ticker, record.resample_freq): record.sparsity_mapping for record in collector.session.query(StockDomains).all()}
+
+    return read
+
+
+"""
+A Tiingo CSV response body with two rows
+"""
+@pytest.fixture
+def tiingo_csv():
+    return CSV
+
+
+"""
+Splits a text into byte chunks, as a streamed response delivers it: chunked(text, size=7)
+"""
+@pytest.fixture
+def chunked():
+    def split(text, size=7):
+        body = text.encode()
+        return [body[i:i + size] for i in range(0, len(body), size)]
+
+    return split
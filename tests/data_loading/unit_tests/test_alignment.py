@@ -0,0 +1,52 @@
+import numpy as np
+import pandas as pd
+from datetime import date
+
+from stock_pretraining.data_processing import SequentialLoader
+from stock_pretraining.data_processing.sequential_loaders.alignment import align
+
+ROWS = pd.DataFrame({
+    "ticker": ["SPY", "SPY", "SPY", "NVDA", "NVDA"],
+    "resample_freq": "days",
+    "stock_datetime": [date(2020, 1, 2), date(2020, 1, 3), date(2020, 1, 6), date(2020, 1, 3), date(2020, 1, 7)],
+    "stock_adj_close": [1.0, 2.0, 3.0, 10.0, 20.0],
+})
+
+
+def test_inner_join():
+    dates, values, mask = align(ROWS, ["SPY", "NVDA"], ["stock_adj_close"])
+
+    assert dates == [date(2020, 1, 3)]
+    assert values[:, :, 0].tolist() == [[2.0, 10.0]]
+    assert mask.all()
+
+
+def test_outer_join():
+    dates, values, mask = align(ROWS, ["SPY", "NVDA", "AAPL"], ["stock_adj_close"], outer_join=True)
+
+    assert dates == [date(2020, 1, day) for day in (2, 3, 6, 7)]
+    assert mask.tolist() == [[True, False, False], [True, True, False], [True, False, False], [False, True, False]]
+    assert np.array_equal(values[:, :, 0], [[1.0, np.nan, np.nan], [2.0, 10.0, np.nan], [3.0, np.nan, np.nan], [np.nan, 20.0, np.nan]], equal_nan=True)
+
+
+def test_forward_fill():
+    dates, values, mask = align(ROWS, ["SPY", "NVDA"], ["stock_adj_close"], outer_join=True, ffill=True)
+
+    assert np.array_equal(values[:, :, 0], [[1.0, np.nan], [2.0, 10.0], [3.0, 10.0], [3.0, 20.0]], equal_nan=True)
+    assert mask.sum() == 5
+
+
+def test_get_rows_outer_join(make_collector):
+    collector = make_collector()
+    collector.collect_data(["SPY"], "2020-01-01", "2020-01-05", "days")
+    collector.collect_data(["NVDA"], "2020-01-04", "2020-01-08", "days")
+
+    loader = SequentialLoader({"database_url": str(collector.engine.url)})
+
+    inner = loader.get_rows(["SPY", "NVDA"], "2020-01-01", "2020-01-10", columns=["stock_adj_close"])
+    assert list(inner.columns) == ["ticker", "resample_freq", "stock_datetime", "stock_adj_close"]
+    assert inner[["ticker", "stock_datetime"]].values.tolist() == [[ticker, date(2020, 1, day)] for ticker in ["NVDA", "SPY"] for day in (4, 5)]
+
+    outer = loader.get_rows(["SPY", "NVDA"], "2020-01-01", "2020-01-10", outer_join=True, columns=["stock_adj_close"])
+    assert len(outer) == 16
+    assert outer["stock_adj_close"].isna().sum() == 6
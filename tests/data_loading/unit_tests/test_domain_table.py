@@ -0,0 +1,66 @@
+import pytest
+from datetime import datetime
+from stock_pretraining import SparsityMappingString
+from stock_pretraining.data_processing.domain_table import DomainTable
+
+
+domains = {
+    ("SPY", "days"): "/2020-01-01|2020-01-10/2020-02-01|2020-02-10",
+    ("NVDA", "days"): "/2019-06-01|2020-06-01",
+    ("AAPL", "days"): "/",
+    ("QQQ", "months"): "/2019-01-01|2019-06-01/2019-09-01|2019-12-01",
+}
+
+
+def test_round_trip():
+    table = DomainTable.from_domains(domains)
+
+    for key, string in domains.items():
+        assert table.get(key).string == string
+
+    assert table.get(("MSFT", "days")).is_null
+
+
+@pytest.mark.parametrize("other", [
+    {("SPY", "days"): "/2020-01-11|2020-01-15", ("AAPL", "days"): "/2020-01-01|2020-01-02"},
+    {("NVDA", "days"): "/2020-03-01|2020-03-05/2020-05-30|2020-07-01", ("QQQ", "months"): "/2019-07-01|2019-08-01"},
+    {("QQQ", "months"): "/2019-03-15|2019-10-15", ("TSLA", "days"): "/2020-01-01|2020-01-01"},
+])
+def test_matches_sparsity_mapping_strings(other):
+    table = DomainTable.from_domains(domains)
+    other_table = DomainTable.from_domains(other)
+
+    union = table + other_table
+    difference = table - other_table
+    reverse_difference = other_table - table
+
+    for key in set(domains) | set(other):
+        domain = SparsityMappingString(key[1], domains.get(key))
+        other_domain = SparsityMappingString(key[1], other.get(key))
+
+        assert union.get(key).string == (domain + other_domain).string
+        assert difference.get(key).string == (domain - other_domain).string
+        assert reverse_difference.get(key).string == (other_domain - domain).string
+
+
+def test_plan():
+    table = DomainTable.from_domains(domains)
+    keys = [("SPY", "days"), ("AAPL", "days"), ("MSFT", "days")]
+
+    assert table.plan("2020-01-05", "2020-02-05", keys) == [
+        ("SPY", datetime(2020, 1, 11), datetime(2020, 1, 31)),
+        ("AAPL", datetime(2020, 1, 5), datetime(2020, 2, 5)),
+        ("MSFT", datetime(2020, 1, 5), datetime(2020, 2, 5)),
+    ]
+
+
+def test_update_and_select():
+    table = DomainTable.from_domains(domains).update({("SPY", "days"): "/2021-01-01|2021-01-02"})
+
+    assert table.get(("SPY", "days")).string == "/2021-01-01|2021-01-02"
+    assert table.get(("NVDA", "days")).string == domains[("NVDA", "days")]
+
+    selected = table.select([("NVDA", "days"), ("MSFT", "days")])
+    assert selected.keys == [("NVDA", "days"), ("MSFT", "days")]
+    assert selected.get(("NVDA", "days")).string == domains[("NVDA", "days")]
+    assert selected.get(("MSFT", "days")).is_null
@@ -0,0 +1,177 @@
+import pytest
+import uuid
+import pandas as pd
+
+from sqlalchemy import event
+
+from stock_pretraining.schemas.eod_model import StockData
+
+
+def test_collect_data_fills_gaps(collector, stored_domains):
+    collector.collect_data(["SPY", "NVDA"], "2020-01-01", "2020-01-10", "days")
+    collector.requests.clear()
+
+    collector.collect_data(["SPY", "NVDA", "AAPL"], "2020-01-05", "2020-01-15", "days")
+
+    assert collector.requests == [
+        ("SPY", "2020-01-11", "2020-01-15"),
+        ("NVDA", "2020-01-11", "2020-01-15"),
+        ("AAPL", "2020-01-05", "2020-01-15"),
+    ]
+    assert stored_domains(collector) == {
+        ("SPY", "days"): "/2020-01-01|2020-01-15",
+        ("NVDA", "days"): "/2020-01-01|2020-01-15",
+        ("AAPL", "days"): "/2020-01-05|2020-01-15",
+    }
+    assert collector.session.query(StockData).filter(StockData.ticker == "SPY").count() == 15
+
+
+def test_collect_data_loads_domains_in_one_query(collector, make_collector):
+    collector.collect_data(["SPY", "NVDA"], "2020-01-01", "2020-01-10", "days")
+
+    fresh = make_collector()
+    statements = []
+    event.listen(fresh.engine, "before_cursor_execute", lambda conn, cursor, statement, *args: statements.append(statement))
+
+    fresh.collect_data(["SPY", "NVDA", "AAPL"], "2020-01-01", "2020-01-10", "days")
+
+    assert len([statement for statement in statements if "FROM stock_domains" in statement]) == 1
+    assert fresh.requests == [("AAPL", "2020-01-01", "2020-01-10")]
+
+
+def test_set_data_requires_overwrite(collector, stored_domains):
+    collector.collect_data(["SPY"], "2020-01-01", "2020-01-10", "days")
+
+    with pytest.raises(AssertionError, match="overwrite_existing"):
+        collector.set_data("SPY", "2020-01-05", "2020-01-12", "days")
+
+    collector.set_data("SPY", "2020-01-05", "2020-01-12", "days", overwrite_existing=True)
+
+    assert stored_domains(collector) == {("SPY", "days"): "/2020-01-01|2020-01-12"}
+    assert collector.session.query(StockData).filter(StockData.ticker == "SPY").count() == 12
+
+
+def test_delete_data(collector, stored_domains):
+    collector.collect_data(["SPY", "NVDA"], "2020-01-01", "2020-01-10", "days")
+    collector.delete_data(["SPY", "NVDA"], "2020-01-04", "2020-01-10", "days")
+    collector.delete_data(["NVDA"], "2020-01-01", "2020-01-03", "days")
+
+    assert stored_domains(collector) == {("SPY", "days"): "/2020-01-01|2020-01-03"}
+    assert collector.get_domain("NVDA", "days").is_null
+    assert collector.session.query(StockData).count() == 3
+
+
+def test_bulk_delete_data(collector, stored_domains):
+    tickers = [f"T{i}" for i in range(50)]
+    collector.collect_data(tickers, "2020-01-01", "2020-01-10", "days")
+
+    statements, commits = [], []
+    event.listen(collector.engine, "before_cursor_execute", lambda conn, cursor, statement, *args: statements.append(statement))
+    event.listen(collector.engine, "commit", lambda conn: commits.append(conn))
+
+    collector.delete_data(tickers + ["MISSING"], "2020-01-05", "2020-01-20", "days")
+
+    assert len([statement for statement in statements if statement.startswith("DELETE FROM stock_data")]) == 1
+    assert len(commits) == 1
+    assert set(stored_domains(collector).values()) == {"/2020-01-01|2020-01-04"}
+    assert collector.session.query(StockData).count() == 200
+
+
+def test_accumulated_writes(make_collector, stored_domains):
+    collector = make_collector(flush_rows=25)
+
+    inserts = []
+    event.listen(collector.engine, "before_cursor_execute", lambda conn, cursor, statement, *args: inserts.append(statement) if statement.startswith("INSERT INTO stock_data") else None)
+
+    collector.collect_data(["SPY", "NVDA", "AAPL"], "2020-01-01", "2020-01-10", "days")
+
+    #the first two gaps are buffered until the third crosses flush_rows
+    assert len(inserts) == 1
+    assert collector.session.query(StockData).count() == 30
+    assert stored_domains(collector) == {(ticker, "days"): "/2020-01-01|2020-01-10" for ticker in ["SPY", "NVDA", "AAPL"]}
+
+    collector.write_data("MSFT", "2020-01-01", "2020-01-10", "days", collector.retrieve_data("MSFT", "2020-01-01", "2020-01-10", "days"))
+    assert collector.get_domain("MSFT", "days").is_null
+
+    collector.flush_data()
+    assert collector.get_domain("MSFT", "days").string == "/2020-01-01|2020-01-10"
+
+
+@pytest.mark.parametrize("write_mode", ["append", "upsert"])
+def test_uuid_ids_in_every_write_mode(make_collector, write_mode):
+    collector = make_collector(write_mode=write_mode)
+    collector.collect_data(["SPY"], "2020-01-01", "2020-01-03", "days")
+
+    ids = [row.id for row in collector.session.query(StockData).all()]
+    assert len(ids) == 3 and all(isinstance(id, uuid.UUID) for id in ids)
+
+
+def test_upsert_overwrite(make_collector, stored_domains):
+    collector = make_collector(write_mode="upsert")
+    collector.collect_data(["SPY"], "2020-01-01", "2020-01-10", "days")
+
+    statements = []
+    event.listen(collector.engine, "before_cursor_execute", lambda conn, cursor, statement, *args: statements.append(statement))
+
+    collector.price = 2.0
+    collector.set_data("SPY", "2020-01-05", "2020-01-12", "days", overwrite_existing=True)
+
+    assert not [statement for statement in statements if statement.startswith("DELETE FROM stock_data")]
+    assert stored_domains(collector) == {("SPY", "days"): "/2020-01-01|2020-01-12"}
+
+    closes = dict(collector.session.query(StockData.stock_datetime, StockData.stock_adj_close).all())
+    assert len(closes) == collector.session.query(StockData).count() == 12
+    assert [closes[day] for day in sorted(closes)] == [1.0] * 4 + [2.0] * 8
+
+
+def test_batch_commits_rows_and_domains_together(collector, stored_domains):
+    commits = []
+    event.listen(collector.engine, "commit", lambda conn: commits.append(conn))
+
+    with collector.batch(flush_rows=1000):
+        collector.collect_data(["SPY", "NVDA"], "2020-01-01", "2020-01-10", "days")
+        collector.collect_data(["SPY", "AAPL"], "2020-01-05", "2020-01-15", "days")
+
+        #the cache already covers the buffered rows, so the second call only requests the new tail of SPY
+        assert collector.requests[2:] == [("SPY", "2020-01-11", "2020-01-15"), ("AAPL", "2020-01-05", "2020-01-15")]
+        assert stored_domains(collector) == {}
+
+    assert len(commits) == 1
+    assert stored_domains(collector) == {
+        ("SPY", "days"): "/2020-01-01|2020-01-15",
+        ("NVDA", "days"): "/2020-01-01|2020-01-10",
+        ("AAPL", "days"): "/2020-01-05|2020-01-15",
+    }
+    assert collector.session.query(StockData).count() == 36
+    assert collector.data_writer.before_commit is None and collector.pending_domains is None
+
+
+def test_batch_flushes_after_flush_seconds(collector, stored_domains):
+    now = [0.0]
+    collector.data_writer.clock = lambda: now[0]
+
+    with collector.batch(flush_rows=1000, flush_seconds=5):
+        collector.collect_data(["SPY"], "2020-01-01", "2020-01-10", "days")
+        now[0] = 6.0
+        collector.collect_data(["NVDA"], "2020-01-01", "2020-01-10", "days")
+
+        assert stored_domains(collector) == {(ticker, "days"): "/2020-01-01|2020-01-10" for ticker in ["SPY", "NVDA"]}
+
+        collector.collect_data(["AAPL"], "2020-01-01", "2020-01-10", "days")
+        assert ("AAPL", "days") not in stored_domains(collector)
+
+    assert collector.session.query(StockData).count() == 30
+
+
+def test_failed_batch_flush_writes_nothing(collector, stored_domains):
+    collector.collect_data(["SPY"], "2020-01-01", "2020-01-10", "days")
+
+    with pytest.raises(Exception):
+        with collector.batch():
+            collector.collect_data(["NVDA"], "2020-01-01", "2020-01-10", "days")
+            #a row of another table fails the flush
+            collector.data_writer.write(pd.DataFrame({"missing_column": [1]}))
+
+    assert stored_domains(collector) == {("SPY", "days"): "/2020-01-01|2020-01-10"}
+    assert collector.get_domain("NVDA", "days").is_null
+    assert collector.session.query(StockData).count() == 10
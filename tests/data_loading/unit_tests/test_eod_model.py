@@ -0,0 +1,91 @@
+import pytest
+from sqlalchemy import create_engine, inspect
+
+from stock_pretraining.schemas.eod_model import EOD_Date_Model, Base, stock_data_partition_ddl, to_multirange, partition_dates
+
+
+def test_stock_data_index(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'stocks.db'}")
+    Base.metadata.create_all(engine)
+
+    indexes = inspect(engine).get_indexes("stock_data")
+    assert [(index["column_names"], index["unique"]) for index in indexes] == [(["ticker", "resample_freq", "stock_datetime"], 1)]
+
+
+def test_migrate_creates_missing_index(tmp_path):
+    url = f"sqlite:///{tmp_path / 'stocks.db'}"
+    engine = create_engine(url)
+    Base.metadata.create_all(engine, tables=[Base.metadata.tables["stock_data"]])
+
+    with engine.begin() as connection:
+        connection.exec_driver_sql("DROP INDEX uq_stock_data_natural_key")
+
+    EOD_Date_Model(url).migrate()
+    EOD_Date_Model(url).migrate()
+
+    assert [index["name"] for index in inspect(engine).get_indexes("stock_data")] == ["uq_stock_data_natural_key"]
+
+
+def test_migrate_removes_duplicates(tmp_path):
+    url = f"sqlite:///{tmp_path / 'stocks.db'}"
+    engine = create_engine(url)
+    Base.metadata.create_all(engine, tables=[Base.metadata.tables["stock_data"]])
+
+    with engine.begin() as connection:
+        connection.exec_driver_sql("DROP INDEX uq_stock_data_natural_key")
+        connection.exec_driver_sql("CREATE INDEX ix_stock_data_ticker_freq_datetime ON stock_data (ticker, resample_freq, stock_datetime)")
+        for i, close in enumerate([1.0, 2.0, 3.0]):
+            connection.exec_driver_sql(f"INSERT INTO stock_data (id, ticker, resample_freq, stock_datetime, stock_adj_close) VALUES ('{i}', 'SPY', 'days', '2020-01-0{1 + i // 2}', {close})")
+
+    EOD_Date_Model(url).migrate()
+
+    with engine.connect() as connection:
+        rows = connection.exec_driver_sql("SELECT stock_datetime, stock_adj_close FROM stock_data ORDER BY stock_datetime").all()
+
+    assert rows == [("2020-01-01", 2.0), ("2020-01-02", 3.0)]
+    assert [index["name"] for index in inspect(engine).get_indexes("stock_data")] == ["uq_stock_data_natural_key"]
+
+
+@pytest.mark.parametrize("partition_by, expected", [
+    ("ticker", ["stock_data_days_0", "stock_data_days_3"]),
+    ("year", ["stock_data_days_2020", "stock_data_days_2021", "stock_data_days_default"]),
+])
+def test_partition_ddl(partition_by, expected):
+    statements = stock_data_partition_ddl(partition_by, ticker_partitions=4, partition_years=[2020, 2021])
+
+    assert "PARTITION BY LIST (resample_freq)" in statements[0]
+    assert "PRIMARY KEY (id, resample_freq, " in statements[0]
+    assert statements[-1].startswith("CREATE UNIQUE INDEX uq_stock_data_natural_key ON stock_data")
+
+    for partition in expected + ["stock_data_months", "stock_data_years"]:
+        assert any(statement.startswith(f"CREATE TABLE {partition} ") for statement in statements)
+
+
+@pytest.mark.parametrize("partition_by", ["ticker", "year"])
+def test_partition_migration_creates_index_once(partition_by):
+    statements = EOD_Date_Model("sqlite://", partition_by=partition_by).partition_migration()
+    index_statements = [i for i, statement in enumerate(statements) if "INDEX uq_stock_data_natural_key" in statement]
+
+    #the index name is only free once the old stock_data is dropped
+    assert len(index_statements) == 1
+    assert index_statements[0] > statements.index("DROP TABLE stock_data")
+    assert statements[index_statements[0]].endswith("ON stock_data (ticker, resample_freq, stock_datetime)")
+
+
+def test_to_multirange():
+    assert to_multirange("/2023-01-01|2023-02-28/2023-03-11|2023-12-31") == "{[2023-01-01,2023-03-01),[2023-03-11,2024-01-01)}"
+    assert to_multirange(None) == "{}"
+
+
+def test_domain_ranges_require_postgres(tmp_path):
+    url = f"sqlite:///{tmp_path / 'stocks.db'}"
+
+    with pytest.raises(AssertionError, match="PostgreSQL"):
+        EOD_Date_Model(url, domain_ranges=True).migrate()
+
+
+def test_partition_dates():
+    assert partition_dates("FOR VALUES FROM ('2020-01-01') TO ('2021-01-01')") == ("2020-01-01", "2020-12-31")
+    assert partition_dates("FOR VALUES WITH (modulus 16, remainder 3)") == (None, None)
+    assert partition_dates("FOR VALUES IN ('months')") == (None, None)
+    assert partition_dates("DEFAULT") == (None, None)
@@ -0,0 +1,78 @@
+import pytest
+import numpy as np
+import pandas as pd
+
+from stock_pretraining.data_processing import FeatureStore, SequentialLoader
+from stock_pretraining.data_processing.sequential_loaders.feature_store import compute_features
+
+
+@pytest.fixture
+def collector(make_collector, fake_collector_class):
+    class WalkCollector(fake_collector_class):
+        def retrieve_data(self, ticker, start_date, end_date, resample_freq):
+            df = super().retrieve_data(ticker, start_date, end_date, resample_freq)
+            days = pd.to_datetime(df["stock_datetime"]).dt.day.to_numpy()
+
+            return df.assign(stock_adj_close=100.0 + np.sin(days) * 5 + len(ticker), stock_adj_volume=1000.0 + days ** 2)
+
+    return make_collector(WalkCollector)
+
+
+def test_compute_features():
+    rows = pd.DataFrame({
+        "ticker": ["NVDA"] * 3 + ["SPY"] * 4,
+        "stock_datetime": list(pd.date_range("2020-01-01", periods=3).date) + list(pd.date_range("2020-01-01", periods=4).date),
+        "stock_adj_close": [1.0, 2.0, 4.0, 1.0, 1.0, 2.0, 1.0],
+        "stock_adj_volume": [0.0, 1.0, 3.0, 1.0, 1.0, 1.0, 1.0],
+    })
+
+    features = compute_features(rows, [2])
+
+    assert np.allclose(features["log_return"], [np.nan, np.log(2), np.log(2), np.nan, 0.0, np.log(2), -np.log(2)], equal_nan=True)
+    assert np.allclose(features["log_volume"], np.log1p(rows["stock_adj_volume"]))
+    #windows never reach into the previous ticker, and constant windows have no z-score
+    assert np.allclose(features["return_zscore_2"], [np.nan, np.nan, np.nan, np.nan, np.nan, 1.0, -1.0], equal_nan=True)
+    assert np.isnan(features["volume_zscore_2"][3:]).all()
+
+
+def test_update_recomputes_only_the_tail(collector, tmp_path):
+    loader = SequentialLoader({"database_url": str(collector.engine.url)})
+    tickers = ["SPY", "NVDA"]
+
+    collector.collect_data(tickers, "2020-01-01", "2020-01-20", "days")
+    store = FeatureStore(tmp_path / "features", windows=[3, 5])
+    assert store.update(loader, tickers) == 40
+    assert store.update(loader, tickers) == 0
+
+    collector.collect_data(tickers, "2020-01-21", "2020-02-10", "days")
+    collector.collect_data(["AAPL"], "2020-01-01", "2020-01-10", "days")
+    assert store.update(loader, tickers + ["AAPL"]) == 2 * 21 + 10
+
+    rebuilt = FeatureStore(tmp_path / "rebuilt", windows=[3, 5])
+    rebuilt.update(loader, tickers + ["AAPL"])
+
+    incremental, full = store.read(tickers + ["AAPL"], "2020-01-01", "2020-02-10"), rebuilt.read(tickers + ["AAPL"], "2020-01-01", "2020-02-10")
+    assert len(incremental) == 2 * 41 + 10
+    pd.testing.assert_frame_equal(incremental, full)
+    assert store.load_domains().get(("SPY", "days")).string == "/2020-01-01|2020-02-10"
+
+    collector.delete_data(["NVDA"], "2020-01-01", "2020-02-10", "days")
+    assert store.update(loader, ["NVDA"]) == 0
+    assert len(store.read(["NVDA"], "2020-01-01", "2020-02-10")) == 0
+
+
+def test_loader_requests_features_by_name(collector, tmp_path):
+    collector.collect_data(["SPY"], "2020-01-01", "2020-01-20", "days")
+
+    FeatureStore(tmp_path / "features", windows=[5]).update(SequentialLoader({"database_url": str(collector.engine.url)}), ["SPY"])
+    loader = SequentialLoader({"database_url": str(collector.engine.url), "feature_path": tmp_path / "features", "feature_windows": [5]})
+
+    rows = loader.load_rows(["SPY"], "2020-01-03", "2020-01-10", columns=["stock_adj_close", "log_return", "return_zscore_5"])
+    assert rows.columns.tolist() == ["ticker", "resample_freq", "stock_datetime", "stock_adj_close", "log_return", "return_zscore_5"]
+    assert np.allclose(rows["log_return"], np.diff(np.log(100.0 + np.sin(np.arange(2, 11)) * 5 + 3)))
+
+    streamed = pd.concat(loader.stream_rows(["SPY"], "2020-01-03", "2020-01-10", columns=["log_volume"], chunk_rows=3), ignore_index=True)
+    assert np.allclose(streamed["log_volume"], np.log1p(1000.0 + np.arange(3, 11) ** 2))
+
+    with pytest.raises(AssertionError, match="feature_path"):
+        SequentialLoader({"database_url": str(collector.engine.url)}).load_rows(["SPY"], "2020-01-03", "2020-01-10", columns=["log_return"])
@@ -0,0 +1,97 @@
+import json
+import httpx
+
+from stock_pretraining.data_processing import TiingoCollector
+from stock_pretraining.data_processing.eod_collectors import Metrics, MetricsExporter
+from stock_pretraining.schemas.eod_model import Base
+
+
+def test_instrumentation_is_off_by_default(make_collector):
+    collector = make_collector()
+    collector.collect_data(["SPY"], "2020-01-01", "2020-01-10", "days")
+
+    assert collector.metrics is None
+    assert collector.data_writer.metrics is None
+
+
+def test_metrics_count_stages_of_collection(make_collector):
+    recorded = []
+    collector = make_collector(metrics=Metrics(hooks=[lambda name, amount: recorded.append(name)]))
+
+    collector.collect_data(["SPY", "NVDA"], "2020-01-01", "2020-01-10", "days")
+    collector.delete_data(["SPY"], "2020-01-01", "2020-01-05", "days")
+    totals = collector.metrics.snapshot()
+
+    assert totals["collect_data_calls"] == 1
+    assert totals["set_data_calls"] == 2
+    assert totals["delete_data_calls"] == 1
+    assert totals["rows_written"] == 20
+    assert totals["rows_deleted"] == 5
+    assert totals["write_calls"] == 3
+    assert totals["commit_calls"] >= 2
+    assert totals["domain_calls"] >= 3
+    assert all(totals[f"{stage}_seconds"] >= 0 for stage in ("collect_data", "set_data", "write", "commit", "domain"))
+
+    #hooks see every amount as it is recorded
+    assert recorded.count("rows_written") == 2
+
+
+def test_metrics_time_nested_stages_once():
+    metrics = Metrics(clock=iter(range(100)).__next__)
+
+    with metrics.time("collect_data"):
+        with metrics.time("collect_data"):
+            pass
+
+    assert metrics.snapshot() == {"collect_data_seconds": 1, "collect_data_calls": 1}
+
+
+def test_tiingo_metrics(tmp_path, tiingo_csv, chunked):
+    collector = TiingoCollector({"api_key": "test", "database_url": f"sqlite:///{tmp_path / 'stocks.db'}", "stream_responses": True, "metrics": True})
+    Base.metadata.create_all(collector.engine)
+
+    error = b'{"detail": "Error: Ticker not found"}'
+
+    def handler(request):
+        if "/NVDA/" in request.url.path:
+            return httpx.Response(404, headers={"content-type": "application/json"}, stream=httpx.ByteStream(error))
+
+        return httpx.Response(200, headers={"content-type": "text/csv"}, stream=httpx.ByteStream(b"".join(chunked(tiingo_csv))))
+
+    collector.client = httpx.Client(base_url="https://api.tiingo.com", transport=httpx.MockTransport(handler))
+
+    collector.collect_data(["SPY"], "2020-01-01", "2020-01-10", "days")
+    collector.retrieve_data("NVDA", "2020-01-01", "2020-01-10", "days")
+    totals = collector.metrics.snapshot()
+
+    assert totals["http_requests"] == 2
+    assert totals["http_errors"] == 1
+    assert totals["http_bytes"] == len(tiingo_csv.encode()) + len(error)
+    assert totals["rows_parsed"] == 2
+    assert totals["rows_written"] == 2
+    assert totals["http_seconds"] >= 0 and totals["parse_seconds"] >= 0
+
+
+def test_prometheus_exporter(tmp_path, make_collector):
+    path = tmp_path / "metrics" / "collector.prom"
+    collector = make_collector(metrics_path=str(path))
+
+    collector.collect_data(["SPY"], "2020-01-01", "2020-01-10", "days")
+    lines = path.read_text().splitlines()
+
+    assert "# TYPE stock_pretraining_collector_rows_written_total counter" in lines
+    assert "stock_pretraining_collector_rows_written_total 10" in lines
+    assert "stock_pretraining_collector_collect_data_calls_total 1" in lines
+
+
+def test_jsonl_exporter(tmp_path, make_collector):
+    path = tmp_path / "metrics.jsonl"
+    collector = make_collector(metrics_path=str(path), metrics_format="jsonl")
+
+    collector.collect_data(["SPY"], "2020-01-01", "2020-01-10", "days")
+    collector.collect_data(["NVDA"], "2020-01-01", "2020-01-05", "days")
+    snapshots = [json.loads(line) for line in path.read_text().splitlines()]
+
+    #one snapshot per outermost call, with running totals
+    assert [snapshot["metrics"]["rows_written"] for snapshot in snapshots] == [10, 15]
+    assert isinstance(collector.metrics.exporter, MetricsExporter)
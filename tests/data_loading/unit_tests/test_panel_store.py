@@ -0,0 +1,56 @@
+import pickle
+import pytest
+import numpy as np
+from datetime import date
+
+from stock_pretraining.data_processing import PanelStore, SequentialLoader
+
+
+@pytest.fixture
+def loader(make_collector):
+    collector = make_collector()
+
+    collector.collect_data(["SPY"], "2020-01-01", "2020-01-10", "days")
+    collector.collect_data(["NVDA"], "2020-01-03", "2020-01-06", "days")
+    collector.price = 2.0
+    collector.collect_data(["NVDA"], "2020-01-08", "2020-01-10", "days")
+
+    return SequentialLoader({"database_url": str(collector.engine.url)})
+
+
+def test_build(loader, tmp_path):
+    store = PanelStore.build(tmp_path / "panel", loader, ["SPY", "NVDA", "AAPL"], "2020-01-02", "2020-01-09", features=["stock_adj_close", "stock_adj_open"], chunk_tickers=2)
+
+    assert store.shape == (3, 8, 2)
+    assert store.dates == [date(2020, 1, day) for day in range(2, 10)]
+    assert store.values.dtype == np.float32
+
+    assert store.mask.tolist() == [
+        [True] * 8,
+        [False, True, True, True, True, False, True, True],
+        [False] * 8,
+    ]
+    assert store.values[1, store.mask[1], 0].tolist() == [1.0, 1.0, 1.0, 1.0, 2.0, 2.0]
+    assert np.isnan(store.values[~store.mask]).all()
+
+
+def test_store_reopens_memory_maps_after_pickling(loader, tmp_path):
+    store = PanelStore.build(tmp_path / "panel", loader, ["SPY"], "2020-01-01", "2020-01-10")
+    store.values
+
+    restored = pickle.loads(pickle.dumps(store))
+
+    assert restored._values is None
+    assert isinstance(restored.values, np.memmap)
+    assert np.array_equal(restored.mask, store.mask)
+
+
+def test_window_shares_memory(loader, tmp_path):
+    torch = pytest.importorskip("torch")
+    store = PanelStore.build(tmp_path / "panel", loader, ["SPY", "NVDA"], "2020-01-01", "2020-01-10")
+
+    values, mask = store.window("NVDA", 2, 4)
+
+    assert values.shape == (4, 5) and values.dtype == torch.float32
+    assert values.data_ptr() == store.values[1, 2:].ctypes.data
+    assert mask.tolist() == [True, True, True, True]
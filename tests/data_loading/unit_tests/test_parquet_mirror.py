@@ -0,0 +1,75 @@
+import pyarrow.parquet as pq
+from datetime import date
+
+from sqlalchemy import create_engine
+
+from stock_pretraining.data_processing import ParquetMirror, SequentialLoader
+
+
+def test_sync_exports_new_intervals(collector, tmp_path):
+    url = str(collector.engine.url)
+    mirror = ParquetMirror(tmp_path / "mirror")
+
+    collector.collect_data(["SPY", "NVDA"], "2020-12-25", "2021-01-05", "days")
+    assert mirror.sync(url) == 24
+
+    collector.collect_data(["SPY"], "2020-12-20", "2021-01-10", "days")
+    assert mirror.sync(url) == 10
+    assert mirror.sync(url) == 0
+
+    assert mirror.get_domain("SPY", "days").string == "/2020-12-20|2021-01-10"
+    assert sorted(path.relative_to(mirror.root).as_posix() for path in mirror.root.rglob("*.parquet")) == [
+        f"resample_freq=days/ticker={ticker}/year={year}/data.parquet" for ticker in ["NVDA", "SPY"] for year in [2020, 2021]
+    ]
+
+    rows = mirror.read(["SPY", "NVDA"], "2020-12-30", "2021-01-07", columns=["stock_adj_close"])
+    assert list(rows.columns) == ["ticker", "resample_freq", "stock_datetime", "stock_adj_close"]
+    assert (rows["ticker"] == "NVDA").sum() == 7
+    assert rows[rows["ticker"] == "SPY"]["stock_datetime"].tolist() == [date(2020, 12, 30 + i) if i < 2 else date(2021, 1, i - 1) for i in range(9)]
+
+
+def test_sync_removes_deleted_intervals(collector, tmp_path):
+    url = str(collector.engine.url)
+    mirror = ParquetMirror(tmp_path / "mirror")
+
+    collector.collect_data(["SPY", "NVDA"], "2020-01-01", "2020-01-10", "days")
+    mirror.sync(url)
+
+    collector.delete_data(["SPY"], "2020-01-04", "2020-01-10", "days")
+    collector.delete_data(["NVDA"], "2020-01-01", "2020-01-10", "days")
+    mirror.sync(url)
+
+    assert mirror.get_domain("SPY", "days").string == "/2020-01-01|2020-01-03"
+    assert mirror.get_domain("NVDA", "days").is_null
+    assert len(mirror.read(["SPY"], "2020-01-01", "2020-01-10")) == 3
+    assert len(mirror.read(["NVDA"], "2020-01-01", "2020-01-10")) == 0
+
+
+def test_row_groups(collector, tmp_path):
+    url = str(collector.engine.url)
+    collector.collect_data(["SPY"], "2020-01-01", "2020-12-31", "days")
+
+    mirror = ParquetMirror(tmp_path / "mirror")
+    mirror.sync(url)
+    assert pq.ParquetFile(next(mirror.root.rglob("*.parquet"))).num_row_groups == 1
+
+    small = ParquetMirror(tmp_path / "small", row_group_size=64)
+    small.sync(url)
+    assert pq.ParquetFile(next(small.root.rglob("*.parquet"))).num_row_groups == 6
+
+    rows = small.read(["SPY"], "2020-03-30", "2020-04-02")
+    assert rows["stock_datetime"].tolist() == [date(2020, 3, 30), date(2020, 3, 31), date(2020, 4, 1), date(2020, 4, 2)]
+
+
+def test_sequential_loader_reads_mirror(collector, tmp_path):
+    collector.collect_data(["SPY"], "2020-01-01", "2020-01-10", "days")
+    ParquetMirror(tmp_path / "mirror").sync(str(collector.engine.url))
+
+    from_database = SequentialLoader({"database_url": str(collector.engine.url)}).get_rows(["SPY"], "2020-01-03", "2020-01-06")
+    loader = SequentialLoader({"mirror_path": tmp_path / "mirror"})
+
+    assert not hasattr(loader, "engine")
+    from_mirror = loader.get_rows(["SPY"], "2020-01-03", "2020-01-06")
+
+    assert len(from_mirror) == 4
+    assert from_mirror.astype(str).equals(from_database.astype(str))
@@ -0,0 +1,49 @@
+import numpy as np
+
+from stock_pretraining.tokenization import ReservoirSample, bucketize
+
+
+def test_reservoir_sample_is_bounded():
+    sample = ReservoirSample(100, seed=0)
+
+    for start in range(0, 10_000, 1000):
+        batch = np.arange(start, start + 1000, dtype=np.float64).reshape(-1, 2)
+        batch[::3, 1] = np.nan
+        sample.add(batch)
+
+    assert [len(values) for values in sample.values] == [100, 100]
+    assert all(np.isfinite(values).all() for values in sample.values)
+
+
+def test_bucketize_edges():
+    rng = np.random.default_rng(0)
+    sample = ReservoirSample(10_000, seed=0)
+    sample.add(np.stack([rng.normal(size=5000), rng.exponential(size=5000)], axis=1))
+
+    edges, centers = sample.quantiles(8)
+    edges = edges.astype(np.float32)
+    assert edges.shape == (2, 7) and centers.shape == (2, 8)
+
+    #every edge, the closest values on either side of it, and values outside of every edge
+    below, above = np.nextafter(edges, np.float32(-np.inf)), np.nextafter(edges, np.float32(np.inf))
+    values = np.concatenate([edges, below, above, [[-np.inf], [-np.inf]], [[np.inf], [np.inf]], [[np.nan], [0.5]]], axis=1).T
+
+    #the reference counts the edges at or below each value, so a value on an edge belongs to the bin above it
+    expected = (edges[None, :, :] <= values[:, :, None]).sum(axis=2)
+    expected[np.isnan(values)] = 8
+
+    tokens = bucketize(values, edges, nan_token=8)
+    assert tokens.dtype == np.int64
+    assert (tokens == expected).all()
+
+    assert tokens[:7].tolist() == [[i + 1, i + 1] for i in range(7)]
+    assert tokens[7:14].tolist() == [[i, i] for i in range(7)]
+    assert tokens[14:21].tolist() == [[i + 1, i + 1] for i in range(7)]
+    assert tokens[21:].tolist() == [[0, 0], [7, 7], [8, expected[23, 1]]]
+
+
+def test_bucketize_keeps_leading_dimensions():
+    edges = np.array([[0.0, 1.0], [10.0, 20.0]])
+    values = np.array([[[-1.0, 10.0], [0.0, 15.0]], [[1.0, 20.0], [np.nan, 25.0]]])
+
+    assert bucketize(values, edges, nan_token=3).tolist() == [[[0, 1], [1, 1]], [[2, 2], [3, 2]]]
@@ -0,0 +1,78 @@
+import json
+import pytest
+
+from stock_pretraining.data_processing import Refresher
+from stock_pretraining.data_processing.eod_collectors import Metrics
+
+
+@pytest.fixture
+def collector(make_collector, fake_collector_class):
+    class FlakyCollector(fake_collector_class):
+        def __init__(self, config=None):
+            super().__init__(config)
+            self.failing = set()
+
+        def retrieve_data(self, ticker, start_date, end_date, resample_freq):
+            if ticker in self.failing:
+                return f"Failed to retrieve data for {ticker}"
+
+            return super().retrieve_data(ticker, start_date, end_date, resample_freq)
+
+    collector = make_collector(FlakyCollector)
+
+    collector.collect_data(["SPY", "NVDA"], "2020-01-01", "2020-01-10", "days")
+    collector.collect_data(["AAPL"], "2020-01-01", "2020-01-05", "days")
+    collector.collect_data(["MSFT"], "2020-01-01", "2020-01-20", "days")
+    collector.requests.clear()
+
+    return collector
+
+
+def test_refresh_collects_shared_tails(collector, stored_domains):
+    report = Refresher(collector, batch_size=1).run(["SPY", "NVDA", "AAPL", "MSFT", "TSLA"], "2020-01-20")
+
+    assert sorted(collector.requests) == [
+        ("AAPL", "2020-01-06", "2020-01-20"),
+        ("NVDA", "2020-01-11", "2020-01-20"),
+        ("SPY", "2020-01-11", "2020-01-20"),
+    ]
+    assert {ticker: domain for (ticker, _), domain in stored_domains(collector).items()} == {ticker: "/2020-01-01|2020-01-20" for ticker in ["SPY", "NVDA", "AAPL", "MSFT"]}
+    assert report["refreshed"] == 3 and report["up_to_date"] == 1
+    assert report["skipped"] == ["TSLA"] and report["failed"] == {}
+
+
+def test_refresh_new_tickers_from_start_date(collector):
+    Refresher(collector).run(["MSFT", "TSLA"], "2020-01-20", start_date="2020-01-15")
+
+    assert collector.requests == [("TSLA", "2020-01-15", "2020-01-20")]
+
+
+def test_refresh_resumes_from_checkpoint(collector, tmp_path):
+    checkpoint_path = tmp_path / "refresh.json"
+    collector.failing = {"AAPL"}
+
+    report = Refresher(collector, checkpoint_path=checkpoint_path).run(["SPY", "NVDA", "AAPL", "MSFT"], "2020-01-20")
+
+    assert list(report["failed"]) == ["AAPL"]
+    checkpoint = json.loads(checkpoint_path.read_text())
+    assert checkpoint["done"] == ["MSFT", "NVDA", "SPY"] and list(checkpoint["failed"]) == ["AAPL"]
+
+    collector.failing = set()
+    collector.requests.clear()
+    report = Refresher(collector, checkpoint_path=checkpoint_path).run(["SPY", "NVDA", "AAPL", "MSFT"], "2020-01-20")
+
+    #finished tickers are not even looked up again, the failed ticker is retried
+    assert collector.requests == [("AAPL", "2020-01-06", "2020-01-20")]
+    assert report["refreshed"] == 1 and report["up_to_date"] == 3 and report["failed"] == {}
+    assert json.loads(checkpoint_path.read_text())["failed"] == {}
+
+
+def test_refresh_reports_progress_through_metrics(collector, capsys):
+    collector.metrics = Metrics()
+    collector.failing.add("AAPL")
+
+    Refresher(collector, batch_size=1).run(["SPY", "NVDA", "AAPL", "MSFT"], "2020-01-20")
+
+    assert capsys.readouterr().out == ""
+    assert collector.metrics.snapshot()["tickers_refreshed"] == 2
+    assert collector.metrics.snapshot()["tickers_failed"] == 1
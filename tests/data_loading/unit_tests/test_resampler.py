@@ -0,0 +1,124 @@
+import pytest
+import pandas as pd
+from datetime import date
+
+from stock_pretraining.data_processing.eod_collectors.resampler import covering_periods, resample_bars, within_periods
+from stock_pretraining.schemas.eod_model import StockData
+
+
+@pytest.fixture
+def collector(make_collector):
+    return make_collector(derive_resampled=True)
+
+
+def stored_bars(collector, resample_freq):
+    rows = collector.session.query(StockData).filter(StockData.resample_freq == resample_freq).order_by(StockData.ticker, StockData.stock_datetime).all()
+    return [(row.ticker, str(row.stock_datetime), row.stock_adj_open, row.stock_adj_close, row.stock_adj_volume) for row in rows]
+
+
+def test_covering_periods():
+    periods = covering_periods([
+        ("SPY", "2020-01-15", "2020-02-03"),
+        ("SPY", "2020-02-10", "2020-02-12"),
+        ("SPY", "2020-05-02", "2020-05-02"),
+        ("NVDA", "2020-03-31", "2020-04-01"),
+    ], "months", last_date=date(2020, 5, 20))
+
+    assert periods.values.tolist() == [
+        ["NVDA", "2020-03-01", "2020-04-30"],
+        ["SPY", "2020-01-01", "2020-02-29"],
+        ["SPY", "2020-05-01", "2020-05-20"],
+    ]
+    assert covering_periods([("SPY", "2019-06-01", "2020-01-01")], "years").values.tolist() == [["SPY", "2019-01-01", "2020-12-31"]]
+
+
+def test_resample_bars():
+    rows = pd.DataFrame({
+        "ticker": ["SPY"] * 4 + ["NVDA"],
+        "stock_datetime": [date(2020, 2, 3), date(2020, 1, 31), date(2020, 1, 2), date(2020, 2, 28), date(2020, 1, 15)],
+        "stock_adj_open": [5.0, 4.0, 1.0, 6.0, 9.0],
+        "stock_adj_high": [5.0, 8.0, 2.0, 6.0, 9.0],
+        "stock_adj_low": [5.0, 3.0, 0.5, 6.0, 9.0],
+        "stock_adj_close": [5.0, 4.5, 1.5, 7.0, 9.0],
+        "stock_adj_volume": [10.0, 20.0, 30.0, 40.0, 50.0],
+    })
+
+    bars = resample_bars(rows, "months")
+
+    assert bars.columns.tolist() == ["ticker", "resample_freq", "stock_datetime", "stock_adj_open", "stock_adj_high", "stock_adj_low", "stock_adj_close", "stock_adj_volume"]
+    assert bars.drop(columns="resample_freq").values.tolist() == [
+        ["NVDA", date(2020, 1, 15), 9.0, 9.0, 9.0, 9.0, 50.0],
+        ["SPY", date(2020, 1, 31), 1.0, 8.0, 0.5, 4.5, 50.0],
+        ["SPY", date(2020, 2, 28), 5.0, 6.0, 5.0, 7.0, 50.0],
+    ]
+
+
+def test_within_periods():
+    rows = pd.DataFrame({
+        "ticker": ["SPY", "SPY", "SPY", "NVDA", "AAPL"],
+        "stock_datetime": [date(2019, 12, 31), date(2020, 1, 1), date(2020, 3, 1), date(2020, 2, 29), date(2020, 1, 2)],
+    })
+    periods = pd.DataFrame({"ticker": ["SPY", "SPY", "NVDA"], "start_date": ["2020-01-01", "2020-03-01", "2020-01-01"], "end_date": ["2020-01-31", "2020-03-31", "2020-01-31"]})
+
+    assert within_periods(rows, periods).values.tolist() == [["SPY", date(2020, 1, 1)], ["SPY", date(2020, 3, 1)]]
+
+
+def test_collect_months_from_days(collector, stored_domains):
+    collector.collect_data(["SPY"], "2020-01-01", "2020-01-31", "days")
+    collector.price = 2.0
+    collector.collect_data(["SPY"], "2020-02-01", "2020-02-29", "days")
+    collector.requests.clear()
+
+    collector.collect_data(["SPY", "NVDA"], "2020-01-10", "2020-02-10", "months")
+
+    #only the daily rows NVDA is missing are retrieved, nothing is requested at a months frequency
+    assert collector.requests == [("NVDA", "2020-01-01", "2020-02-29")]
+    assert stored_bars(collector, "months") == [
+        ("NVDA", "2020-01-31", 1.0, 2.0, 31.0),
+        ("NVDA", "2020-02-29", 1.0, 2.0, 29.0),
+        ("SPY", "2020-01-31", 1.0, 1.0, 31.0),
+        ("SPY", "2020-02-29", 1.0, 2.0, 29.0),
+    ]
+    assert stored_domains(collector)[("SPY", "months")] == "/2020-01-01|2020-02-29"
+
+    collector.requests.clear()
+    collector.collect_data(["SPY", "NVDA"], "2020-01-01", "2020-02-29", "months")
+    assert collector.requests == []
+    assert len(stored_bars(collector, "months")) == 4
+
+
+def test_derived_periods_follow_daily_changes(collector, stored_domains):
+    collector.collect_data(["SPY"], "2020-01-01", "2020-03-31", "years")
+    assert stored_bars(collector, "years") == [("SPY", "2020-12-31", 1.0, 1.0, 366.0)]
+
+    collector.price = 3.0
+    collector.set_data("SPY", "2020-12-01", "2020-12-31", "days", overwrite_existing=True)
+
+    #the overwritten days invalidate the year built from them
+    assert stored_bars(collector, "years") == []
+    assert ("SPY", "years") not in stored_domains(collector)
+
+    collector.requests.clear()
+    collector.collect_data(["SPY"], "2020-06-01", "2020-06-30", "years")
+
+    assert collector.requests == []
+    assert stored_bars(collector, "years") == [("SPY", "2020-12-31", 1.0, 3.0, 366.0)]
+
+
+def test_failed_derived_write_keeps_stored_periods(collector, stored_domains, monkeypatch):
+    collector.collect_data(["SPY", "NVDA"], "2020-01-01", "2020-01-31", "months")
+    stored = stored_bars(collector, "months")
+
+    def fail(df, connection):
+        raise RuntimeError("write failed")
+
+    monkeypatch.setattr(collector.data_writer, "insert", fail)
+    periods = pd.DataFrame({"ticker": ["SPY", "NVDA"], "start_date": ["2020-01-01", "2020-01-01"], "end_date": ["2020-02-29", "2020-01-31"]})
+
+    with pytest.raises(RuntimeError):
+        collector.write_derived(periods, "months")
+
+    #the stored bars are only deleted together with the write replacing them
+    assert stored_bars(collector, "months") == stored
+    assert stored_domains(collector)[("SPY", "months")] == "/2020-01-01|2020-01-31"
+    assert collector.get_domain("SPY", "months").string == "/2020-01-01|2020-01-31"
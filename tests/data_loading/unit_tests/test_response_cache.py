@@ -0,0 +1,81 @@
+import httpx
+import pytest
+import zlib
+from datetime import datetime
+
+from stock_pretraining.data_processing import TiingoCollector
+from stock_pretraining.data_processing.eod_collectors.response_cache import ResponseCache
+
+FETCH_TIME = datetime(2020, 1, 3, 12).timestamp()
+
+
+@pytest.fixture
+def cache(tmp_path):
+    now = [FETCH_TIME]
+    cache = ResponseCache(tmp_path / "cache", ttl=60, clock=lambda: now[0])
+    cache.now = now
+
+    return cache
+
+
+def test_historical_ranges_do_not_expire(cache, tiingo_csv):
+    cache.put("SPY", "2020-01-01", "2020-01-02", "days", tiingo_csv)
+    cache.now[0] += 10 ** 6
+
+    assert cache.get("SPY", "2020-01-01", "2020-01-02", "days") == tiingo_csv
+    assert cache.get("NVDA", "2020-01-01", "2020-01-02", "days") is None
+
+
+def test_ranges_touching_today_expire(cache, tiingo_csv):
+    cache.put("SPY", "2020-01-01", "2020-01-03", "days", tiingo_csv)
+
+    cache.now[0] += 30
+    assert cache.get("SPY", "2020-01-01", "2020-01-03", "days") == tiingo_csv
+
+    cache.now[0] += 60
+    assert cache.get("SPY", "2020-01-01", "2020-01-03", "days") is None
+
+
+def test_covered_daily_ranges(cache, tiingo_csv):
+    cache.put("SPY", "2019-12-01", "2020-01-05", "days", tiingo_csv)
+    cache.put("SPY", "2019-12-01", "2020-01-05", "months", tiingo_csv)
+
+    assert cache.get("SPY", "2020-01-03", "2020-01-03", "days").splitlines() == tiingo_csv.splitlines()[:1] + tiingo_csv.splitlines()[2:]
+    assert cache.get("SPY", "2019-12-15", "2020-01-05", "days") == tiingo_csv
+    assert cache.get("SPY", "2019-12-15", "2020-01-05", "months") is None
+    assert cache.get("SPY", "2019-12-15", "2020-01-06", "days") is None
+
+
+def test_lru_eviction(tmp_path, tiingo_csv):
+    now = [FETCH_TIME]
+    bodies = [tiingo_csv + f"2019-12-0{i + 1},1,1,1,1,1,1,1,1,1,1,0.0,1.0\n" for i in range(3)]
+    cache = ResponseCache(tmp_path / "cache", max_bytes=2 * len(zlib.compress(bodies[0].encode())), clock=lambda: now[0])
+
+    for ticker, body in zip(["SPY", "NVDA", "AAPL"], bodies):
+        now[0] += 1
+        cache.put(ticker, "2019-01-01", "2019-12-31", "days", body)
+
+        if ticker == "NVDA":
+            now[0] += 1
+            cache.get("SPY", "2019-01-01", "2019-12-31", "days")
+
+    assert [cache.get(ticker, "2019-01-01", "2019-12-31", "days") is not None for ticker in ["SPY", "NVDA", "AAPL"]] == [True, False, True]
+    assert len(list((tmp_path / "cache" / "bodies").rglob("*.zlib"))) == 2
+
+
+def test_retrieve_data_uses_cache(tmp_path, tiingo_csv):
+    requests = []
+
+    def handler(request):
+        requests.append(request.url.path)
+        return httpx.Response(200, text=tiingo_csv)
+
+    collector = TiingoCollector({"api_key": "test", "database_url": f"sqlite:///{tmp_path / 'stocks.db'}", "cache_dir": tmp_path / "cache"})
+    collector.client = httpx.Client(base_url="https://api.tiingo.com", transport=httpx.MockTransport(handler))
+
+    first = collector.retrieve_data("SPY", "2020-01-01", "2020-01-10", "days")
+    second = collector.retrieve_data("SPY", "2020-01-03", "2020-01-05", "days")
+
+    assert len(requests) == 1
+    assert len(first) == 2 and len(second) == 1
+    assert second["stock_adj_close"].tolist() == [305.93]
@@ -0,0 +1,62 @@
+import pytest
+from sqlalchemy import event
+
+from stock_pretraining.data_processing import ParquetMirror, SequentialLoader
+
+
+@pytest.fixture
+def database_url(make_collector):
+    collector = make_collector()
+    collector.collect_data(["SPY", "NVDA", "AAPL"], "2020-01-01", "2020-01-10", "days")
+
+    return str(collector.engine.url)
+
+
+@pytest.mark.parametrize("use_mirror", [False, True])
+def test_stream_rows_in_chunks(database_url, tmp_path, use_mirror):
+    if use_mirror:
+        ParquetMirror(tmp_path / "mirror").sync(database_url)
+        loader = SequentialLoader({"mirror_path": tmp_path / "mirror"})
+    else:
+        loader = SequentialLoader({"database_url": database_url})
+
+    chunks = list(loader.stream_rows(["SPY", "NVDA", "AAPL"], "2020-01-02", "2020-01-09", columns=["stock_adj_close"], chunk_rows=5))
+
+    assert max(len(chunk) for chunk in chunks) == 5
+    streamed = [(row.ticker, str(row.stock_datetime)) for chunk in chunks for row in chunk.itertuples()]
+    assert streamed == [(ticker, f"2020-01-0{day}") for ticker in ["AAPL", "NVDA", "SPY"] for day in range(2, 10)]
+
+
+def test_get_sequential(database_url):
+    torch = pytest.importorskip("torch")
+
+    dataset = SequentialLoader({"database_url": database_url}).get_sequential(["SPY", "NVDA"], "2020-01-01", "2020-01-10", sequence_length=3, chunk_rows=4)
+    sequences = list(dataset)
+
+    assert [(sequence["ticker"], sequence["start_date"]) for sequence in sequences] == [
+        (ticker, f"2020-01-0{day}") for ticker in ["NVDA", "SPY"] for day in (1, 4, 7)
+    ]
+    assert sequences[0]["values"].shape == (3, 5)
+    assert sequences[0]["values"].dtype == torch.float32
+
+
+def test_get_sequential_splits_sequences_at_gaps(make_collector):
+    torch = pytest.importorskip("torch")
+
+    collector = make_collector()
+    collector.collect_data(["SPY"], "2020-01-01", "2020-01-05", "days")
+    collector.collect_data(["SPY"], "2020-03-01", "2020-03-07", "days")
+
+    dataset = SequentialLoader({"database_url": str(collector.engine.url)}).get_sequential(["SPY"], "2020-01-01", "2020-03-31", sequence_length=3, chunk_rows=4)
+
+    #the two rows before the gap do not fill a sequence and are not joined to rows after it
+    assert [sequence["start_date"] for sequence in dataset] == ["2020-01-01", "2020-03-01", "2020-03-04"]
+
+
+def test_get_sequential_shards_tickers_across_workers(database_url):
+    torch = pytest.importorskip("torch")
+
+    dataset = SequentialLoader({"database_url": database_url}).get_sequential(["SPY", "NVDA", "AAPL"], "2020-01-01", "2020-01-10", sequence_length=10)
+    batches = list(torch.utils.data.DataLoader(dataset, batch_size=None, num_workers=2))
+
+    assert sorted(batch["ticker"] for batch in batches) == ["AAPL", "NVDA", "SPY"]
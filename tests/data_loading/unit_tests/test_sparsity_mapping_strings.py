@@ -1,4 +1,5 @@
 import pytest
+from datetime import datetime
 from stock_pretraining import SparsityMappingString
 
 
@@ -41,4 +42,67 @@ def test_sms():
 # ])
 # def test_update_domain_invalid(sparsity_mapping, start, stop, datestrformat, resample_freq):
 #     with pytest.raises(AssertionError, match=f"invalid resample_freq"):
-#         update_domain(sparsity_mapping=sparsity_mapping, start=start, stop=stop, datestrformat=datestrformat, resample_freq=resample_freq)
\ No newline at end of file
+#         update_domain(sparsity_mapping=sparsity_mapping, start=start, stop=stop, datestrformat=datestrformat, resample_freq=resample_freq)
+
+@pytest.mark.parametrize("domain, other, resample_freq, expected", [
+    ("/", "/2020-01-01|2021-01-01", "days", "/2020-01-01|2021-01-01"),
+    ("/2020-01-01|2021-01-01", "/", "days", "/2020-01-01|2021-01-01"),
+    ("/2020-01-01|2021-01-01", "/2020-01-01|2021-01-01", "days", "/2020-01-01|2021-01-01"),
+    ("/2020-01-01|2021-01-01", "/2019-12-31|2021-01-02", "days", "/2019-12-31|2021-01-02"),
+    ("/2020-01-01|2021-01-01", "/2021-01-02|2021-01-02", "days", "/2020-01-01|2021-01-02"),
+    ("/2020-01-01|2021-01-01", "/2021-01-03|2021-01-03", "days", "/2020-01-01|2021-01-01/2021-01-03|2021-01-03"),
+    ("/2020-01-01|2021-01-01/2021-01-03|2021-01-03", "/2021-01-02|2021-01-02", "days", "/2020-01-01|2021-01-03"),
+    ("/2020-01-01|2020-01-05/2020-02-01|2020-02-05/2020-03-01|2020-03-05", "/2020-01-04|2020-02-10", "days", "/2020-01-01|2020-02-10/2020-03-01|2020-03-05"),
+    ("/2020-01-01|2020-03-01", "/2020-04-01|2020-05-01", "months", "/2020-01-01|2020-05-01"),
+    ("/2020-01-01|2020-03-01", "/2020-05-01|2020-06-01", "months", "/2020-01-01|2020-03-01/2020-05-01|2020-06-01"),
+])
+def test_add(domain, other, resample_freq, expected):
+    result = SparsityMappingString(resample_freq, domain) + SparsityMappingString(resample_freq, other)
+    assert result.string == expected
+
+
+@pytest.mark.parametrize("domain, other, resample_freq, expected", [
+    ("/2020-01-01|2020-01-10", "/", "days", "/2020-01-01|2020-01-10"),
+    ("/2020-01-01|2020-01-10", "/2019-01-01|2021-01-01", "days", "/"),
+    ("/2020-01-01|2020-01-10", "/2020-01-11|2020-01-20", "days", "/2020-01-01|2020-01-10"),
+    ("/2020-01-01|2020-01-10", "/2020-01-05|2020-01-06", "days", "/2020-01-01|2020-01-04/2020-01-07|2020-01-10"),
+    ("/2020-01-01|2020-01-10", "/2019-12-01|2020-01-04", "days", "/2020-01-05|2020-01-10"),
+    ("/2020-01-01|2020-01-10", "/2020-01-08|2020-02-01", "days", "/2020-01-01|2020-01-07"),
+    ("/2020-01-01|2020-01-10/2020-02-01|2020-02-10", "/2020-01-03|2020-01-03/2020-01-09|2020-02-02/2020-02-10|2020-02-10", "days", "/2020-01-01|2020-01-02/2020-01-04|2020-01-08/2020-02-03|2020-02-09"),
+    ("/2020-01-01|2020-12-01", "/2020-03-01|2020-05-01", "months", "/2020-01-01|2020-02-01/2020-06-01|2020-12-01"),
+])
+def test_subtract(domain, other, resample_freq, expected):
+    result = SparsityMappingString(resample_freq, domain) - SparsityMappingString(resample_freq, other)
+    assert result.string == expected
+
+
+def test_get_intervals():
+    domain = SparsityMappingString("days", "/2020-01-01|2020-01-10/2020-02-01|2020-02-10")
+    assert domain.get_intervals() == [[datetime(2020, 1, 1), datetime(2020, 1, 10)], [datetime(2020, 2, 1), datetime(2020, 2, 10)]]
+    assert domain.get_str_intervals() == [["2020-01-01", "2020-01-10"], ["2020-02-01", "2020-02-10"]]
+
+
+def test_is_null():
+    assert SparsityMappingString("days").is_null
+    assert not SparsityMappingString("days", "/2020-01-01|2020-01-10").is_null
+    assert (SparsityMappingString("days", "/2020-01-01|2020-01-10") - SparsityMappingString("days", "/2020-01-01|2020-01-10")).is_null
+
+
+def test_interval_index():
+    domain = SparsityMappingString("days", "/2020-01-01|2020-01-10/2020-02-01|2020-02-10")
+    days = [datetime(2019, 12, 31), datetime(2020, 1, 1), datetime(2020, 1, 10), datetime(2020, 1, 11), datetime(2020, 2, 1), datetime(2020, 2, 10), datetime(2020, 2, 11)]
+
+    assert domain.interval_index([day.toordinal() for day in days]).tolist() == [-1, 0, 0, -1, 1, 1, -1]
+    assert SparsityMappingString("days").interval_index([days[0].toordinal()]).tolist() == [-1]
+
+
+def test_custom_format():
+    domain = SparsityMappingString("days", "/01.01.2020|10.01.2020", datetime_format="%d.%m.%Y")
+    result = domain + SparsityMappingString("days", "/11.01.2020|12.01.2020", datetime_format="%d.%m.%Y")
+    assert result.string == "/01.01.2020|12.01.2020"
+
+
+@pytest.mark.parametrize("string", ["", "2020-01-01|2020-01-02", "/2020-01-02|2020-01-01", "/2020-01-01|2020-01-05/2020-01-03|2020-01-10", "/2020-01-01"])
+def test_invalid(string):
+    with pytest.raises(ValueError, match="Improperly formatted"):
+        SparsityMappingString("days", string)
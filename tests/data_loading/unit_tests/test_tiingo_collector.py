@@ -0,0 +1,193 @@
+import pytest
+import asyncio
+import httpx
+import uuid
+from datetime import date
+
+from stock_pretraining.data_processing import TiingoCollector
+from stock_pretraining.data_processing.eod_collectors.rate_limiter import RateLimiter
+from stock_pretraining.data_processing.eod_collectors.arrow_csv import ROW_SCHEMA, read_batches
+from stock_pretraining.schemas.eod_model import Base, StockData
+
+
+@pytest.fixture
+def collector(tmp_path):
+    collector = TiingoCollector({
+        "api_key": "test",
+        "database_url": f"sqlite:///{tmp_path / 'stocks.db'}",
+        "max_concurrency": 4,
+        "hourly_request_limit": None,
+        "daily_request_limit": None,
+        "retry_backoff": 0,
+    })
+    Base.metadata.create_all(collector.engine)
+
+    collector.written = []
+    collector.write_data = lambda ticker, start_date, end_date, resample_freq, df: collector.written.append((ticker, start_date, end_date, len(df)))
+
+    return collector
+
+
+def test_collect_data_async(collector, tiingo_csv):
+    in_flight = [0, 0]
+    attempts = {}
+
+    async def handler(request):
+        ticker = request.url.path.split("/")[3]
+        attempts[ticker] = attempts.get(ticker, 0) + 1
+
+        in_flight[0] += 1
+        in_flight[1] = max(in_flight[1], in_flight[0])
+        await asyncio.sleep(0.01)
+        in_flight[0] -= 1
+
+        if ticker == "SPY" and attempts[ticker] == 1:
+            return httpx.Response(429)
+
+        if ticker == "NVDA" and attempts[ticker] == 1:
+            return httpx.Response(503)
+
+        return httpx.Response(200, text=tiingo_csv)
+
+    tickers = ["SPY", "NVDA"] + [f"T{i}" for i in range(10)]
+    client = collector.make_async_client(transport=httpx.MockTransport(handler))
+    asyncio.run(collector.collect_data_async(tickers, "2020-01-01", "2020-01-10", "days", client=client))
+
+    assert sorted(collector.written) == sorted((ticker, "2020-01-01", "2020-01-10", 2) for ticker in tickers)
+    assert attempts["SPY"] == 2 and attempts["NVDA"] == 2
+    assert in_flight[1] == 4
+
+
+def test_collect_data_async_reports_failures(collector, tiingo_csv):
+    collector.max_retries = 1
+
+    def handler(request):
+        if "/SPY/" in request.url.path:
+            return httpx.Response(500, text="Error")
+
+        return httpx.Response(200, text=tiingo_csv)
+
+    client = collector.make_async_client(transport=httpx.MockTransport(handler))
+
+    with pytest.raises(Exception, match="1 of 2 gaps failed"):
+        asyncio.run(collector.collect_data_async(["SPY", "NVDA"], "2020-01-01", "2020-01-10", "days", client=client))
+
+    assert collector.written == [("NVDA", "2020-01-01", "2020-01-10", 2)]
+
+
+@pytest.mark.parametrize("stream_responses", [False, True])
+def test_collect_data_async_header_only(collector, stream_responses, tiingo_csv):
+    collector.stream_responses = stream_responses
+    header = tiingo_csv.split("\n", 1)[0] + "\n"
+
+    client = collector.make_async_client(transport=httpx.MockTransport(lambda request: httpx.Response(200, headers={"content-type": "text/csv"}, text=header)))
+    asyncio.run(collector.collect_data_async(["SPY", "NVDA"], "2020-01-04", "2020-01-05", "days", client=client))
+
+    assert sorted(collector.written) == [("NVDA", "2020-01-04", "2020-01-05", 0), ("SPY", "2020-01-04", "2020-01-05", 0)]
+
+
+@pytest.mark.parametrize("stream_responses", [False, True])
+def test_retrieve_data_retries(collector, stream_responses, tiingo_csv, monkeypatch):
+    collector.stream_responses = stream_responses
+    collector.max_retries = 2
+    waits = []
+    monkeypatch.setattr("time.sleep", waits.append)
+
+    attempts = {}
+    def handler(request):
+        ticker = request.url.path.split("/")[3]
+        attempts[ticker] = attempts.get(ticker, 0) + 1
+
+        if ticker == "SPY" and attempts[ticker] == 1:
+            return httpx.Response(429, headers={"Retry-After": "7"}, json={"detail": "Error: rate limited"})
+
+        if ticker == "NVDA":
+            return httpx.Response(503, text="Error: unavailable")
+
+        if ticker == "AAPL":
+            return httpx.Response(404, json={"detail": "Error: Ticker 'AAPL' not found"})
+
+        return httpx.Response(200, headers={"content-type": "text/csv"}, text=tiingo_csv)
+
+    collector.client = httpx.Client(base_url="https://api.tiingo.com", transport=httpx.MockTransport(handler))
+
+    assert len(collector.retrieve_data("SPY", "2020-01-01", "2020-01-10", "days")) == 2
+    assert waits == [7]
+
+    assert "unavailable" in collector.retrieve_data("NVDA", "2020-01-01", "2020-01-10", "days")
+    assert "not found" in collector.retrieve_data("AAPL", "2020-01-01", "2020-01-10", "days")
+    assert attempts == {"SPY": 2, "NVDA": 3, "AAPL": 1}
+
+
+def test_rate_limiter():
+    now = [0.0]
+    waits = []
+
+    async def sleep(seconds):
+        waits.append(seconds)
+        now[0] += seconds
+
+    limiter = RateLimiter([(2, 10), (3, 100)], clock=lambda: now[0], sleep=sleep)
+
+    async def acquire(n):
+        for _ in range(n):
+            await limiter.acquire()
+
+    asyncio.run(acquire(4))
+
+    #the first two requests use the burst, the third waits for the hourly bucket, the fourth for the daily one
+    assert waits[0] == pytest.approx(5)
+    assert now[0] == pytest.approx(100 / 3)
+
+
+def test_retrieve_arrow(tmp_path, tiingo_csv, chunked):
+    collector = TiingoCollector({"api_key": "test", "database_url": f"sqlite:///{tmp_path / 'stocks.db'}", "stream_responses": True})
+    Base.metadata.create_all(collector.engine)
+
+    def handler(request):
+        if "/NVDA/" in request.url.path:
+            return httpx.Response(404, json={"detail": "Error: Ticker 'NVDA' not found"})
+
+        if "/AAPL/" in request.url.path:
+            return httpx.Response(200, text="Error: You have run over your hourly request allocation.")
+
+        if "/QQQ/" in request.url.path:
+            return httpx.Response(200, headers={"content-type": "text/csv"}, stream=httpx.ByteStream(tiingo_csv.split("\n", 1)[0].encode() + b"\n"))
+
+        return httpx.Response(200, headers={"content-type": "text/csv"}, stream=httpx.ByteStream(b"".join(chunked(tiingo_csv))))
+
+    collector.client = httpx.Client(base_url="https://api.tiingo.com", transport=httpx.MockTransport(handler))
+
+    table = collector.retrieve_data("SPY", "2020-01-01", "2020-01-10", "days")
+
+    assert table.schema == ROW_SCHEMA
+    assert table.column("stock_datetime").to_pylist() == [date(2020, 1, 2), date(2020, 1, 3)]
+    assert table.column("stock_adj_close").to_pylist() == [308.26, 305.93]
+    assert set(table.column("ticker").to_pylist()) == {"SPY"}
+    assert all(uuid.UUID(value).version == 4 for value in table.column("id").to_pylist())
+
+    assert "not found" in collector.retrieve_data("NVDA", "2020-01-01", "2020-01-10", "days")
+    assert "Unexpected CSV header" in collector.retrieve_data("AAPL", "2020-01-01", "2020-01-10", "days")
+
+    #a range without rows is only a header
+    empty = collector.retrieve_data("QQQ", "2020-01-04", "2020-01-05", "days")
+    assert empty.schema == ROW_SCHEMA and empty.num_rows == 0
+
+    #Arrow tables are written by the same writer as DataFrames
+    collector.collect_data(["SPY", "QQQ"], "2020-01-01", "2020-01-10", "days")
+    rows = collector.session.query(StockData).order_by(StockData.stock_datetime).all()
+    assert [(row.stock_datetime, row.ticker, row.stock_adj_open) for row in rows] == [(date(2020, 1, 2), "SPY", 307.00), (date(2020, 1, 3), "SPY", 304.73)]
+    assert collector.get_domain("QQQ", "days").string == "/2020-01-01|2020-01-10"
+
+
+def test_read_batches_streams_chunks(tiingo_csv, chunked):
+    body = chunked(tiingo_csv + tiingo_csv.split("\n", 1)[1] * 2000, size=64)
+    consumed = []
+
+    batches = read_batches((consumed.append(chunk) or chunk for chunk in body), "SPY", "days", block_size=4096)
+    first = next(batches)
+
+    #the reader only pulled the chunks the first blocks needed
+    assert 0 < first.num_rows < 4002
+    assert len(consumed) < len(body)
+    assert first.num_rows + sum(batch.num_rows for batch in batches) == 4002
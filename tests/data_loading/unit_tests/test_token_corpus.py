@@ -0,0 +1,69 @@
+import pickle
+import pytest
+import numpy as np
+
+from stock_pretraining.data_processing import TokenCorpus, TokenWindows, SequentialLoader
+
+
+class RoundingTokenizer():
+    columns = ["stock_adj_close", "stock_adj_open"]
+    vocab_size = 10
+
+    def fingerprint(self):
+        return "rounding"
+
+    def encode(self, values):
+        return np.clip(np.rint(values), 0, 9).astype(np.int64)
+
+
+@pytest.fixture
+def collector(make_collector):
+    collector = make_collector()
+
+    collector.collect_data(["SPY"], "2020-01-01", "2020-01-10", "days")
+    collector.collect_data(["NVDA"], "2020-01-03", "2020-01-06", "days")
+    collector.price = 2.0
+    collector.collect_data(["NVDA"], "2020-01-08", "2020-01-10", "days")
+
+    return collector
+
+
+def test_build_and_read_windows(collector, tmp_path):
+    loader = SequentialLoader({"database_url": str(collector.engine.url)})
+    corpus = TokenCorpus(tmp_path / "corpus")
+
+    assert corpus.update(loader, RoundingTokenizer(), ["SPY", "NVDA", "AAPL"]) == ["SPY", "NVDA"]
+    assert corpus.dtype == np.uint16
+    assert corpus.index["tickers"]["NVDA"]["bounds"] == [[0, 4], [4, 7]]
+
+    windows = TokenWindows(TokenCorpus(tmp_path / "corpus"), length=3)
+    assert len(windows) == 8 + 2 + 1
+    assert windows[len(windows) - 1].tolist() == [[2, 1]] * 3
+    assert windows[len(windows) - 1].dtype == np.int64
+
+    restored = pickle.loads(pickle.dumps(windows))
+    assert restored.corpus._shards == {}
+    assert np.array_equal(restored[0], windows[0])
+
+
+def test_update_rebuilds_changed_tickers(collector, tmp_path):
+    loader = SequentialLoader({"database_url": str(collector.engine.url)})
+    corpus = TokenCorpus(tmp_path / "corpus")
+    corpus.update(loader, RoundingTokenizer(), ["SPY", "NVDA"], shard_rows=16)
+    corpus.update(loader, RoundingTokenizer(), ["AAPL"], shard_rows=16)
+
+    assert corpus.tickers == []
+    assert not list((tmp_path / "corpus").glob("*.bin"))
+
+    corpus.update(loader, RoundingTokenizer(), ["SPY", "NVDA"], shard_rows=16)
+    files = sorted(path.name for path in (tmp_path / "corpus").glob("*.bin"))
+    assert corpus.update(loader, RoundingTokenizer(), ["SPY", "NVDA"], shard_rows=16) == []
+    assert sorted(path.name for path in (tmp_path / "corpus").glob("*.bin")) == files
+
+    collector.price = 3.0
+    collector.collect_data(["SPY"], "2020-01-11", "2020-01-12", "days")
+    assert corpus.update(loader, RoundingTokenizer(), ["SPY", "NVDA"], shard_rows=16) == ["SPY"]
+
+    assert corpus.rows("SPY", 0, 12)[:, 0].tolist() == [1] * 10 + [3] * 2
+    assert corpus.rows("NVDA", 0, 7)[:, 0].tolist() == [1] * 4 + [2] * 3
+    assert (tmp_path / "corpus" / f"shard_{corpus.index['tickers']['SPY']['shard']:05d}.bin").stat().st_size == 12 * 2 * 2
@@ -0,0 +1,49 @@
+import pytest
+import numpy as np
+
+torch = pytest.importorskip("torch")
+
+from stock_pretraining.tokenization import Tokenizer
+from stock_pretraining.tokenization import bucketize
+
+
+def test_tokenize_batches():
+    rng = np.random.default_rng(0)
+    corpus = (rng.normal(size=(8, 64, 2)) * [1.0, 100.0] for _ in range(20))
+
+    tokenizer = Tokenizer({"n_bins": 4, "seed": 0}).fit(corpus)
+    assert tokenizer.edges.shape == (2, 3)
+
+    x = torch.tensor([[[-5.0, 500.0], [0.1, float("nan")]], [[5.0, -500.0], [-0.1, 1.0]]])
+    tokens = tokenizer(x)
+
+    assert tokens.dtype == torch.int64 and tokens.shape == x.shape
+    assert tokens.tolist() == [[[0, 3], [2, tokenizer.nan_token]], [[3, 0], [1, 2]]]
+    assert torch.isnan(tokenizer.decode(tokens)[0, 1, 1])
+
+    #bins are about equally frequent on the corpus
+    counts = torch.bincount(tokenizer(torch.from_numpy(rng.normal(size=(16, 256, 2)) * [1.0, 100.0])).reshape(-1))
+    assert (counts[:4].float() / counts[:4].sum() - 0.25).abs().max() < 0.02
+
+
+def test_save_and_load(tmp_path):
+    tokenizer = Tokenizer({"n_bins": 8}).fit([np.random.default_rng(0).normal(size=(1000, 3))])
+    tokenizer.save(tmp_path / "tokenizer.pt")
+
+    loaded = Tokenizer.load(tmp_path / "tokenizer.pt")
+    x = torch.randn(4, 16, 3)
+
+    assert loaded.n_bins == 8
+    assert torch.equal(loaded(x), tokenizer(x))
+
+
+def test_forward_matches_bucketize_at_edges():
+    tokenizer = Tokenizer({"n_bins": 8, "seed": 0}).fit([np.random.default_rng(0).normal(size=(1000, 3))])
+    edges = tokenizer.edges.numpy()
+
+    values = np.concatenate([edges, np.nextafter(edges, -np.inf), np.nextafter(edges, np.inf)], axis=1).T
+    values = np.concatenate([values, [[np.nan, -np.inf, np.inf]]]).astype(np.float32)
+
+    tokens = tokenizer(torch.from_numpy(values)).numpy()
+    assert (tokens == bucketize(values, edges, tokenizer.nan_token)).all()
+    assert (tokenizer.encode(values) == tokens).all()
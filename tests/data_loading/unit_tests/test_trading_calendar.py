@@ -0,0 +1,64 @@
+import pytest
+from datetime import date
+
+from stock_pretraining.data_processing import SparsityMappingString, DomainTable, TradingCalendar
+from stock_pretraining.data_processing.trading_calendar import nyse_holidays, get_calendar
+
+NYSE = TradingCalendar.nyse()
+
+
+def test_nyse_holidays():
+    assert nyse_holidays(2024) == [
+        date(2024, 1, 1), date(2024, 1, 15), date(2024, 2, 19), date(2024, 3, 29), date(2024, 5, 27),
+        date(2024, 6, 19), date(2024, 7, 4), date(2024, 9, 2), date(2024, 11, 28), date(2024, 12, 25),
+    ]
+    #New Year's Day on a Saturday is not observed, Christmas on a Saturday is observed on Friday
+    assert date(2021, 12, 31) not in nyse_holidays(2021) + nyse_holidays(2022)
+    assert date(2021, 12, 24) in nyse_holidays(2021)
+
+
+def test_step():
+    friday, monday, tuesday = date(2024, 1, 12).toordinal(), date(2024, 1, 15).toordinal(), date(2024, 1, 16).toordinal()
+
+    assert NYSE.step_ordinal(friday, 1) == tuesday
+    assert NYSE.step_ordinal(tuesday, -1) == friday
+    assert NYSE.step_ordinal(monday, 1) == tuesday
+    assert NYSE.step_ordinal(monday, -1) == friday
+    assert NYSE.ceil([monday]).tolist() == [tuesday]
+    assert NYSE.floor([monday]).tolist() == [friday]
+    assert NYSE.step_ordinal(date(2150, 1, 1).toordinal(), 1) == date(2150, 1, 2).toordinal()
+
+    assert get_calendar("NYSE") is NYSE
+    assert get_calendar(None) is None
+
+
+@pytest.mark.parametrize("calendar, expected", [
+    (None, "/2024-01-01|2024-01-05/2024-01-08|2024-01-12"),
+    (NYSE, "/2024-01-01|2024-01-12"),
+])
+def test_weekends_are_adjacent(calendar, expected):
+    domain_1 = SparsityMappingString("days", "/2024-01-01|2024-01-05", calendar=calendar)
+    domain_2 = SparsityMappingString("days", "/2024-01-08|2024-01-12", calendar=calendar)
+
+    assert (domain_1 + domain_2).string == expected
+
+
+def test_plan_skips_non_trading_days():
+    table = DomainTable.from_domains({("SPY", "days"): "/2024-01-02|2024-01-12", ("NVDA", "days"): "/2024-01-16|2024-01-19"}, calendar=NYSE)
+
+    #Jan 13 - 15 is a weekend followed by MLK day, and Jan 20 - 21 is a weekend
+    plan = [(ticker, start.date(), end.date()) for ticker, start, end in table.plan("2024-01-01", "2024-01-21")]
+    assert plan == [("SPY", date(2024, 1, 16), date(2024, 1, 19)), ("NVDA", date(2024, 1, 2), date(2024, 1, 12))]
+
+    assert table.plan("2024-01-13", "2024-01-15") == []
+
+
+def test_collector_does_not_request_weekends(make_collector):
+    collector = make_collector(trading_calendar="NYSE")
+
+    collector.collect_data(["SPY"], "2024-01-02", "2024-01-12", "days")
+    collector.collect_data(["SPY"], "2024-01-01", "2024-01-15", "days")
+    collector.collect_data(["SPY"], "2024-01-02", "2024-01-19", "days")
+
+    assert collector.requests == [("SPY", "2024-01-02", "2024-01-12"), ("SPY", "2024-01-16", "2024-01-19")]
+    assert collector.get_domain("SPY", "days").string == "/2024-01-02|2024-01-19"
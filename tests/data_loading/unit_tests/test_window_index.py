@@ -0,0 +1,46 @@
+import pytest
+from datetime import date, timedelta
+
+from stock_pretraining.data_processing import WindowIndex, PanelWindows, PanelStore, SequentialLoader
+
+DATES = [date(2020, 1, 1) + timedelta(days=i) for i in range(20)]
+
+
+def windows(index):
+    return [(index.tickers[ticker_id], start) for ticker_id, start in (index[i] for i in range(len(index)))]
+
+
+def test_windows_stay_inside_intervals():
+    index = WindowIndex(DATES, length=3, horizon=1, stride=2).update({
+        "SPY": "/2020-01-01|2020-01-06/2020-01-10|2020-01-12",
+        "NVDA": "/2020-01-15|2020-01-25",
+        "AAPL": "/",
+    })
+
+    assert windows(index) == [("SPY", 0), ("SPY", 2), ("NVDA", 14), ("NVDA", 16)]
+
+
+def test_update_only_replaces_changed_tickers():
+    index = WindowIndex(DATES, length=5).update({"SPY": "/2020-01-01|2020-01-05", "NVDA": "/2020-01-01|2020-01-06"})
+    assert windows(index) == [("SPY", 0), ("NVDA", 0), ("NVDA", 1)]
+
+    index.update({"SPY": "/2020-01-01|2020-01-07", "NVDA": "/2020-01-01|2020-01-06"})
+    assert windows(index) == [("SPY", 0), ("SPY", 1), ("SPY", 2), ("NVDA", 0), ("NVDA", 1)]
+
+    index.update({"NVDA": "/"})
+    assert windows(index) == [("SPY", 0), ("SPY", 1), ("SPY", 2)]
+
+
+def test_panel_windows(tmp_path, make_collector):
+    pytest.importorskip("torch")
+
+    collector = make_collector()
+    collector.collect_data(["SPY", "NVDA"], "2020-01-01", "2020-01-10", "days")
+
+    store = PanelStore.build(tmp_path / "panel", SequentialLoader({"database_url": str(collector.engine.url)}), ["SPY", "NVDA"], "2020-01-01", "2020-01-10")
+    dataset = PanelWindows(store, WindowIndex.from_store(store, length=4, horizon=1, stride=3))
+
+    assert len(dataset) == 4
+    values, mask = dataset[3]
+    assert values.shape == (5, 5)
+    assert bool(mask.all())